@@ -5,3 +5,7 @@ class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
 
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .passwords import preload_password_validators
+        preload_password_validators()
@@ -0,0 +1,101 @@
+"""
+JWT authentication without a ``User`` query per request.
+
+simplejwt's ``JWTAuthentication`` loads the full user row for every
+authenticated request. ``StatelessJWTAuthentication`` instead keeps a small
+per-process table of auth state (names, flags and the password fingerprint
+simplejwt's ``CHECK_REVOKE_TOKEN`` puts in each token) for
+``AUTH_USER_CACHE_TTL`` seconds, and hands views a ``TokenUser`` built from
+it. A request then costs no query at all; fields outside the cached state
+(email, dates...) are loaded in one query the first time a view reads them.
+
+Saving or deleting a user drops its entry in the current process. Other
+workers pick the change up once the entry expires, so a password change or
+deactivation takes at most the TTL to lock out tokens everywhere.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .models import TokenUser
+
+STATE_FIELDS = ['id', 'username', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser']
+
+UserState = namedtuple('UserState', [*STATE_FIELDS, 'password_hash'])
+
+
+def load_user_state(user_id):
+    """Read the auth state of ``user_id`` from the database, or ``None``"""
+    row = User.objects.filter(pk=user_id).values_list(*STATE_FIELDS, 'password').first()
+    if row is None:
+        return None
+    return UserState(*row[:-1], get_md5_hash_password(row[-1]))
+
+
+class UserStateCache:
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else settings.AUTH_USER_CACHE_TTL
+        self.max_entries = max_entries or settings.AUTH_USER_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        state = load_user_state(user_id)
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries = {}
+            self._entries[user_id] = (now + self.ttl, state)
+        return state
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+user_states = UserStateCache()
+
+
+def check_user_state(state, token):
+    """Raise ``AuthenticationFailed`` unless ``token`` is still good for ``state``"""
+    if state is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    if not state.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if token.get(api_settings.REVOKE_TOKEN_CLAIM) != state.password_hash:
+        raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+
+def token_user(state):
+    """A ``TokenUser`` carrying ``state``, with every other field deferred"""
+    # from_db() takes values in concrete field order
+    names = [field.attname for field in TokenUser._meta.concrete_fields if field.attname in STATE_FIELDS]
+    return TokenUser.from_db(router.db_for_read(User), names, [getattr(state, name) for name in names])
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` backed by the cached auth state"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        state = user_states.get(user_id)
+        check_user_state(state, validated_token)
+        return token_user(state)
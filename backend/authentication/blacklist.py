@@ -0,0 +1,295 @@
+"""
+Refresh-token blacklist.
+
+simplejwt's ``token_blacklist`` app writes every refresh token it issues to an
+``OutstandingToken`` table that nothing ever trims. Here only revoked tokens
+are stored: those rotated away by ``/token/refresh/`` or handed to
+``/logout/``. Rows are keyed by ``jti`` and dropped once
+``REFRESH_TOKEN_LIFETIME`` has passed, because by then the token has expired
+anyway.
+
+Each worker keeps a Bloom filter of the blacklisted ids. A token the filter
+has never seen is accepted without touching the table. A hit is confirmed
+with a primary-key lookup, so a false positive costs one query and never
+rejects a good token. Neither path depends on how many tokens exist.
+
+Building a filter reads every live row, seconds for a million of them, so
+it runs on a background thread (``TOKEN_BLACKLIST_BACKGROUND_BUILD``) while
+checks carry on: against the previous filter when it is only due for a
+rebuild, or with a primary-key lookup in a cold worker. The new filter is
+swapped in when it is ready.
+
+The filter picks up tokens revoked by other workers by reading the rows added
+since its last sync. With a shared cache (memcached, Redis...) it only reads
+them after the blacklist version in the cache changes. The per-process
+local-memory cache can't signal changes made by other workers, so there it
+reads them on every check, as one indexed range scan that is normally empty,
+or at most every ``TOKEN_BLACKLIST_LOCAL_SYNC_INTERVAL`` seconds when that
+is set. The query runs outside the lock: concurrent checks only wait for the
+new rows to be merged into the filter.
+
+Blacklisting is an INSERT on the primary key, so two concurrent refreshes of
+the same token can't both succeed.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, connections, transaction
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from .models import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'auth:token-blacklist:version'
+
+# Rows are stamped with the database clock when inserted, so one committed by
+# another worker can only be older than the newest row this worker has seen
+# by its commit lag; each sync re-reads that much history.
+SYNC_OVERLAP = timedelta(seconds=1)
+
+
+def expiry_cutoff(now=None):
+    """Tokens blacklisted before this have expired since"""
+    return (now or timezone.now()) - api_settings.REFRESH_TOKEN_LIFETIME
+
+
+def purge_expired():
+    """Delete blacklist rows for expired tokens; returns how many"""
+    deleted, _ = BlacklistedToken.objects.filter(blacklisted_at__lt=expiry_cutoff()).delete()
+    return deleted
+
+
+def get_cache():
+    return caches[DEFAULT_CACHE_ALIAS]
+
+
+def get_blacklist_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY, time.time())
+    return version
+
+
+def _bump():
+    get_cache().set(VERSION_KEY, time.time(), None)
+
+
+def bump_blacklist_version():
+    """Make every worker read the new blacklist rows on its next check"""
+    _bump()
+    transaction.on_commit(_bump)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(first + i * step) % size for i in range(self.hashes)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TokenBlacklist:
+    def __init__(self, capacity=None, error_rate=None, purge_interval=None, background=None):
+        self.capacity = capacity or settings.TOKEN_BLACKLIST_BLOOM_CAPACITY
+        self.error_rate = error_rate or settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE
+        self.purge_interval = (
+            purge_interval if purge_interval is not None else settings.TOKEN_BLACKLIST_PURGE_INTERVAL
+        )
+        self._background = background
+        self._lock = threading.Lock()
+        self._filter = None
+        self._built_at = None
+        self._watermark = None
+        self._version = None
+        self._synced_at = None
+        self._purged_at = time.monotonic()
+        # Set while a new filter is being built; ids blacklisted here in the
+        # meantime, added to it when it is swapped in
+        self._building = None
+        self._builder = None
+
+    @property
+    def background(self):
+        return self._background if self._background is not None else settings.TOKEN_BLACKLIST_BACKGROUND_BUILD
+
+    def _shared_version(self):
+        # A local-memory cache only sees this process's bumps
+        return None if isinstance(get_cache(), LocMemCache) else get_blacklist_version()
+
+    def _load(self, bloom, since, fresh=False):
+        """Add rows blacklisted since ``since``; returns the newest timestamp"""
+        rows = BlacklistedToken.objects.filter(blacklisted_at__gte=since).values_list('jti', 'blacklisted_at')
+        newest = since
+        for jti, blacklisted_at in rows.iterator(chunk_size=10000):
+            # Overlapping syncs return rows the filter already holds
+            if fresh or jti not in bloom:
+                bloom.add(jti)
+            if blacklisted_at > newest:
+                newest = blacklisted_at
+        return newest
+
+    def _rebuild_due(self, now):
+        # Start over once the filter is full or everything in it has expired;
+        # purged ids would otherwise keep costing lookups
+        bloom = self._filter
+        return bloom is None or bloom.count >= bloom.capacity or self._built_at < expiry_cutoff(now)
+
+    def _sync_due(self, version, synced_at):
+        if version is not None:
+            return version != self._version
+        interval = settings.TOKEN_BLACKLIST_LOCAL_SYNC_INTERVAL
+        return not interval or synced_at is None or time.monotonic() - synced_at >= interval
+
+    def _sync(self):
+        """Read rows blacklisted since the last sync into the current filter"""
+        with self._lock:
+            bloom, watermark, synced_at = self._filter, self._watermark, self._synced_at
+        if bloom is None:
+            return
+        # The version is read before the rows, so a token blacklisted in
+        # between bumps it again and is picked up on the next check.
+        version = self._shared_version()
+        if not self._sync_due(version, synced_at):
+            return
+        started = time.monotonic()
+        rows = list(
+            BlacklistedToken.objects.filter(blacklisted_at__gte=watermark - SYNC_OVERLAP)
+            .values_list('jti', 'blacklisted_at')
+        )
+        with self._lock:
+            if self._filter is not bloom:
+                # Replaced by a newer build meanwhile
+                return
+            for jti, blacklisted_at in rows:
+                # Overlapping syncs return rows the filter already holds
+                if jti not in bloom:
+                    bloom.add(jti)
+                if blacklisted_at > self._watermark:
+                    self._watermark = blacklisted_at
+            self._version, self._synced_at = version, started
+
+    def build(self):
+        """Build a filter of every live row and swap it in.
+
+        A blacklist that outgrew the configured capacity gets a filter with
+        room to double.
+        """
+        now = timezone.now()
+        # Read first, as in _sync: a token blacklisted during the build bumps
+        # the version again and is read on the first check after the swap
+        version = self._shared_version()
+        live = BlacklistedToken.objects.filter(blacklisted_at__gte=expiry_cutoff(now)).count()
+        bloom = BloomFilter(max(self.capacity, 2 * live), self.error_rate)
+        watermark = self._load(bloom, expiry_cutoff(now), fresh=True)
+        with self._lock:
+            for jti in self._building or ():
+                bloom.add(jti)
+            self._filter, self._built_at = bloom, now
+            self._watermark, self._version = watermark, version
+            self._synced_at = None
+            self._building = None
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Failed to build the token blacklist filter')
+            with self._lock:
+                self._building = None
+        finally:
+            connections.close_all()
+
+    def _start_build(self):
+        with self._lock:
+            if self._building is not None:
+                return
+            self._building = []
+        if not self.background:
+            try:
+                self.build()
+            except Exception:
+                with self._lock:
+                    self._building = None
+                raise
+            return
+        self._builder = threading.Thread(target=self._build_in_background, name='token-blacklist', daemon=True)
+        self._builder.start()
+
+    def contains(self, jti):
+        """Whether the token with id ``jti`` has been blacklisted.
+
+        Until the first filter is built, every check is a primary-key lookup.
+        """
+        self._sync()
+        with self._lock:
+            # Building takes seconds for a large table, so it never runs here
+            rebuild = self._building is None and self._rebuild_due(timezone.now())
+            bloom = self._filter
+        if rebuild:
+            self._start_build()
+            bloom = self._filter
+        if bloom is not None and jti not in bloom:
+            return False
+        return BlacklistedToken.objects.filter(pk=jti).exists()
+
+    def add(self, jti):
+        """Blacklist ``jti``; returns ``False`` if it already was"""
+        try:
+            with transaction.atomic():
+                BlacklistedToken.objects.create(jti=jti, blacklisted_at=Now())
+        except IntegrityError:
+            return False
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._building is not None:
+                self._building.append(jti)
+        bump_blacklist_version()
+        self._purge_if_due()
+        return True
+
+    def _purge_if_due(self):
+        now = time.monotonic()
+        if now - self._purged_at >= self.purge_interval:
+            self._purged_at = now
+            purge_expired()
+
+    def clear(self):
+        """Forget the filter; the next check rebuilds it from the table"""
+        with self._lock:
+            self._filter = None
+
+
+token_blacklist = TokenBlacklist()
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from authentication.blacklist import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Deletes blacklisted refresh tokens that have expired since'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired blacklisted tokens'))
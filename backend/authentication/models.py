@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils import timezone
+
+
+class TokenUser(User):
+    """A ``User`` built from cached auth state instead of a query.
+
+    ``authentication.backends.StatelessJWTAuthentication`` fills in the id,
+    names and flags; every other field is deferred and the first access to
+    any of them loads them all with a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields)
+
+
+class BlacklistedToken(models.Model):
+    """A revoked refresh token, kept until it would have expired anyway.
+
+    See ``authentication.blacklist``.
+    """
+    jti = models.CharField(max_length=255, primary_key=True)
+    blacklisted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,91 @@
+"""
+A concurrency limit for password validation and hashing.
+
+Hashing is deliberately expensive (PBKDF2 runs hundreds of thousands of
+rounds), so a signup spike would otherwise run as many hashes at once as
+there are request threads, starving every other request of CPU.
+Registration hands validation and hashing to a small per-process pool. At
+most ``PASSWORD_WORKERS`` jobs run at once and ``PASSWORD_QUEUE_SIZE`` more
+may wait. Past that the request fails fast with a 503 and ``Retry-After``
+rather than queueing behind the others. hashlib's PBKDF2 and scrypt release
+the GIL, so pool threads hash in parallel on multi-core hosts.
+
+This limits how many hashes run, not how many request threads wait: the
+request thread blocks until its job is done, so up to
+``PASSWORD_WORKERS + PASSWORD_QUEUE_SIZE`` of them are tied up by sign-ups.
+Jobs run under the request's active language, so validator messages come
+out in the client's locale.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import get_default_password_validators, validate_password
+from django.utils import translation
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PasswordPoolBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many sign-ups at the moment, please try again shortly.')
+    default_code = 'password_pool_busy'
+    # Sent as Retry-After by DRF's exception handler
+    wait = 1
+
+
+class PasswordPool:
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or settings.PASSWORD_WORKERS
+        self.queue_size = queue_size if queue_size is not None else settings.PASSWORD_QUEUE_SIZE
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        # Started on first use, so servers that fork workers after import
+        # don't inherit a pool whose threads live in the parent
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password')
+            return self._executor
+
+    @staticmethod
+    def _call(language, func, *args):
+        with translation.override(language):
+            return func(*args)
+
+    def run(self, func, *args):
+        """Run ``func(*args)`` on the pool and wait for its result.
+
+        Raises ``PasswordPoolBusy`` when every worker and queue slot is taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._get_executor().submit(self._call, translation.get_language(), func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future.result()
+
+
+password_pool = PasswordPool()
+
+
+def prepare_password(password, user):
+    """Validate ``password`` for the unsaved ``user`` and return its hash"""
+    validate_password(password, user)
+    return make_password(password)
+
+
+def preload_password_validators():
+    """Build the validators now rather than on the first sign-up.
+
+    ``CommonPasswordValidator`` reads and decompresses its 20,000-entry list
+    when it's built.
+    """
+    get_default_password_validators()
@@ -1,10 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings
+from ecomdigital.serializers import ModelSerializer
+from .backends import check_user_state, load_user_state
+from .passwords import password_pool, prepare_password
+from .tokens import RefreshToken
 
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
-    password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
+class UserRegistrationSerializer(ModelSerializer):
+    password = serializers.CharField(write_only=True, required=True)
     password2 = serializers.CharField(write_only=True, required=True)
 
     class Meta:
@@ -14,23 +20,58 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     def validate(self, attrs):
         if attrs['password'] != attrs['password2']:
             raise serializers.ValidationError({"password": "Password fields didn't match."})
+        # Validation (against the new user's attributes too) and hashing run
+        # on the bounded password pool; see authentication/passwords.py
+        user = User(
+            username=User.normalize_username(attrs['username']),
+            email=User.objects.normalize_email(attrs.get('email', '')),
+            first_name=attrs.get('first_name', ''),
+            last_name=attrs.get('last_name', ''),
+        )
+        try:
+            user.password = password_pool.run(prepare_password, attrs['password'], user)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'password': list(error.messages)})
+        attrs['user'] = user
         return attrs
 
     def create(self, validated_data):
-        validated_data.pop('password2')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data.get('email', ''),
-            password=validated_data['password'],
-            first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', ''),
-        )
+        user = validated_data['user']
+        user.save()
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'date_joined')
         read_only_fields = ('id', 'date_joined')
 
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    """Refuses to refresh for deleted or inactive users and changed passwords.
+
+    Reads the user's row directly rather than the per-worker cache, since a
+    refresh is rare and mints a new access token. With rotation on, the
+    submitted token is blacklisted before the new pair is returned, so each
+    refresh token works once.
+    """
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        check_user_state(load_user_state(refresh.get(api_settings.USER_ID_CLAIM)), refresh)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+
+class TokenBlacklistSerializer(jwt_serializers.TokenBlacklistSerializer):
+    token_class = RefreshToken
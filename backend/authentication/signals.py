@@ -0,0 +1,20 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .backends import user_states
+from .models import TokenUser
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=TokenUser)
+@receiver(post_delete, sender=TokenUser)
+def invalidate_user_state(sender, instance, **kwargs):
+    # Password, flags and names are all part of the cached state. Drop it
+    # again on commit so a request that read the old row in between can't
+    # keep it cached.
+    user_states.invalidate(instance.pk)
+    transaction.on_commit(partial(user_states.invalidate, instance.pk))
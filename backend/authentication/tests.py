@@ -1,8 +1,24 @@
-from django.test import TestCase
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
+from django.utils import timezone, translation
 from django.urls import reverse
-from rest_framework.test import APIClient
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
+from rest_framework_simplejwt.settings import api_settings
+from ecomdigital.testing import QueryBudgetMixin
+from .backends import StatelessJWTAuthentication, user_states
+from .blacklist import BloomFilter, TokenBlacklist, token_blacklist
+from .models import BlacklistedToken
+from .passwords import PasswordPool, prepare_password
 
 
 class AuthenticationAPITest(TestCase):
@@ -124,3 +140,274 @@ class AuthenticationAPITest(TestCase):
         }, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('access', response.data)
+
+
+class StatelessJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        user_states.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='testuser', email='test@example.com', password='testpass123',
+            first_name='Test', last_name='User'
+        )
+        response = self.client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser', 'password': 'testpass123'
+        }, format='json')
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def refresh_tokens(self):
+        return APIClient().post(reverse('token_refresh'), {'refresh': self.refresh}, format='json')
+
+    def test_authenticated_requests_skip_user_query(self):
+        url = reverse('review-my-reviews')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_other_fields_load_in_one_query(self):
+        request = Request(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.access}'))
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, User)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.pk, user.username, user.get_full_name()), (self.user.pk, 'testuser', 'Test User'))
+            self.assertTrue(user.is_authenticated)
+            self.assertFalse(user.is_staff)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'test@example.com')
+            self.assertEqual(user.date_joined, self.user.date_joined)
+
+    def test_profile_endpoint(self):
+        response = self.client.get(reverse('get_user'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['email'], 'test@example.com')
+        response = self.client.put(reverse('update_user'), {'first_name': 'New'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('get_user')).data['first_name'], 'New')
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.email), ('New', 'test@example.com'))
+
+    def test_password_change_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_200_OK)
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_tokens().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_locks_out(self):
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_200_OK)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_tokens().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user(self):
+        self.user.delete()
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_tokens().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refreshed_token_authenticates(self):
+        response = self.refresh_tokens()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        response = self.client.get(reverse('get_user'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['username'], 'testuser')
+
+    def test_unsignalled_changes_apply_after_ttl(self):
+        # QuerySet.update() skips signals, like a change made by another worker
+        self.client.get(reverse('get_user'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_200_OK)
+        with mock.patch('authentication.backends.time.monotonic', return_value=time.monotonic() + 3600):
+            self.assertEqual(self.client.get(reverse('get_user')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(TOKEN_BLACKLIST_BACKGROUND_BUILD=False)
+class TokenBlacklistTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        token_blacklist.clear()
+        User.objects.create_user(username='testuser', password='testpass123')
+        response = self.client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser', 'password': 'testpass123'
+        }, format='json')
+        self.refresh = response.data['refresh']
+
+    def refresh_tokens(self, refresh):
+        return self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+
+    def test_rotated_refresh_token_works_once(self):
+        with self.assertQueryBudget('POST token_refresh'):
+            response = self.refresh_tokens(self.refresh)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_tokens(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.refresh_tokens(response.data['refresh']).status_code, status.HTTP_200_OK)
+
+    def test_logout_blacklists_refresh_token(self):
+        with self.assertQueryBudget('POST token_blacklist'):
+            response = self.client.post(reverse('token_blacklist'), {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.refresh_tokens(self.refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_issuing_tokens_stores_nothing(self):
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    def test_tokens_blacklisted_by_other_workers(self):
+        self.assertFalse(token_blacklist.contains('revoked'))
+        TokenBlacklist().add('revoked')
+        self.assertTrue(token_blacklist.contains('revoked'))
+
+    def test_unseen_token_skips_table_with_shared_cache(self):
+        with mock.patch.object(TokenBlacklist, '_shared_version', return_value=1):
+            token_blacklist.add('revoked')
+            self.assertTrue(token_blacklist.contains('revoked'))
+            with self.assertNumQueries(0):
+                self.assertFalse(token_blacklist.contains(uuid.uuid4().hex))
+
+    def test_sync_queries_outside_the_lock(self):
+        blacklist = TokenBlacklist(background=False)
+        blacklist.contains('unseen')
+        TokenBlacklist().add('revoked')
+        held = []
+
+        def record_lock(execute, sql, params, many, context):
+            held.append(blacklist._lock.locked())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_lock):
+            self.assertTrue(blacklist.contains('revoked'))
+        self.assertEqual(held, [False, False])
+
+    @override_settings(TOKEN_BLACKLIST_LOCAL_SYNC_INTERVAL=60)
+    def test_local_sync_interval(self):
+        blacklist = TokenBlacklist(background=False)
+        blacklist.contains('unseen')
+        self.assertFalse(blacklist.contains('unseen'))
+        with self.assertNumQueries(0):
+            self.assertFalse(blacklist.contains('unseen'))
+        with mock.patch('authentication.blacklist.time.monotonic', return_value=time.monotonic() + 61), \
+                self.assertNumQueries(1):
+            self.assertFalse(blacklist.contains('unseen'))
+
+    def test_background_build_keeps_checks_answering(self):
+        blacklist = TokenBlacklist(background=True)
+        blacklist.add('revoked')
+        loading, release = threading.Event(), threading.Event()
+        load = TokenBlacklist._load
+
+        def slow_load(self, bloom, since, fresh=False):
+            if fresh:
+                loading.set()
+                release.wait()
+            return load(self, bloom, since, fresh)
+
+        with mock.patch.object(TokenBlacklist, '_load', slow_load):
+            # Cold worker: primary-key lookups while the filter is built
+            with self.assertNumQueries(1):
+                self.assertFalse(blacklist.contains('unseen'))
+            loading.wait()
+            self.assertIsNone(blacklist._filter)
+            self.assertTrue(blacklist.contains('revoked'))
+            blacklist.add('during-build')
+            release.set()
+            blacklist._builder.join()
+        self.assertIsNotNone(blacklist._filter)
+        self.assertIn('during-build', blacklist._filter)
+        # The builder's connection can't see this test's uncommitted rows;
+        # with the local-memory cache every check reads the newer ones
+        self.assertTrue(blacklist.contains('revoked'))
+        self.assertFalse(blacklist.contains('unseen'))
+
+    def test_rebuild_keeps_serving_previous_filter(self):
+        blacklist = TokenBlacklist(background=False)
+        blacklist.add('revoked')
+        blacklist.contains('revoked')
+        # Everything in the filter has expired since it was built
+        blacklist._built_at -= api_settings.REFRESH_TOKEN_LIFETIME * 2
+        with mock.patch.object(TokenBlacklist, '_start_build') as start_build, \
+                mock.patch.object(TokenBlacklist, '_shared_version', return_value=1):
+            blacklist._version = 1
+            with self.assertNumQueries(0):
+                self.assertFalse(blacklist.contains(uuid.uuid4().hex))
+            self.assertTrue(blacklist.contains('revoked'))
+        start_build.assert_called()
+
+    def test_purge_deletes_expired_tokens(self):
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(jti='old'), BlacklistedToken(jti='new')])
+        expired = timezone.now() - api_settings.REFRESH_TOKEN_LIFETIME - timedelta(minutes=1)
+        BlacklistedToken.objects.filter(jti='old').update(blacklisted_at=expired)
+        call_command('purge_token_blacklist', stdout=mock.MagicMock())
+        self.assertEqual(list(BlacklistedToken.objects.values_list('jti', flat=True)), ['new'])
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        added = [uuid.uuid4().hex for _ in range(1000)]
+        for jti in added:
+            bloom.add(jti)
+        self.assertTrue(all(jti in bloom for jti in added))
+        false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class PasswordPoolTest(TestCase):
+    user_data = {
+        'username': 'testuser', 'email': 'Test@Example.com', 'first_name': 'Test', 'last_name': 'User',
+        'password': 'testpass123', 'password2': 'testpass123',
+    }
+
+    def register(self, **data):
+        return self.client.post(reverse('register'), {**self.user_data, **data}, format='json')
+
+    def test_registration_hashes_on_pool(self):
+        response = self.register()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(username='testuser')
+        self.assertEqual(user.email, 'Test@example.com')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_password_similar_to_user_attributes(self):
+        response = self.register(password='testuser1', password2='testuser1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.data)
+        self.assertFalse(User.objects.exists())
+
+    def test_validation_keeps_request_language(self):
+        pool = PasswordPool(workers=1, queue_size=0)
+        user = User(username='testuser')
+        with translation.override('de'), self.assertRaises(ValidationError) as raised:
+            pool.run(prepare_password, 'password', user)
+        self.assertIn('Dieses Passwort ist zu üblich.', raised.exception.messages)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    ])
+    def test_preferred_hasher(self):
+        self.assertEqual(self.register().status_code, status.HTTP_201_CREATED)
+        user = User.objects.get(username='testuser')
+        self.assertTrue(user.password.startswith('scrypt$'))
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_full_pool_sheds_load(self):
+        pool = PasswordPool(workers=1, queue_size=0)
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait()
+        busy = threading.Thread(target=pool.run, args=(hold,))
+        busy.start()
+        started.wait()
+        try:
+            with mock.patch('authentication.serializers.password_pool', pool):
+                response = self.register()
+        finally:
+            release.set()
+            busy.join()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(User.objects.exists())
+        with mock.patch('authentication.serializers.password_pool', pool):
+            self.assertEqual(self.register().status_code, status.HTTP_201_CREATED)
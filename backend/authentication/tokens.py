@@ -0,0 +1,26 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .blacklist import token_blacklist
+
+
+class RefreshToken(tokens.RefreshToken):
+    """``RefreshToken`` checked against ``authentication.blacklist``.
+
+    Stands in for the ``BlacklistMixin`` methods simplejwt only provides with
+    its ``token_blacklist`` app installed; nothing is stored when a token is
+    issued.
+    """
+
+    def verify(self):
+        super().verify()
+        self.check_blacklist()
+
+    def check_blacklist(self):
+        if token_blacklist.contains(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        if not token_blacklist.add(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
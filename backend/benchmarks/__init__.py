@@ -0,0 +1,6 @@
+"""
+Micro-benchmarks for backend hot paths.
+
+Run from the backend directory, e.g.:
+    python -m benchmarks.order_inserts
+"""
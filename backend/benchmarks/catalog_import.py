@@ -0,0 +1,93 @@
+"""
+Catalog import: one save per row vs the batched diffing importer.
+
+Generates a supplier feed of N products in 20 categories and loads it into a
+fresh database three times:
+
+- initial load: every product is new;
+- re-import: the same feed with 10% of prices and 1% of names changed;
+- full rewrite: every name and description changed.
+
+The per-row baseline does what the admin and ``seed_data`` do: a category
+``get_or_create`` and a product ``update_or_create`` per row, each sending
+the signals that invalidate the caches. The importer runs with the search
+index maintained row by row and, for the full rewrite, also with it rebuilt
+once at the end (``defer_index``).
+
+    python -m benchmarks.catalog_import [--products N] [--skip-per-row]
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.db import transaction  # noqa: E402
+from products.importer import import_catalog  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+
+
+def make_feed(count, rng):
+    return [
+        {
+            'slug': f'sku-{i}', 'name': f'Product {i}', 'description': f'Description of product {i}',
+            'price': f'{rng.randint(99, 19999) / 100:.2f}', 'stock': rng.randint(0, 1000),
+            'category': f'category-{i % 20}', 'category_name': f'Category {i % 20}',
+        }
+        for i in range(count)
+    ]
+
+
+def per_row(feed):
+    for row in feed:
+        with transaction.atomic():
+            category, _ = Category.objects.get_or_create(
+                slug=row['category'], defaults={'name': row['category_name']}
+            )
+            Product.objects.update_or_create(slug=row['slug'], defaults={
+                'name': row['name'], 'description': row['description'], 'price': row['price'],
+                'stock': row['stock'], 'category': category,
+            })
+
+
+def batched(feed, defer_index=False):
+    import_catalog(enumerate(feed, start=1), defer_index=defer_index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--skip-per-row', action='store_true', help='Only time the importer')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    initial = make_feed(args.products, rng)
+    reimport = [dict(row) for row in initial]
+    for row in rng.sample(reimport, len(reimport) // 10):
+        row['price'] = f'{float(row["price"]) + 1:.2f}'
+    for row in rng.sample(reimport, len(reimport) // 100):
+        row['name'] += ' v2'
+    rewrite = [
+        {**row, 'name': row['name'] + ' (2024)', 'description': row['description'] + ', revised'}
+        for row in reimport
+    ]
+
+    modes = [('importer', batched), ('importer, deferred index', lambda feed: batched(feed, True))]
+    if not args.skip_per_row:
+        modes.insert(0, ('per row', per_row))
+    rows = []
+    for mode, load in modes:
+        with test_database():
+            for label, feed in (('initial load', initial), ('re-import', reimport), ('full rewrite', rewrite)):
+                start = time.perf_counter()
+                load(feed)
+                elapsed = time.perf_counter() - start
+                rows.append((mode, label, f'{elapsed:.2f}', f'{len(feed) / elapsed:,.0f}'))
+
+    print_table(['mode', 'feed', 'seconds', 'rows/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    """Configure Django so benchmark modules can import models"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecomdigital.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Run the body against a freshly migrated throwaway database"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timeit(func, repeat=5):
+    """Return the median wall time of ``func`` in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def print_table(headers, rows):
+    widths = [
+        max(len(str(value)) for value in column)
+        for column in zip(headers, *rows)
+    ]
+    line = '  '.join(f'{{:>{width}}}' for width in widths)
+    print(line.format(*headers))
+    for row in rows:
+        print(line.format(*row))
@@ -0,0 +1,100 @@
+"""
+Product image derivatives: build throughput and bytes saved.
+
+Writes N synthetic photos (3000x2000 JPEG with noise, so they compress like
+real pictures) to a throwaway MEDIA_ROOT and attaches them to products, then
+runs the ``build_image_derivatives`` backfill:
+
+- in one process, with and without JPEG draft decoding (letting the decoder
+  scale down while it reads the file);
+- across worker processes, one per core.
+
+Then reports the average size of an original against each derivative.
+
+    python -m benchmarks.image_derivatives [--images N] [--workers N]
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.core.files.base import ContentFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from PIL import Image  # noqa: E402
+from products.images import DERIVED_DIR, FORMATS, SIZES, image_storage  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+
+
+def make_photo(seed):
+    noise = Image.effect_noise((3000, 2000), 40 + seed % 20).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((3000, 2000)).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def create_products(count):
+    category = Category.objects.create(name='Bench', slug='bench')
+    storage = image_storage()
+    names = [storage.save(f'products/photo-{i}.jpg', ContentFile(make_photo(i))) for i in range(count)]
+    Product.objects.bulk_create([
+        Product(name=f'Product {i}', slug=f'product-{i}', description='', price=1, category=category, image=name)
+        for i, name in enumerate(names)
+    ])
+
+
+def backfill(workers):
+    # Existing files are skipped by name, so start each run from none
+    shutil.rmtree(image_storage().path(DERIVED_DIR), ignore_errors=True)
+    start = time.perf_counter()
+    call_command('build_image_derivatives', workers=workers, force=True, stdout=open(os.devnull, 'w'))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    media_root = tempfile.mkdtemp()
+    try:
+        with override_settings(MEDIA_ROOT=media_root, IMAGE_WORKERS=0), test_database():
+            create_products(args.images)
+            runs = []
+            with mock.patch.object(Image.Image, 'draft', lambda self, mode, size: None):
+                runs.append(('1 process, full decode', backfill(1)))
+            runs.append(('1 process, draft decode', backfill(1)))
+            runs.append((f'{args.workers} processes, draft decode', backfill(args.workers)))
+            print_table(
+                ['backfill', 'seconds', 'images/s'],
+                [(label, f'{elapsed:.2f}', f'{args.images / elapsed:.1f}') for label, elapsed in runs],
+            )
+            print()
+
+            storage = image_storage()
+            products = list(Product.objects.all())
+            original = sum(storage.size(product.image.name) for product in products) / len(products)
+            rows = [('original', '3000x2000', f'{original / 1024:.0f}')]
+            for size in SIZES:
+                variant = products[0].image_variants[size]
+                for fmt in FORMATS:
+                    average = sum(
+                        storage.size(product.image_variants[size][fmt]) for product in products
+                    ) / len(products)
+                    rows.append((f'{size} {fmt}', f'{variant["width"]}x{variant["height"]}', f'{average / 1024:.1f}'))
+            print_table(['image', 'pixels', 'average KB'], rows)
+    finally:
+        shutil.rmtree(media_root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Encode time per response for DRF's stdlib JSONRenderer and the orjson-backed
+ecomdigital.renderers.JSONRenderer, over product, order and review payloads.
+
+Payloads are produced by the real serializers, then rendered repeatedly.
+Both renderers are checked to produce identical bytes.
+
+    python -m benchmarks.json_render [--repeat N]
+"""
+import argparse
+import time
+from decimal import Decimal
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework import renderers as drf_renderers  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from ecomdigital import renderers  # noqa: E402
+from orders.models import Order, OrderItem  # noqa: E402
+from orders.serializers import OrderSerializer  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+from products.serializers import ProductSerializer  # noqa: E402
+from reviews.models import Review  # noqa: E402
+from reviews.serializers import ReviewSerializer  # noqa: E402
+
+PAGE_SIZES = [1, 12, 100]
+
+
+def create_data(count):
+    category = Category.objects.create(name='Bench', slug='bench', description='Benchmark category')
+    products = Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', slug=f'product-{i}', description='Lorem ipsum dolor sit amet. ' * 10,
+            price=Decimal('9.99') + i, category=category, stock=100,
+            image=f'products/product-{i}.png', rating_count=3, rating_sum=13, rating_4_count=2, rating_5_count=1,
+        )
+        for i in range(count)
+    ])
+    users = User.objects.bulk_create([
+        User(username=f'user{i}', first_name='Bench', last_name=f'User {i}') for i in range(count)
+    ])
+    Review.objects.bulk_create([
+        Review(product=products[0], user=user, rating=4, title='Great value', comment='Works well. ' * 20)
+        for user in users
+    ])
+    orders = Order.objects.bulk_create([
+        Order(customer_name=f'Customer {i}', customer_email=f'c{i}@example.com', total_amount=Decimal('29.97'))
+        for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=products[line], product_name=products[line].name,
+                  product_price=products[line].price, quantity=1, subtotal=products[line].price)
+        for order in orders for line in range(3)
+    ])
+
+
+def payloads(count, context):
+    products = Product.objects.select_related('category')[:count]
+    orders = Order.objects.prefetch_related('items')[:count]
+    reviews = Review.objects.select_related('user', 'product')[:count]
+    return {
+        'products': ProductSerializer(products, many=True, context=context).data,
+        'orders': OrderSerializer(orders, many=True, context=context).data,
+        'reviews': ReviewSerializer(reviews, many=True, context=context).data,
+    }
+
+
+def per_call(render, data, repeat):
+    # Median over rounds of many calls, reported per response
+    calls = max(1, 2000 // max(len(data), 1))
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            render(data)
+        rounds.append((time.perf_counter() - start) / calls)
+    return sorted(rounds)[len(rounds) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stdlib = drf_renderers.JSONRenderer().render
+    fast = renderers.JSONRenderer().render
+    context = {'request': Request(APIRequestFactory().get('/api/'))}
+    backend = 'orjson' if renderers.orjson is not None else 'stdlib (orjson not installed)'
+
+    rows = []
+    with test_database():
+        create_data(max(PAGE_SIZES))
+        for count in PAGE_SIZES:
+            for name, data in payloads(count, context).items():
+                assert stdlib(data) == fast(data), name
+                before = per_call(stdlib, data, args.repeat)
+                after = per_call(fast, data, args.repeat)
+                rows.append((
+                    name, count, len(fast(data)),
+                    f'{before * 1e6:.0f}', f'{after * 1e6:.0f}', f'{before / after:.1f}x',
+                ))
+
+    print(f'Fast renderer backend: {backend}')
+    print_table(['payload', 'rows', 'bytes', 'stdlib us', 'fast us', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
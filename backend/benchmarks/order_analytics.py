@@ -0,0 +1,83 @@
+"""
+Order analytics from the full tables vs from the daily rollups.
+
+For each order history size, seeds a fresh database with that many orders
+spread over a year, then times two reports both ways: revenue per day and
+status over the last 30 days, and units and revenue per product name over
+the whole year. The rollup figures go through GET /api/orders/analytics/.
+
+    python -m benchmarks.order_analytics [--sizes 10000,100000] [--repeat N]
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.common import setup, test_database, timeit, print_table
+
+setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db.models import Count, Sum  # noqa: E402
+from django.db.models.functions import TruncDate  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from orders.models import DailyOrderRollup, DailyProductRollup, Order, OrderItem  # noqa: E402
+
+
+def daily_from_orders(start):
+    return list(
+        Order.objects.order_by().filter(created_at__gte=start).annotate(day=TruncDate('created_at'))
+        .values('day', 'status').annotate(orders=Count('id'), revenue=Sum('total_amount'))
+    )
+
+
+def products_from_items(start):
+    return list(
+        OrderItem.objects.order_by().filter(order__created_at__gte=start)
+        .values('product_name').annotate(units=Sum('quantity'), revenue=Sum('subtotal'))
+        .order_by('-revenue')[:100]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        with test_database():
+            call_command(
+                'seed_data', categories=20, products=2000, orders=size, days=365, verbosity=0,
+                stdout=open('/dev/null', 'w'),
+            )
+            client = APIClient()
+            client.force_authenticate(User.objects.create_user(username='finance', is_staff=True))
+            today = timezone.localdate()
+            month, year = today - timedelta(days=29), today - timedelta(days=364)
+
+            def rollup(**params):
+                response = client.get('/api/orders/analytics/', params)
+                assert response.status_code == 200, response.content
+
+            timings = [
+                timeit(lambda: daily_from_orders(timezone.now() - timedelta(days=30)), args.repeat),
+                timeit(lambda: rollup(start=month, end=today), args.repeat),
+                timeit(lambda: products_from_items(timezone.now() - timedelta(days=365)), args.repeat),
+                timeit(lambda: rollup(start=year, end=today, group='product'), args.repeat),
+            ]
+            rows.append((
+                size, DailyOrderRollup.objects.count() + DailyProductRollup.objects.count(),
+                *(f'{timing * 1e3:.1f}' for timing in timings),
+            ))
+
+    print_table(
+        ['orders', 'rollup rows', 'daily ms (scan)', 'daily ms (rollup)',
+         'products ms (scan)', 'products ms (rollup)'],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Order export memory: building the whole file in memory vs streaming it.
+
+For each order history size, seeds a fresh database with that many orders and
+exports them all as NDJSON twice: once by serializing every order with
+``OrderSerializer`` into one response body, the way a paginated-list export
+script or a naive view would, and once through GET /api/orders/export/,
+consuming the stream block by block. Reports the time taken and the peak
+Python memory (tracemalloc) of each.
+
+    python -m benchmarks.order_export [--sizes 10000,100000]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from ecomdigital.renderers import JSONRenderer  # noqa: E402
+from orders.models import Order  # noqa: E402
+from orders.serializers import OrderSerializer  # noqa: E402
+
+
+def in_memory():
+    orders = Order.objects.order_by('created_at', 'id').prefetch_related('items')
+    render = JSONRenderer().render
+    body = b'\n'.join(render(record) for record in OrderSerializer(orders, many=True).data)
+    return len(body)
+
+
+def streamed(client):
+    response = client.get('/api/orders/export/', {'format': 'ndjson'})
+    assert response.status_code == 200
+    return sum(len(block) for block in response.streaming_content)
+
+
+def measure(export):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = export()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000')
+    args = parser.parse_args()
+
+    rows = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        with test_database():
+            call_command(
+                'seed_data', categories=20, products=2000, orders=size, days=365, verbosity=0,
+                stdout=open('/dev/null', 'w'),
+            )
+            client = APIClient()
+            client.force_authenticate(User.objects.create_user(username='finance', is_staff=True))
+            # Streamed first, before the in-memory run leaves its objects around
+            for mode, export in (('streamed', lambda: streamed(client)), ('in memory', in_memory)):
+                length, elapsed, peak = measure(export)
+                rows.append((size, mode, f'{length / 2 ** 20:.1f}', f'{elapsed:.1f}', f'{peak / 2 ** 20:.1f}'))
+
+    print_table(['orders', 'mode', 'output MB', 'seconds', 'peak MB'], rows)
+
+
+if __name__ == '__main__':
+    main()
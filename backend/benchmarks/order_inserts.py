@@ -0,0 +1,102 @@
+"""
+Compare per-item and bulk order creation for carts of 10/100/1000 lines.
+
+The per-item path looks up each product and inserts each line separately;
+the bulk path is OrderCreateSerializer.create (one price lookup, one stock
+reservation, one items insert).
+
+    python -m benchmarks.order_inserts [--repeat N]
+"""
+import argparse
+from decimal import Decimal
+
+from benchmarks.common import setup, test_database, timeit, print_table
+
+setup()
+
+from orders.models import Order, OrderItem  # noqa: E402
+from orders.serializers import OrderCreateSerializer  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+
+CART_SIZES = [10, 100, 1000]
+
+
+def create_products(count):
+    category = Category.objects.create(name='Bench', slug='bench')
+    return Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', slug=f'product-{i}', description='Benchmark product',
+            price=Decimal('9.99'), category=category, stock=10 ** 9
+        )
+        for i in range(count)
+    ])
+
+
+def make_payload(products):
+    return {
+        'customer_name': 'Bench Customer',
+        'customer_email': 'bench@example.com',
+        'items': [
+            {
+                'product': product.pk,
+                'quantity': (i % 3) + 1,
+            }
+            for i, product in enumerate(products)
+        ],
+    }
+
+
+def per_item_create(validated_data):
+    """Naive path: one product lookup and one INSERT per line"""
+    data = dict(validated_data)
+    items_data = data.pop('items')
+    products = [Product.objects.get(pk=item_data['product']) for item_data in items_data]
+    total_amount = Decimal('0.00')
+    for product, item_data in zip(products, items_data):
+        total_amount += product.price * item_data['quantity']
+    order = Order.objects.create(total_amount=total_amount, **data)
+    for product, item_data in zip(products, items_data):
+        price = product.price
+        OrderItem.objects.create(
+            order=order,
+            product=product,
+            product_name=product.name,
+            product_price=price,
+            quantity=item_data['quantity'],
+            subtotal=price * item_data['quantity']
+        )
+    return order
+
+
+def bulk_create(validated_data):
+    # Includes the stock reservation UPDATE, which per_item_create skips
+    return OrderCreateSerializer().create(dict(validated_data, items=list(validated_data['items'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = []
+    with test_database():
+        products = create_products(max(CART_SIZES))
+        for lines in CART_SIZES:
+            serializer = OrderCreateSerializer(data=make_payload(products[:lines]))
+            serializer.is_valid(raise_exception=True)
+            validated = serializer.validated_data
+
+            per_item = timeit(lambda: per_item_create(validated), args.repeat)
+            bulk = timeit(lambda: bulk_create(validated), args.repeat)
+            rows.append((
+                lines,
+                f'{per_item * 1000:.2f}',
+                f'{bulk * 1000:.2f}',
+                f'{per_item / bulk:.1f}x',
+            ))
+
+    print_table(['lines', 'per-item ms', 'bulk ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare ProductSerializer and LeanProductSerializer over 1k/10k product rows.
+
+Each run includes the query and JSON rendering. Before timing, the two
+outputs are checked to be byte-identical.
+
+    python -m benchmarks.product_list [--repeat N]
+"""
+import argparse
+from decimal import Decimal
+
+from benchmarks.common import setup, test_database, timeit, print_table
+
+setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from products.lean import LeanProductSerializer, readable_fields  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+from products.serializers import ProductSerializer  # noqa: E402
+
+ROW_COUNTS = [1000, 10000]
+SPARSE_FIELDS = ('id', 'name', 'slug', 'price', 'image_url', 'average_rating')
+
+
+def create_products(count):
+    categories = Category.objects.bulk_create([
+        Category(name=f'Category {i}', slug=f'category-{i}', description='Benchmark category')
+        for i in range(20)
+    ])
+    Product.objects.bulk_create([
+        Product(
+            name=f'Product {i}', slug=f'product-{i}', description='Lorem ipsum dolor sit amet. ' * 20,
+            price=Decimal('9.99') + i, category=categories[i % 20], stock=100,
+            image=f'products/product-{i}.png' if i % 2 else '',
+            rating_count=i % 7, rating_sum=(i % 7) * 4, rating_4_count=i % 7,
+        )
+        for i in range(count)
+    ], batch_size=1000)
+
+
+def full(queryset, context):
+    return JSONRenderer().render(ProductSerializer(queryset, many=True, context=context).data)
+
+
+def lean(queryset, context, fields):
+    rows = LeanProductSerializer.values_queryset(queryset, fields)
+    return JSONRenderer().render(LeanProductSerializer(rows, fields=fields, context=context).data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    context = {'request': Request(APIRequestFactory().get('/api/products/'))}
+    all_fields = readable_fields()
+    rows = []
+    with test_database():
+        create_products(max(ROW_COUNTS))
+        base = Product.objects.filter(is_active=True).select_related('category').order_by('-id')
+        for count in ROW_COUNTS:
+            queryset = base[:count]
+            assert full(queryset, context) == lean(queryset, context, all_fields)
+
+            serializer = timeit(lambda: full(queryset, context), args.repeat)
+            values = timeit(lambda: lean(queryset, context, all_fields), args.repeat)
+            sparse = timeit(lambda: lean(queryset, context, SPARSE_FIELDS), args.repeat)
+            rows.append((
+                count,
+                f'{serializer * 1000:.1f}',
+                f'{values * 1000:.1f}',
+                f'{serializer / values:.1f}x',
+                f'{sparse * 1000:.1f}',
+            ))
+
+    print_table(['rows', 'serializer ms', 'lean ms', 'speedup', f'lean ?fields= ({len(SPARSE_FIELDS)}) ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Registrations per second per core for each supported password hasher.
+
+Runs POST /api/auth/register/ sequentially and reports wall-clock
+throughput, plus registrations per CPU-second of the whole process (pool
+threads included), which is the per-core figure. Hashing alone is timed
+separately, and so is building the common-password list that registration
+now loads at startup. Argon2 is skipped unless argon2-cffi is installed.
+Throttling is switched off for the run.
+
+    python -m benchmarks.registration [--requests N]
+"""
+import argparse
+import importlib.util
+import time
+from unittest import mock
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.password_validation import CommonPasswordValidator  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from authentication.views import register  # noqa: E402
+
+HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+
+
+def register_all(client, prefix, count):
+    for i in range(count):
+        response = client.post('/api/auth/register/', {
+            'username': f'{prefix}{i}', 'email': f'{prefix}{i}@example.com',
+            'password': 'Tr0ub4dor&3x', 'password2': 'Tr0ub4dor&3x',
+        }, content_type='application/json')
+        assert response.status_code == 201, response.content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=30)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    CommonPasswordValidator()
+    print(f'Common password list load: {(time.perf_counter() - start) * 1e3:.1f} ms (once per process)')
+
+    rows = []
+    with test_database(), mock.patch.object(register.cls, 'throttle_classes', []):
+        client = Client()
+        for name, hasher in HASHERS.items():
+            if name == 'argon2' and importlib.util.find_spec('argon2') is None:
+                rows.append((name, '-', '-', '-', 'argon2-cffi not installed'))
+                continue
+            with override_settings(PASSWORD_HASHERS=[hasher]):
+                start = time.perf_counter()
+                for _ in range(5):
+                    make_password('Tr0ub4dor&3x')
+                hash_ms = (time.perf_counter() - start) / 5 * 1e3
+
+                wall, cpu = time.perf_counter(), time.process_time()
+                register_all(client, name, args.requests)
+                wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            rows.append((
+                name, f'{hash_ms:.1f}', f'{args.requests / wall:.1f}', f'{args.requests / cpu:.1f}', '',
+            ))
+
+    print_table(['hasher', 'hash ms', 'reg/s', 'reg/s per core', 'note'], rows)
+
+
+if __name__ == '__main__':
+    main()
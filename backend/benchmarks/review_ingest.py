@@ -0,0 +1,98 @@
+"""
+Review posting throughput: one transaction per review vs write-behind batches.
+
+Posts N reviews from a number of concurrent client threads to
+POST /api/reviews/ and reports reviews committed per second, counting until
+the last review is in the table (for write-behind, until the queue has
+drained), along with the median response time and any errors such as
+"database is locked". Throttling is switched off for the run.
+
+    python -m benchmarks.review_ingest [--reviews N] [--threads 1,8,32]
+"""
+import argparse
+import statistics
+import threading
+import time
+from unittest import mock
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+from products.models import Category, Product  # noqa: E402
+from reviews.ingest import review_writer  # noqa: E402
+from reviews.models import Review  # noqa: E402
+from reviews.views import ReviewViewSet  # noqa: E402
+
+
+def create_fixtures(users, products):
+    category = Category.objects.create(name='Bench', slug='bench')
+    products = Product.objects.bulk_create([
+        Product(name=f'Product {i}', slug=f'product-{i}', description='Benchmark product',
+                price=9.99, category=category, stock=100)
+        for i in range(products)
+    ])
+    users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(users)])
+    return users, products
+
+
+def post_reviews(jobs, timings, errors):
+    client = APIClient()
+    for user, product in jobs:
+        client.force_authenticate(user=user)
+        start = time.perf_counter()
+        response = client.post('/api/reviews/', {
+            'product': product.pk, 'rating': user.pk % 5 + 1, 'title': 'Benchmark',
+            'comment': 'Posted by benchmarks.review_ingest',
+        }, format='json')
+        timings.append(time.perf_counter() - start)
+        if response.status_code not in (201, 202):
+            errors.append(response.status_code)
+    connection.close()
+
+
+def run(pairs, threads):
+    timings, errors = [], []
+    workers = [
+        threading.Thread(target=post_reviews, args=(pairs[i::threads], timings, errors))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    while Review.objects.count() < len(pairs) - len(errors):
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    return len(pairs) / elapsed, statistics.median(timings) * 1e3, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reviews', type=int, default=1000)
+    parser.add_argument('--threads', default='1,8,32')
+    args = parser.parse_args()
+    thread_counts = [int(count) for count in args.threads.split(',')]
+
+    rows = []
+    with test_database(), mock.patch.object(ReviewViewSet, 'throttle_classes', []):
+        users, products = create_fixtures(args.reviews // 10 + 1, 10)
+        pairs = [(user, product) for user in users for product in products][:args.reviews]
+        for threads in thread_counts:
+            for mode, write_behind in (('per review', False), ('write-behind', True)):
+                Review.objects.all().delete()
+                with override_settings(REVIEW_WRITE_BEHIND=write_behind):
+                    rate, latency, errors = run(pairs, threads)
+                rows.append((threads, mode, f'{rate:.0f}', f'{latency:.1f}', errors))
+        review_writer.flush()
+
+    print_table(['threads', 'mode', 'reviews/s', 'median ms', 'errors'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Refresh latency against a growing refresh-token blacklist.
+
+For each table size, fills the blacklist with that many unexpired rows, then
+reports the one-off Bloom filter build for a fresh worker, the first check
+in a cold worker (answered while the filter builds in the background), a
+blacklist check for a token that isn't listed, and a full POST /api/auth/token/refresh/
+(verify, blacklist the old token, mint a new pair).
+
+    python -m benchmarks.token_refresh [--sizes 0,100000,1000000] [--requests N]
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from benchmarks.common import setup, test_database, print_table
+
+setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework_simplejwt.settings import api_settings  # noqa: E402
+from authentication.blacklist import TokenBlacklist  # noqa: E402
+from authentication.models import BlacklistedToken  # noqa: E402
+from authentication.tokens import RefreshToken  # noqa: E402
+
+
+def fill(count, batch_size=20000):
+    # Raw INSERTs so the rows can be spread over the last few days like real
+    # traffic (the model sets blacklisted_at itself)
+    table = BlacklistedToken._meta.db_table
+    end = timezone.now() - timedelta(minutes=1)
+    span = api_settings.REFRESH_TOKEN_LIFETIME * 0.9
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            cursor.executemany(
+                f'INSERT INTO {table} (jti, blacklisted_at) VALUES (%s, %s)',
+                [(uuid.uuid4().hex, adapt(end - span * random.random())) for _ in range(size)],
+            )
+
+
+def median_us(func, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='0,100000,1000000')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    rows = []
+    with test_database():
+        user = User.objects.create_user(username='bench', password='benchpass123')
+        client = Client()
+        stored = 0
+        for size in sizes:
+            fill(size - stored)
+            stored = size
+
+            # A cold worker answers at once and builds in the background
+            cold = TokenBlacklist(background=True)
+            start = time.perf_counter()
+            cold.contains('warm-up')
+            cold_check = time.perf_counter() - start
+            cold._builder.join()
+
+            blacklist = TokenBlacklist(background=False)
+            start = time.perf_counter()
+            blacklist.build()
+            build = time.perf_counter() - start
+            check = median_us(lambda: blacklist.contains(uuid.uuid4().hex), args.requests)
+
+            tokens = [str(RefreshToken.for_user(user)) for _ in range(args.requests)]
+
+            def refresh():
+                response = client.post(
+                    '/api/auth/token/refresh/', {'refresh': tokens.pop()}, content_type='application/json'
+                )
+                assert response.status_code == 200, response.content
+
+            refresh_time = median_us(refresh, args.requests)
+            stored += args.requests
+            rows.append((size, f'{build * 1e3:.0f}', f'{cold_check * 1e6:.0f}', f'{check:.0f}', f'{refresh_time:.0f}'))
+
+    print_table(['blacklisted', 'filter build ms', 'cold check us', 'check us', 'refresh us'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class EcomDigitalConfig(AppConfig):
+    name = 'ecomdigital'
+
+    def ready(self):
+        from .db import configure_sqlite
+        from .instrumentation import install_query_hook
+        connection_created.connect(configure_sqlite, dispatch_uid='ecomdigital.db.configure_sqlite')
+        connection_created.connect(install_query_hook, dispatch_uid='ecomdigital.instrumentation.install_query_hook')
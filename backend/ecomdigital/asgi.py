@@ -0,0 +1,22 @@
+"""
+ASGI config for ecomdigital project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+ASYNC_VIEWS defaults to on here, so the catalog and review read endpoints
+are served by their async views (see ecomdigital/async_views.py) and run on
+the event loop; everything else runs in Django's worker threads as it does
+under WSGI.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecomdigital.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+application = get_asgi_application()
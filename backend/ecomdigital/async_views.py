@@ -0,0 +1,129 @@
+"""
+Async (ASGI) support for DRF viewsets.
+
+DRF 3.14 dispatches synchronously. ``AsyncViewSetMixin`` lets a viewset pair
+an action with an async twin named like Django's async ORM methods
+(``list``/``alist``, ``retrieve``/``aretrieve``). When ``settings.ASYNC_VIEWS``
+is on (``ecomdigital.asgi`` turns it on), routes whose actions all have a
+twin are exposed as async views: they run on the event loop and hand only
+their queries to the async ORM instead of holding a worker thread for the
+whole request. Under WSGI the sync actions are served as before, so neither
+deployment pays for an event loop or thread switch per request.
+
+``APIView.initial`` (content negotiation, authentication, permissions and
+throttles) runs in a worker thread, as the sync views do: the JWT user check
+and the SQLite throttle store are blocking calls that would otherwise stall
+the event loop. Authentication therefore behaves as under WSGI, and a bad
+token gets a ``401`` on public reads too.
+"""
+from inspect import isawaitable
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import viewsets
+from rest_framework.response import Response
+
+
+def async_action(viewset_class, action):
+    """The ``a<action>`` coroutine twin of ``action``, or ``None``"""
+    handler = getattr(viewset_class, f'a{action}', None)
+    return handler if iscoroutinefunction(handler) else None
+
+
+class AsyncViewSetMixin:
+    """Serve actions through their async twins when ``ASYNC_VIEWS`` is on"""
+
+    async_route = False
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        async_route = (
+            getattr(settings, 'ASYNC_VIEWS', False) and bool(actions)
+            and all(async_action(cls, action) for action in actions.values())
+        )
+        view = super().as_view(actions, **{**initkwargs, 'async_route': async_route})
+        if async_route:
+            markcoroutinefunction(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_route:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """``APIView.dispatch`` calling the async twin of the action"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            method = request.method.lower()
+            if self.action in self.action_map.values():
+                handler = getattr(self, f'a{self.action}')
+            elif method in self.http_method_names:
+                # OPTIONS and unmapped methods use the sync APIView handlers
+                handler = getattr(self, method, self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        if isinstance(self.response, Response):
+            # Render here so Django's handler doesn't hand the work to a
+            # worker thread; with orjson it's cheaper than the thread switch.
+            self.response.render()
+        return self.response
+
+    async def apaginate_queryset(self, queryset):
+        """Async ``paginate_queryset``; returns a list or ``None``"""
+        if self.paginator is None:
+            return None
+        paginate = getattr(self.paginator, 'apaginate_queryset', None)
+        if paginate is None:
+            return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+        return await paginate(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        """Async ``get_object`` over the filtered queryset"""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class AsyncListModelMixin:
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        rows = [obj async for obj in queryset]
+        return Response(self.get_serializer(rows, many=True).data)
+
+
+class AsyncRetrieveModelMixin:
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+
+class AsyncReadOnlyModelViewSet(AsyncViewSetMixin, AsyncRetrieveModelMixin,
+                                AsyncListModelMixin, viewsets.ReadOnlyModelViewSet):
+    """``ReadOnlyModelViewSet`` with async twins of ``list`` and ``retrieve``"""
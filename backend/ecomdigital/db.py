@@ -0,0 +1,39 @@
+"""
+Per-connection SQLite tuning.
+
+Most of SQLite's settings are pragmas that last only as long as the
+connection, so ``configure_sqlite`` runs ``SQLITE_PRAGMAS`` on every new one.
+``journal_mode=WAL`` is stored in the database file and the others are cheap,
+so with persistent connections (``CONN_MAX_AGE``) this costs a few
+statements per worker thread rather than per request.
+"""
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    """``SQLITE_PRAGMAS`` as ``PRAGMA`` statements"""
+    statements = []
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        name, value = str(name).strip().lower(), str(value).strip()
+        # Pragmas can't take bound parameters, so only plain words and numbers
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(value):
+            raise ValueError(f'Invalid SQLite pragma: {name}={value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """``connection_created`` receiver applying ``SQLITE_PRAGMAS``"""
+    if connection.vendor != 'sqlite':
+        return
+    statements = sqlite_pragmas()
+    if not statements:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -0,0 +1,249 @@
+"""
+Per-request query and latency instrumentation for the API.
+
+``InstrumentationMiddleware`` records, for every DRF view, the number of SQL
+queries, time spent in the database, time spent building response data in
+serializers (``serializer_timer``, entered by ``ecomdigital.serializers``),
+time spent encoding it (``render_timer``, entered by
+``ecomdigital.renderers.JSONRenderer``) and the total time. Each response gets a ``Server-Timing`` header and the
+numbers are folded into per-endpoint histograms readable at ``/api/metrics/``.
+Histograms live in process memory, so each worker reports its own traffic.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 25, 50, 100]
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'render_time', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        # Inside a timed serializer; nested ones are already counted
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in self.bounds] + ['inf']
+        return {'buckets': dict(zip(labels, self.counts)), 'sum': round(self.total, 3)}
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.over_budget = 0
+        self.total_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.db_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.serializer_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.render_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queries = Histogram(QUERY_BUCKETS)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'over_budget': self.over_budget,
+            'total_ms': self.total_ms.as_dict(),
+            'db_ms': self.db_ms.as_dict(),
+            'serializer_ms': self.serializer_ms.as_dict(),
+            'render_ms': self.render_ms.as_dict(),
+            'queries': self.queries.as_dict(),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, metrics, total, over_budget):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.count += 1
+            stats.over_budget += over_budget
+            stats.total_ms.add(total * 1000)
+            stats.db_ms.add(metrics.db_time * 1000)
+            stats.serializer_ms.add(metrics.serializer_time * 1000)
+            stats.render_ms.add(metrics.render_time * 1000)
+            stats.queries.add(metrics.queries)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    """``execute_wrapper`` on every connection, counting into the current request"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_hook(sender=None, connection=None, **kwargs):
+    """``connection_created`` receiver adding ``record_query`` to the connection.
+
+    Each thread has its own connection objects, and under ASGI the ORM runs
+    in worker threads, so the hook lives on every connection rather than on
+    the connections of the thread handling the request.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def serializer_timer():
+    """Add the time spent in the block to the current request's serializer time"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+@contextmanager
+def render_timer():
+    """Add the time spent in the block to the current request's render time"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.render_time += time.perf_counter() - start
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None or not issubclass(view_class, APIView):
+        return None
+    return f'{request.method} {match.view_name}'
+
+
+def get_query_budget(endpoint):
+    return getattr(settings, 'ENDPOINT_QUERY_BUDGETS', {}).get(endpoint)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI, stay async so async views keep running on the event loop
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        # Queries run in sync_to_async threads, which copy this context, so
+        # record_query finds the metrics whichever thread runs them
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        endpoint = endpoint_name(request)
+        if endpoint is None:
+            return response
+
+        budget = get_query_budget(endpoint)
+        over_budget = budget is not None and metrics.queries > budget
+        if over_budget:
+            logger.warning(
+                '%s ran %d queries (budget %d)', endpoint, metrics.queries, budget
+            )
+        registry.record(endpoint, metrics, total, over_budget)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries"',
+            f'serialize;dur={metrics.serializer_time * 1000:.2f}',
+            f'render;dur={metrics.render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        return response
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Per-endpoint histograms for this worker; DELETE resets them"""
+    if request.method == 'DELETE':
+        registry.reset()
+        return Response(status=204)
+    return Response(registry.snapshot())
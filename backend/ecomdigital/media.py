@@ -0,0 +1,223 @@
+"""
+Content-hashed media storage and a caching media view.
+
+``HashedMediaStorage`` stores every upload under a name that carries a hash
+of its bytes (``products/photo.3f9c0a1b2c3d.jpg``). A name therefore never
+refers to different content, and a second upload of the same bytes reuses
+the existing file. Only two name shapes count as hashed, and are stored as
+given: the ``.<12 hex digits>`` suffix this storage writes, and the image
+derivatives of ``products.images``. Any other upload is hashed, even when
+its name happens to contain hex digits (``1696500000000.jpg``).
+
+``serve_media`` serves ``MEDIA_ROOT`` under ``MEDIA_URL``:
+
+- hashed names get ``Cache-Control: public, max-age=31536000, immutable``,
+  so browsers reuse them without asking again; other names must revalidate;
+- ``ETag`` and ``Last-Modified`` come from the file's stat, and matching
+  conditional requests get a ``304``;
+- a single ``Range`` (and ``If-Range``) gets a ``206``, or a ``416`` when it
+  starts past the end;
+- whole files go out as a ``FileResponse``, which WSGI servers with a
+  ``wsgi.file_wrapper`` (gunicorn) send with ``sendfile()``;
+- with ``MEDIA_ACCEL`` set, the body is left to the front proxy through
+  ``X-Accel-Redirect`` (nginx) or ``X-Sendfile`` (Apache, lighttpd). The
+  proxy also answers ranges.
+"""
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+# Hex digits of the content hash put in stored names
+HASH_LENGTH = 12
+
+# The suffix HashedMediaStorage.hashed_name writes: "photo.3f9c0a1b2c3d.jpg"
+HASHED_NAME = re.compile(r'.+\.[0-9a-f]{12}(?:\.[^.]*)?')
+
+# products.images.derivative_name: "products/derived/<32 hex>-card.webp"
+DERIVED_NAME = re.compile(r'products/derived/[0-9a-f]{32}-[a-z]+\.[a-z]+')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bytes per read when streaming a range
+BLOCK_SIZE = 64 * 1024
+
+
+def is_hashed(name):
+    """Whether stored ``name`` carries a content hash, so its bytes never change"""
+    return bool(HASHED_NAME.fullmatch(posixpath.basename(name)) or DERIVED_NAME.fullmatch(name))
+
+
+class HashedMediaStorage(FileSystemStorage):
+    def hashed_name(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        root, extension = posixpath.splitext(filename)
+        suffix = f'.{digest.hexdigest()[:HASH_LENGTH]}{extension}'
+        if max_length is not None:
+            # Shorten the readable part, never the hash
+            room = max_length - len(suffix) - (len(directory) + 1 if directory else 0)
+            if room < 1:
+                raise SuspiciousFileOperation(f'Storage can not find an available filename for "{name}".')
+            root = root[:room]
+        return posixpath.join(directory, root + suffix)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not is_hashed(name):
+            name = self.hashed_name(name, content, max_length)
+            # Same name, same bytes
+            if self.exists(name):
+                return name
+        return super().save(name, content, max_length)
+
+
+class FileRange:
+    """Reads at most ``length`` bytes of ``file`` from ``start``.
+
+    Has no ``fileno()`` on purpose: servers must not ``sendfile()`` the rest
+    of the file.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive of a single byte range, ``None`` to send the
+    whole file, or ``False`` if the range can't be satisfied"""
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        # Malformed or multiple ranges: ignore the header
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    condition = request.META.get('HTTP_IF_RANGE')
+    if condition is None:
+        return True
+    if condition.startswith(('"', 'W/')):
+        return condition == etag
+    return parse_http_date_safe(condition) == last_modified
+
+
+def _set_headers(response, name, etag, last_modified):
+    response['Cache-Control'] = IMMUTABLE if is_hashed(name) else REVALIDATE
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _accel_response(path, fullpath, content_type, encoding):
+    # Empty: the proxy sends the body from the file
+    response = HttpResponse(content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Media file not found')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Media file not found')
+    size = stat_result.st_size
+    last_modified = int(stat_result.st_mtime)
+    etag = quote_etag(f'{stat_result.st_mtime_ns:x}-{size:x}')
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _set_headers(not_modified, path, etag, last_modified)
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    if settings.MEDIA_ACCEL:
+        return _set_headers(_accel_response(path, fullpath, content_type, encoding), path, etag, last_modified)
+
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return _set_headers(response, path, etag, last_modified)
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        reader = FileRange(file, start, end - start + 1)
+        response = StreamingHttpResponse(
+            iter(lambda: reader.read(BLOCK_SIZE), b''), status=206, content_type=content_type
+        )
+        response._resource_closers.append(reader.close)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _set_headers(response, path, etag, last_modified)
+
+
+def media_urlpatterns():
+    """The ``serve_media`` route under ``MEDIA_URL``, unless media lives on another host"""
+    prefix = settings.MEDIA_URL
+    if not prefix or urlsplit(prefix).netloc:
+        return []
+    return [re_path(rf'^{re.escape(prefix.lstrip("/"))}(?P<path>.+)$', serve_media, name='media')]
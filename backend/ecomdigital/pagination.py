@@ -0,0 +1,94 @@
+"""
+Pagination classes shared by the API viewsets.
+"""
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """Keyset pagination over ``-created_at`` with an ``id`` tie-breaker.
+
+    Each page is a ``created_at < position`` range scan on the composite
+    (created_at, id) index, so deep pages cost the same as the first one and
+    no ``COUNT(*)`` is issued. An ``?ordering=`` from the view's
+    ``OrderingFilter`` replaces ``created_at`` and gets the same tie-breaker,
+    so rows with equal values come in a stable order from page to page.
+
+    Querysets ordered by a computed value, such as search relevance, are
+    refused: the position can't be read back from such a value.
+    """
+    ordering = ('-created_at', '-id')
+    ranked_ordering_message = 'Cursor pagination needs an explicit ordering here; pass ?ordering= as well.'
+
+    def get_ordering(self, request, queryset, view):
+        annotations = queryset.query.annotations
+        if any(isinstance(term, str) and term.lstrip('-') in annotations for term in queryset.query.order_by):
+            raise ValidationError({'pagination': [self.ranked_ordering_message]})
+        ordering = super().get_ordering(request, queryset, view)
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering = (*ordering, '-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+
+class HybridPagination(PageNumberPagination):
+    """Page-number pagination that switches to cursor mode on request.
+
+    Clients opt in with ``?pagination=cursor`` (or by following a ``cursor``
+    link); the response then has ``next``/``previous`` links and no ``count``.
+    """
+    mode_query_param = 'pagination'
+    cursor_class = CreatedAtCursorPagination
+
+    def __init__(self):
+        self.delegate = None
+
+    def wants_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.wants_cursor(request):
+            self.delegate = self.cursor_class()
+            return self.delegate.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views.
+
+        Page-number mode runs its COUNT and page query through the async
+        ORM. Cursor mode runs in a worker thread.
+        """
+        if self.wants_cursor(request):
+            self.delegate = self.cursor_class()
+            return await sync_to_async(self.delegate.paginate_queryset)(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property; prime it so page() validates
+        # the number without a synchronous query.
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return list(self.page)
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.delegate is not None:
+            return self.delegate.to_html()
+        return super().to_html()
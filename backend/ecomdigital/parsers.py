@@ -0,0 +1,31 @@
+"""
+JSON parser backed by orjson when it is installed.
+
+Drop-in replacement for DRF's ``JSONParser``. orjson rejects ``NaN`` and
+``Infinity`` just like DRF's strict mode. Bodies orjson can't parse are
+handed to the stdlib parser, which either accepts them (integers wider than
+64 bits) or raises the usual ``ParseError``.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from rest_framework import parsers
+from .renderers import JSONRenderer, orjson
+
+UTF8_ENCODINGS = {'utf-8', 'utf8'}
+
+
+class JSONParser(parsers.JSONParser):
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower() not in UTF8_ENCODINGS:
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(BytesIO(body), media_type, parser_context)
@@ -0,0 +1,62 @@
+"""
+JSON renderer backed by orjson when it is installed.
+
+``JSONRenderer`` is a drop-in replacement for DRF's: compact separators,
+UTF-8 output, ``\\u2028``/``\\u2029`` escaped. Anything orjson doesn't
+handle natively (``Decimal``, datetimes, lazy strings, querysets...) is
+passed to DRF's ``JSONEncoder.default``, so those values come out exactly as
+they do today: decimals follow ``COERCE_DECIMAL_TO_STRING`` in the
+serializers and become numbers only when a raw ``Decimal`` reaches the
+renderer, and datetimes are ISO 8601 with ``Z`` for UTC.
+
+Without orjson, or for output orjson can't produce (``indent``, integers
+wider than 64 bits), rendering falls back to DRF's stdlib implementation.
+Two known differences remain: non-finite floats render as ``null`` instead
+of raising, and floats of 1e16 and above use ``1e16`` rather than
+``1e+16``. The API's serializers produce neither.
+"""
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+from . import instrumentation
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised by patching in tests
+    orjson = None
+
+_encoder = JSONEncoder()
+
+LINE_SEPARATOR_LEAD = b'\xe2'
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    options = 0
+    if orjson is not None:
+        # Datetimes go through DRF's encoder so "+00:00" becomes "Z" for
+        # every UTC offset, not just datetime.timezone.utc.
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with instrumentation.render_timer():
+            return self.render_json(data, accepted_media_type, renderer_context)
+
+    def render_json(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Both separators start with 0xE2; a single-byte memchr is far
+        # cheaper than two multi-byte searches over the whole response.
+        if LINE_SEPARATOR_LEAD in ret:
+            for raw, escaped in LINE_SEPARATORS:
+                ret = ret.replace(raw, escaped)
+        return ret
@@ -0,0 +1,25 @@
+"""
+Serializer base classes for the API.
+
+``to_representation`` of these classes runs under
+``instrumentation.serializer_timer``, so the ``serialize`` stage of
+``Server-Timing`` covers building response data, including the queries that
+related fields trigger along the way. Nested serializers are counted once, in
+the outermost one.
+"""
+from rest_framework import serializers
+from . import instrumentation
+
+
+class TimedRepresentationMixin:
+    def to_representation(self, instance):
+        with instrumentation.serializer_timer():
+            return super().to_representation(instance)
+
+
+class Serializer(TimedRepresentationMixin, serializers.Serializer):
+    pass
+
+
+class ModelSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    pass
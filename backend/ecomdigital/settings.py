@@ -4,6 +4,8 @@ Django settings for ecomdigital project.
 
 from pathlib import Path
 import os
+import tempfile
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,6 +35,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
+    'ecomdigital',
     'products',
     'orders',
     'authentication',
@@ -40,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ecomdigital.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -74,13 +78,97 @@ WSGI_APPLICATION = 'ecomdigital.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite tuning profile. "default" keeps SQLite's own settings and opens a
+# connection per request. "production" switches the database to WAL, so
+# readers never wait for the writer, syncs only at checkpoints, maps up to
+# 256MB of the file into memory, keeps a 64MB page cache per connection,
+# waits up to 5s for the write lock instead of failing with "database is
+# locked", and keeps connections open between requests. SQLITE_PRAGMAS
+# overrides single pragmas, e.g. "synchronous=FULL,cache_size=-16000". The
+# pragmas are applied to every new connection (see ecomdigital/db.py).
+SQLITE_PROFILE = config('SQLITE_PROFILE', default='default')
+_SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # Negative sizes are in KiB
+        'cache_size': -64 * 1024,
+        'busy_timeout': 5000,
+    },
+}
+SQLITE_PRAGMAS = {
+    **_SQLITE_PROFILES[SQLITE_PROFILE],
+    **dict(pragma.split('=', 1) for pragma in config('SQLITE_PRAGMAS', default='', cast=Csv())),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds a connection is reused for; 0 closes it after each request
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600 if SQLITE_PROFILE == 'production' else 0, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than the default in-memory database, so tests can
+        # open concurrent connections (see orders.tests.OrderStockConcurrencyTest)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+
+# Cache
+# Local memory by default; point CACHE_BACKEND/CACHE_LOCATION at e.g.
+# django.core.cache.backends.filebased.FileBasedCache or
+# django.core.cache.backends.redis.RedisCache to share across workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ecomdigital'),
     }
 }
 
+# Catalog response cache (see products/cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=600, cast=int)
+
+# Serve the async twins of the catalog and review read endpoints (see
+# ecomdigital/async_views.py). ecomdigital/asgi.py turns this on; under WSGI
+# the sync views avoid an event loop per request.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
+# Products kept in each worker's checkout price table (see products/prices.py).
+# Workers only hear about price changes through a shared cache, so with the
+# local-memory cache the table is off (0) and carts are priced from the
+# database.
+PRICE_TABLE_SIZE = config('PRICE_TABLE_SIZE', default=(
+    0 if CACHES['default']['BACKEND'].endswith('.LocMemCache') else 10000
+), cast=int)
+# Seconds before a price table entry is read from the database again
+PRICE_TABLE_TTL = config('PRICE_TABLE_TTL', default=300, cast=int)
+
+# Queue new reviews and commit them in batches from a background thread,
+# answering 202 with a submission id to poll (see reviews/ingest.py). A batch
+# holds up to REVIEW_BATCH_SIZE reviews, or those that arrive within
+# REVIEW_BATCH_INTERVAL seconds of the first; past REVIEW_QUEUE_SIZE queued
+# reviews, posting answers 503. A submission that hasn't been written after
+# REVIEW_WRITE_BEHIND_TIMEOUT seconds is reported as failed.
+REVIEW_WRITE_BEHIND = config('REVIEW_WRITE_BEHIND', default=False, cast=bool)
+REVIEW_BATCH_SIZE = config('REVIEW_BATCH_SIZE', default=200, cast=int)
+REVIEW_BATCH_INTERVAL = config('REVIEW_BATCH_INTERVAL', default=0.05, cast=float)
+REVIEW_QUEUE_SIZE = config('REVIEW_QUEUE_SIZE', default=5000, cast=int)
+REVIEW_WRITE_BEHIND_TIMEOUT = config('REVIEW_WRITE_BEHIND_TIMEOUT', default=60, cast=int)
+# A batch that fails is retried this many times, waiting 1s, 2s, 4s..., then
+# appended to REVIEW_DEAD_LETTER_PATH for replay_review_dead_letters
+REVIEW_WRITE_RETRIES = config('REVIEW_WRITE_RETRIES', default=4, cast=int)
+REVIEW_DEAD_LETTER_PATH = config('REVIEW_DEAD_LETTER_PATH', default=os.path.join(BASE_DIR, 'review-dead-letters.jsonl'))
+
+# Product image thumbnails are built after the upload commits on a
+# per-process pool of IMAGE_WORKERS threads (see products/images.py); 0
+# builds them in the saving thread instead.
+IMAGE_WORKERS = config('IMAGE_WORKERS', default=2, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -100,6 +188,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hasher for new password hashes: pbkdf2 (Django's default), scrypt, or
+# argon2 (needs `pip install argon2-cffi`). Hashes made by the others keep
+# verifying and are rehashed with the preferred one at the user's next login.
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHER],
+    *(hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
+# Registration validates and hashes passwords on a per-process pool of
+# PASSWORD_WORKERS threads; up to PASSWORD_QUEUE_SIZE more sign-ups wait for
+# a thread, and beyond that they get a 503 with Retry-After. The request
+# thread waits for its hash, so this caps concurrent hashes, not waiting
+# requests.
+PASSWORD_WORKERS = config('PASSWORD_WORKERS', default=os.cpu_count() or 1, cast=int)
+PASSWORD_QUEUE_SIZE = config('PASSWORD_QUEUE_SIZE', default=16, cast=int)
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -120,6 +232,20 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads are stored under content-hashed names, which ecomdigital.media
+# serves as immutable
+STORAGES = {
+    'default': {'BACKEND': 'ecomdigital.media.HashedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# How media is handed to the front proxy: '' streams it from Django,
+# 'x-accel-redirect' (nginx) redirects to MEDIA_ACCEL_PREFIX + path, which
+# must be an internal location aliased to MEDIA_ROOT, and 'x-sendfile'
+# (Apache mod_xsendfile, lighttpd) sends the file's absolute path.
+MEDIA_ACCEL = config('MEDIA_ACCEL', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/internal-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -127,17 +253,80 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'ecomdigital.pagination.HybridPagination',
     'PAGE_SIZE': 12,
+    # orjson-backed when installed, stdlib otherwise (see ecomdigital/renderers.py)
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'ecomdigital.renderers.JSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'ecomdigital.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.backends.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Reverse proxies in front of the app that append to X-Forwarded-For;
+    # anonymous clients are throttled by the address the outermost one saw.
+    # 0 uses REMOTE_ADDR, and must stay 0 without a proxy, or clients could
+    # pick their own address.
+    'NUM_PROXIES': config('NUM_PROXIES', default=0, cast=int),
+    # Token buckets per user (or IP when anonymous); see ecomdigital/throttling.py
+    'DEFAULT_THROTTLE_RATES': {
+        'login': config('THROTTLE_LOGIN_RATE', default='10/min'),
+        'register': config('THROTTLE_REGISTER_RATE', default='20/hour'),
+        'search': config('THROTTLE_SEARCH_RATE', default='60/min'),
+        'order': config('THROTTLE_ORDER_RATE', default='10/min'),
+        'review': config('THROTTLE_REVIEW_RATE', default='10/min'),
+    },
+}
+
+# Where throttle buckets live: a SQLite file shared by the workers on this
+# host, or the cache when it is shared between hosts (CACHE_BACKEND other
+# than local memory).
+THROTTLE_STORE = config('THROTTLE_STORE', default=(
+    'ecomdigital.throttling.SQLiteBucketStore'
+    if CACHES['default']['BACKEND'].endswith('.LocMemCache')
+    else 'ecomdigital.throttling.CacheBucketStore'
+))
+THROTTLE_DB_PATH = config('THROTTLE_DB_PATH', default=os.path.join(tempfile.gettempdir(), 'ecomdigital-throttle.sqlite3'))
+THROTTLE_CACHE_ALIAS = 'default'
+
+# Starts every test with empty throttle buckets
+TEST_RUNNER = 'ecomdigital.testing.TestRunner'
+
+# Maximum SQL queries per endpoint ("<METHOD> <url name>"). Exceeding a budget
+# logs a warning from InstrumentationMiddleware and fails
+# ecomdigital.testing.QueryBudgetMixin.assertQueryBudget in tests. Review
+# budgets include the auth state lookup JWT authentication runs when the
+# worker's cache is cold (see authentication/backends.py), and token budgets
+# the first load of the worker's blacklist filter (authentication/blacklist.py).
+ENDPOINT_QUERY_BUDGETS = {
+    'GET product-list': 2,
+    'GET product-detail': 1,
+    'GET product-featured': 1,
+    'GET category-list': 2,
+    'GET category-detail': 1,
+    'GET order-list': 3,
+    'GET order-detail': 2,
+    'POST order-list': 9,
+    'POST order-bulk-create': 11,
+    'POST order-cancel': 8,
+    'GET order-analytics': 3,
+    'GET review-list': 3,
+    'GET review-detail': 2,
+    'GET review-product-reviews': 3,
+    'GET review-my-reviews': 2,
+    'GET review-submission': 2,
+    'POST review-list': 7,
+    'PUT review-detail': 7,
+    'DELETE review-detail': 6,
+    'POST token_refresh': 6,
+    'POST token_blacklist': 5,
 }
 
 # CORS settings
@@ -157,5 +346,35 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Tokens carry a fingerprint of the password hash, so changing the
+    # password revokes them (see authentication/backends.py)
+    'CHECK_REVOKE_TOKEN': True,
+    'TOKEN_REFRESH_SERIALIZER': 'authentication.serializers.TokenRefreshSerializer',
+    # Rotated and logged-out refresh tokens are blacklisted by the
+    # authentication app rather than rest_framework_simplejwt.token_blacklist
+    # (see authentication/blacklist.py)
+    'TOKEN_BLACKLIST_SERIALIZER': 'authentication.serializers.TokenBlacklistSerializer',
 }
 
+# Seconds each worker trusts its cached copy of a user's auth state, and how
+# many users it keeps. A password change or deactivation takes up to the TTL
+# to reach other workers.
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=30, cast=int)
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+
+# Each worker's Bloom filter of blacklisted refresh tokens is sized for this
+# many tokens at this false-positive rate (1M at 0.1% takes about 1.8MB), and
+# expired rows are purged at most every TOKEN_BLACKLIST_PURGE_INTERVAL seconds.
+TOKEN_BLACKLIST_BLOOM_CAPACITY = config('TOKEN_BLACKLIST_BLOOM_CAPACITY', default=1000000, cast=int)
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = config('TOKEN_BLACKLIST_BLOOM_ERROR_RATE', default=0.001, cast=float)
+TOKEN_BLACKLIST_PURGE_INTERVAL = config('TOKEN_BLACKLIST_PURGE_INTERVAL', default=3600, cast=int)
+# Build each worker's filter on a background thread, checking tokens with
+# primary-key lookups (or the previous filter) until it is ready; off, the
+# check that finds it due builds it inline.
+TOKEN_BLACKLIST_BACKGROUND_BUILD = config('TOKEN_BLACKLIST_BACKGROUND_BUILD', default=True, cast=bool)
+# With the local-memory cache a worker can't tell when others blacklist a
+# token, so each check reads the rows added since the last one; set this to
+# read them at most every N seconds, accepting a token revoked through another
+# worker for up to that long. Ignored with a shared cache.
+TOKEN_BLACKLIST_LOCAL_SYNC_INTERVAL = config('TOKEN_BLACKLIST_LOCAL_SYNC_INTERVAL', default=0, cast=float)
+
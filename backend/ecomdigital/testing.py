@@ -0,0 +1,119 @@
+"""
+Shared helpers for the app test suites.
+"""
+import unittest
+from contextlib import contextmanager
+from types import ModuleType
+
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from .instrumentation import get_query_budget
+from .throttling import reset_throttles
+
+
+def viewset_queryset(viewset_class, action='list', query_params=None, user=None):
+    """Return the queryset a viewset would run for ``action`` and params.
+
+    Goes through ``get_queryset`` and the view's filter backends, so ordering
+    and search parameters are applied exactly as in a real request.
+    """
+    django_request = APIRequestFactory().get('/', query_params or {})
+    if user is not None:
+        django_request.user = user
+    view = viewset_class(
+        action=action, request=Request(django_request),
+        format_kwarg=None, args=(), kwargs={}
+    )
+    return view.filter_queryset(view.get_queryset())
+
+
+class QueryPlanAssertionsMixin:
+    """Assertions over SQLite's ``EXPLAIN QUERY PLAN`` output"""
+
+    def get_plan_steps(self, queryset):
+        # Each explain() row is "<id> <parent> <notused> <detail>"
+        return [line.split(' ', 3)[3] for line in queryset.explain().splitlines()]
+
+    def assertIndexedPlan(self, queryset):
+        """Fail if ``queryset`` scans a whole table or sorts in a temp B-tree"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan assertions target SQLite')
+        steps = self.get_plan_steps(queryset)
+        for step in steps:
+            if step.startswith('USE TEMP B-TREE'):
+                self.fail(f'Plan sorts in a temp B-tree: {steps}\n{queryset.query}')
+            if step.startswith('SCAN ') and ' USING ' not in step:
+                self.fail(f'Plan falls back to a full scan: {steps}\n{queryset.query}')
+
+
+class QueryBudgetMixin:
+    """Assert endpoints stay within ``settings.ENDPOINT_QUERY_BUDGETS``"""
+
+    @contextmanager
+    def assertQueryBudget(self, endpoint, budget=None):
+        """Fail if the block runs more queries than ``endpoint`` allows.
+
+        ``endpoint`` is "<METHOD> <url name>", e.g. "GET product-list".
+        """
+        if budget is None:
+            budget = get_query_budget(endpoint)
+        if budget is None:
+            self.fail(f'No query budget configured for {endpoint!r}')
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f'{endpoint} ran {len(context)} queries (budget {budget}):\n{queries}')
+
+
+def _rebuild_views(patterns):
+    rebuilt = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            rebuilt.append(URLResolver(
+                pattern.pattern, _rebuild_views(pattern.url_patterns), pattern.default_kwargs,
+                pattern.app_name, pattern.namespace,
+            ))
+            continue
+        callback = pattern.callback
+        if getattr(callback, 'actions', None) is not None:
+            callback = callback.cls.as_view(callback.actions, **callback.initkwargs)
+        rebuilt.append(URLPattern(pattern.pattern, callback, pattern.default_args, pattern.name))
+    return rebuilt
+
+
+def async_views_urlconf():
+    """The project URLconf with viewsets built as under ``ecomdigital.asgi``"""
+    urlconf = ModuleType('async_views_urlconf')
+    with override_settings(ASYNC_VIEWS=True):
+        urlconf.urlpatterns = _rebuild_views(get_resolver().url_patterns)
+    return urlconf
+
+
+class AsyncViewsMixin:
+    """Route test requests to the async views ``ecomdigital.asgi`` serves"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        urlconf = override_settings(ROOT_URLCONF=async_views_urlconf())
+        urlconf.enable()
+        cls.addClassCleanup(urlconf.disable)
+
+
+class TestRunner(DiscoverRunner):
+    """``DiscoverRunner`` that empties the throttle buckets before each test"""
+
+    def get_resultclass(self):
+        base = super().get_resultclass() or unittest.TextTestResult
+
+        class ThrottleResetResult(base):
+            def startTest(self, test):
+                reset_throttles()
+                super().startTest(test)
+        return ThrottleResetResult
@@ -0,0 +1,491 @@
+import datetime
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import parsers as drf_parsers, renderers as drf_renderers, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+from rest_framework import status
+from authentication.backends import StatelessJWTAuthentication
+from products.models import Category, Product
+from products.serializers import ProductSerializer
+from . import instrumentation, parsers, renderers
+from .db import sqlite_pragmas
+from .instrumentation import registry
+from .media import IMMUTABLE, REVALIDATE, HashedMediaStorage, is_hashed
+from .testing import AsyncViewsMixin
+from .throttling import (
+    CacheBucketStore, LoginThrottle, ReviewThrottle, SearchThrottle, SQLiteBucketStore,
+)
+
+
+class InstrumentationMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        Product.objects.create(
+            name="Spotify Premium",
+            slug="spotify-premium",
+            description="Premium music streaming service",
+            price=9.99,
+            category=category
+        )
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('product-list'))
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def fake_clock(self):
+        """Patch the instrumentation clock to only move inside ``advance``d methods"""
+        clock = [0.0]
+
+        def advance(seconds, method):
+            def wrapper(*args, **kwargs):
+                clock[0] += seconds
+                return method(*args, **kwargs)
+            return wrapper
+
+        patcher = mock.patch('ecomdigital.instrumentation.time.perf_counter', lambda: clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return advance
+
+    def test_serialize_and_render_stages(self):
+        advance = self.fake_clock()
+        Category.objects.create(name="Gaming", slug="gaming")
+        with mock.patch.object(serializers.ModelSerializer, 'to_representation',
+                               advance(1, serializers.ModelSerializer.to_representation)), \
+                mock.patch.object(renderers.JSONRenderer, 'render_json',
+                                  advance(0.5, renderers.JSONRenderer.render_json)):
+            response = self.client.get(reverse('category-list'))
+        timing = response['Server-Timing']
+        # Two categories, one second each
+        self.assertIn('serialize;dur=2000.00', timing)
+        self.assertIn('render;dur=500.00', timing)
+        self.assertIn('total;dur=2500.00', timing)
+        # DRF's serializer classes are left untouched
+        self.assertEqual(serializers.Serializer.__dict__['data'].fget.__module__, 'rest_framework.serializers')
+
+    def test_nested_serializers_count_once(self):
+        advance = self.fake_clock()
+        product = Product.objects.select_related('category').get()
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation._current.set(metrics)
+        try:
+            with mock.patch.object(serializers.ModelSerializer, 'to_representation',
+                                   advance(1, serializers.ModelSerializer.to_representation)):
+                ProductSerializer(product).data
+        finally:
+            instrumentation._current.reset(token)
+        # The product and its nested category took two seconds in all
+        self.assertEqual(metrics.serializer_time, 2.0)
+
+    def test_non_api_views_are_not_instrumented(self):
+        response = self.client.get('/admin/login/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(ENDPOINT_QUERY_BUDGETS={'GET product-list': 1})
+    def test_metrics_endpoint(self):
+        with self.assertLogs('ecomdigital.instrumentation', 'WARNING'):
+            self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-list'))
+
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        self.client.force_authenticate(user=admin)
+        stats = self.client.get(url).data['GET product-list']
+        self.assertEqual(stats['count'], 2)
+        # The second call is a catalog cache hit
+        self.assertEqual(stats['over_budget'], 1)
+        self.assertEqual(stats['queries']['buckets']['le_0'], 1)
+        self.assertEqual(stats['queries']['buckets']['le_2'], 1)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn('GET product-list', self.client.get(url).data)
+
+
+class AsyncInstrumentationTest(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        Product.objects.create(name="Spotify Premium", slug="spotify-premium", price=9.99, category=category)
+
+    def query_count(self, response):
+        db = response['Server-Timing'].split(', ')[0]
+        return int(db.split('desc="')[1].split()[0])
+
+    async def test_queries_in_worker_threads_are_counted(self):
+        # The async product list runs its queries through sync_to_async; the
+        # order list is a sync view run in a worker thread
+        response = await self.async_client.get(reverse('product-list'))
+        self.assertEqual(self.query_count(response), 2)
+        response = await self.async_client.get(reverse('order-list'))
+        self.assertGreater(self.query_count(response), 0)
+
+
+class JSONRendererTest(SimpleTestCase):
+    payload = {
+        'price': Decimal('9.90'),
+        'raw_decimal': Decimal('1234567.8900'),
+        'utc': datetime.datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc),
+        'london': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=ZoneInfo('Europe/London')),
+        'kathmandu': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=ZoneInfo('Asia/Kathmandu')),
+        'naive': datetime.datetime(2024, 1, 2, 3, 4, 5),
+        'date': datetime.date(2024, 1, 2),
+        'time': datetime.time(3, 4, 5),
+        'duration': datetime.timedelta(minutes=90),
+        'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Not found.'),
+        'text': 'Música \u2028 line \u2029 para "quoted" \\ </script>',
+        'histogram': {1: 0, 5: 3},
+        'nested': OrderedDict([('b', [1, 2.5, None, True]), ('a', ('x', 'y'))]),
+        'rating': 4.33,
+        'empty': [],
+    }
+
+    def assertSameOutput(self, data, **kwargs):
+        expected = drf_renderers.JSONRenderer().render(data, **kwargs)
+        self.assertEqual(renderers.JSONRenderer().render(data, **kwargs), expected)
+
+    def test_matches_drf_output(self):
+        self.assertIsNotNone(renderers.orjson, 'orjson should be installed in the test environment')
+        self.assertSameOutput(self.payload)
+        self.assertSameOutput([self.payload, self.payload])
+        self.assertSameOutput(None)
+
+    def test_indent_falls_back_to_stdlib(self):
+        self.assertSameOutput(self.payload, accepted_media_type='application/json; indent=4')
+
+    def test_wide_integers_fall_back_to_stdlib(self):
+        self.assertSameOutput({'big': 2 ** 70})
+
+    def test_stdlib_fallback_without_orjson(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertSameOutput(self.payload)
+
+
+class JSONParserTest(SimpleTestCase):
+    def parse(self, body, parser_class=parsers.JSONParser):
+        return parser_class().parse(BytesIO(body))
+
+    def test_matches_drf_parser(self):
+        body = '{"name": "Música", "price": "9.90", "rating": 4.5, "items": [1, null, true]}'.encode()
+        self.assertEqual(self.parse(body), self.parse(body, drf_parsers.JSONParser))
+
+    def test_wide_integers_fall_back_to_stdlib(self):
+        self.assertEqual(self.parse(b'{"big": 1180591620717411303424}'), {'big': 2 ** 70})
+
+    def test_rejects_invalid_json_and_constants(self):
+        for body in (b'{"name": ', b'{"rating": NaN}', b'{"rating": Infinity}', b'\xff'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError):
+                    self.parse(body)
+
+    def test_stdlib_fallback_without_orjson(self):
+        with mock.patch.object(parsers, 'orjson', None):
+            self.assertEqual(self.parse(b'{"a": [1, 2]}'), {'a': [1, 2]})
+
+
+class BucketStoreTestMixin:
+    def test_token_bucket(self):
+        # 3 requests per 3 seconds: a burst of 3, then one per second
+        consume = lambda now: self.store.consume('throttle:test:ip:1', 1, 3, now)
+        self.assertEqual([consume(100) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(consume(100), 1)
+        self.assertAlmostEqual(consume(100.5), 0.5)
+        self.assertEqual(consume(101), 0)
+        self.assertAlmostEqual(consume(101), 1)
+        self.assertEqual(self.store.consume('throttle:test:ip:2', 1, 3, 101), 0)
+        self.assertEqual([consume(110) for _ in range(3)], [0, 0, 0])
+
+    def test_clear(self):
+        for _ in range(3):
+            self.store.consume('throttle:test:ip:1', 1, 3, 100)
+        self.store.clear()
+        self.assertEqual(self.store.consume('throttle:test:ip:1', 1, 3, 100), 0)
+
+
+class SQLiteBucketStoreTest(BucketStoreTestMixin, SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SQLiteBucketStore(os.path.join(directory.name, 'throttle.sqlite3'))
+
+    def test_purge_keeps_partial_buckets(self):
+        self.store.consume('throttle:test:ip:1', 1, 3, 100)
+        self.store.consume('throttle:test:ip:2', 1, 3, 100)
+        self.store.consume('throttle:test:ip:2', 1, 3, 100)
+        self.store.purge(101.5)
+        keys = [key for key, in self.store._connection().execute('SELECT key FROM bucket')]
+        self.assertEqual(keys, ['throttle:test:ip:2'])
+
+
+class CacheBucketStoreTest(BucketStoreTestMixin, SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = CacheBucketStore()
+
+
+class ThrottleTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        self.product = Product.objects.create(
+            name="Spotify Premium", slug="spotify-premium", description="Music streaming",
+            price=Decimal("9.99"), category=category, stock=100,
+        )
+
+    def login(self, **extra):
+        return self.client.post(reverse('token_obtain_pair'), {
+            'username': 'testuser', 'password': 'testpass123'
+        }, format='json', **extra)
+
+    @mock.patch.dict(LoginThrottle.THROTTLE_RATES, {'login': '2/min'})
+    def test_login_throttled_per_ip(self):
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, status.HTTP_200_OK)
+
+    @mock.patch.dict(LoginThrottle.THROTTLE_RATES, {'login': '1/min'})
+    def test_client_address_behind_proxy(self):
+        # Without NUM_PROXIES a forged X-Forwarded-For doesn't buy a new bucket
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.5').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.6').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        # Behind one proxy, each client gets its own
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.7').status_code, status.HTTP_200_OK)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.8').status_code, status.HTTP_200_OK)
+            self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.8').status_code,
+                             status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @mock.patch.dict(SearchThrottle.THROTTLE_RATES, {'search': '1/min'})
+    def test_only_searches_count(self):
+        url = reverse('product-list')
+        for _ in range(3):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, {'search': 'spotify'}).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(url, {'search': 'music'}).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @mock.patch.dict(ReviewThrottle.THROTTLE_RATES, {'review': '1/min'})
+    def test_throttled_before_authentication(self):
+        access = self.login().data['access']
+        User.objects.create_user(username='other', password='testpass123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        review = {'product': self.product.pk, 'rating': 5, 'title': 'Great', 'comment': 'Works well'}
+        self.assertEqual(self.client.post(reverse('review-list'), review, format='json').status_code,
+                         status.HTTP_201_CREATED)
+        with mock.patch.object(StatelessJWTAuthentication, 'authenticate') as authenticate:
+            response = self.client.post(reverse('review-list'), review, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        authenticate.assert_not_called()
+        # Buckets are per user, not per address
+        self.client.credentials()
+        response = self.client.post(reverse('token_obtain_pair'), {
+            'username': 'other', 'password': 'testpass123'
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.post(reverse('review-list'), review, format='json').status_code,
+                         status.HTTP_201_CREATED)
+
+
+class AsyncThrottleTest(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch.dict(SearchThrottle.THROTTLE_RATES, {'search': '1/min'})
+    def test_async_route_throttled(self):
+        url = reverse('product-list')
+        self.assertEqual(self.client.get(url, {'search': 'spotify'}).status_code, status.HTTP_200_OK)
+        response = self.client.get(url, {'search': 'spotify'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
+
+class SQLitePragmaTest(SimpleTestCase):
+    def connect(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        default = connections['default']
+        wrapper = default.__class__({**default.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3')})
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'mmap_size': 1 << 20,
+        'cache_size': -4096, 'busy_timeout': 2500,
+    })
+    def test_new_connections_are_tuned(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'mmap_size'), 1 << 20)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -4096)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 2500)
+
+    @override_settings(SQLITE_PRAGMAS={})
+    def test_default_profile_leaves_sqlite_alone(self):
+        self.assertEqual(self.pragma(self.connect(), 'journal_mode'), 'delete')
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': '1; DROP TABLE auth_user'})
+    def test_rejects_unsafe_pragmas(self):
+        with self.assertRaises(ValueError):
+            sqlite_pragmas()
+
+
+class MediaServingTest(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_ACCEL='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = HashedMediaStorage(location=self.media_root)
+        self.body = bytes(range(256)) * 40
+        self.name = self.storage.save('products/photo.jpg', ContentFile(self.body))
+        self.url = f'/media/{self.name}'
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, headers=headers)
+
+    def test_storage_hashes_names_and_reuses_identical_content(self):
+        self.assertRegex(self.name, r'^products/photo\.[0-9a-f]{12}\.jpg$')
+        self.assertTrue(is_hashed(self.name))
+        self.assertEqual(self.storage.save('products/photo.jpg', ContentFile(self.body)), self.name)
+        other = self.storage.save('products/photo.jpg', ContentFile(b'other bytes'))
+        self.assertNotEqual(other, self.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'products'))), 2)
+
+    def test_storage_keeps_already_hashed_names_and_max_length(self):
+        derived = 'products/derived/0123456789abcdef0123456789abcdef-card.webp'
+        self.assertEqual(self.storage.save(derived, ContentFile(b'webp')), derived)
+        name = self.storage.save('products/' + 'x' * 200 + '.png', ContentFile(b'png'), max_length=100)
+        self.assertEqual(len(name), 100)
+        self.assertTrue(name.endswith('.png') and is_hashed(name))
+
+    def test_storage_hashes_names_that_only_look_hashed(self):
+        for upload in ('1696500000000.jpg', 'cafebabe1234.png', 'photo-0123456789abcdef.jpg', 'ab.0123456789abcdef.jpg'):
+            with self.subTest(upload=upload):
+                self.assertFalse(is_hashed(f'products/{upload}'))
+                name = self.storage.save(f'products/{upload}', ContentFile(upload.encode()))
+                root, extension = os.path.splitext(upload)
+                self.assertRegex(name, rf'^products/{re.escape(root)}\.[0-9a-f]{{12}}{extension}$')
+        self.assertFalse(is_hashed('products/0123456789abcdef0123456789abcdef-card.webp'))
+
+        os.makedirs(os.path.join(self.media_root, 'legacy'))
+        with open(os.path.join(self.media_root, 'legacy', 'cafebabe1234.png'), 'wb') as file:
+            file.write(b'legacy')
+        self.assertEqual(self.get('/media/legacy/cafebabe1234.png')['Cache-Control'], REVALIDATE)
+
+    def test_hashed_file_is_immutable(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.body)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_unhashed_file_must_revalidate(self):
+        os.makedirs(os.path.join(self.media_root, 'legacy'))
+        with open(os.path.join(self.media_root, 'legacy', 'photo.jpg'), 'wb') as file:
+            file.write(b'legacy')
+        response = self.get('/media/legacy/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], REVALIDATE)
+
+    def test_conditional_requests(self):
+        response = self.get()
+        revalidated = self.get(if_none_match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['Cache-Control'], IMMUTABLE)
+        self.assertEqual(self.get(if_modified_since=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(if_none_match='"stale"').status_code, 200)
+
+    def test_head(self):
+        response = self.client.head(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.body)))
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_ranges(self):
+        response = self.get(range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.body[100:200])
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.body)}')
+        self.assertEqual(response['Content-Length'], '100')
+
+        response = self.get(range='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-10:])
+        response = self.get(range=f'bytes={len(self.body) - 5}-')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-5:])
+        response = self.get(range='bytes=10-99999999')
+        self.assertEqual(response['Content-Range'], f'bytes 10-{len(self.body) - 1}/{len(self.body)}')
+
+    def test_unsatisfiable_and_ignored_ranges(self):
+        response = self.get(range=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.body)}')
+        # Several ranges, or an If-Range that no longer matches: whole file
+        self.assertEqual(self.get(range='bytes=0-1,5-6').status_code, 200)
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(range='bytes=0-1', if_range=etag).status_code, 206)
+        self.assertEqual(self.get(range='bytes=0-1', if_range='"stale"').status_code, 200)
+
+    def test_missing_files_and_traversal(self):
+        self.assertEqual(self.get('/media/products/missing.jpg').status_code, 404)
+        self.assertEqual(self.get('/media/products/').status_code, 404)
+        self.assertEqual(self.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.get('/media/%2e%2e/settings.py').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect', MEDIA_ACCEL_PREFIX='/internal-media/')
+    def test_x_accel_redirect(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal-media/{self.name}')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_ACCEL='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.get()
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, self.name))
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
@@ -0,0 +1,227 @@
+"""
+Token-bucket rate limiting shared by every worker process.
+
+Each scope (``login``, ``register``, ``search``, ``order``, ``review``) gets
+a bucket per client that holds as many requests as its rate allows per
+period and refills continuously. So ``'10/min'`` allows a burst of ten, then
+one request every six seconds. Clients are identified by the user id in a
+valid bearer token, or by IP address otherwise (honouring DRF's
+``NUM_PROXIES``).
+
+A bucket is stored as one number, its "theoretical arrival time" (GCRA), so
+a check is a single keyed read-modify-write whatever the traffic:
+
+- ``SQLiteBucketStore`` keeps buckets in a small SQLite file that every
+  worker on the host opens. The check is one atomic UPSERT, and the file
+  skips fsync, since losing buckets in a crash only resets limits.
+- ``CacheBucketStore`` keeps them in the Django cache (memcached, Redis...)
+  for deployments spread over several hosts. Its read-then-write can let a
+  few extra requests through when one client races itself, never fewer.
+
+``THROTTLE_STORE`` picks one. By default the cache is used when it is shared
+and the SQLite file otherwise. Views using ``ThrottleFirstMixin`` check
+throttles before authentication and permissions; DRF's default order runs
+them after both.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+
+class SQLiteBucketStore:
+    def __init__(self, path=None):
+        self.path = path or settings.THROTTLE_DB_PATH
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, reopened in forked children
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID'
+            )
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def consume(self, key, interval, limit, now):
+        """Take one request from ``key``'s bucket.
+
+        ``interval`` is the refill time of one request and ``limit`` the
+        time to refill the whole bucket. Returns 0 if the request is allowed,
+        otherwise the seconds until it would be.
+        """
+        connection = self._connection()
+        allowed = connection.execute(
+            'INSERT INTO bucket (key, tat) VALUES (:key, :now + :interval) '
+            'ON CONFLICT (key) DO UPDATE SET tat = max(tat, :now) + :interval '
+            'WHERE max(tat, :now) + :interval - :now <= :limit '
+            'RETURNING tat',
+            {'key': key, 'now': now, 'interval': interval, 'limit': limit},
+        ).fetchone()
+        if allowed is not None:
+            return 0
+        tat, = connection.execute('SELECT tat FROM bucket WHERE key = ?', (key,)).fetchone()
+        return max(tat, now) + interval - now - limit
+
+    def purge(self, now):
+        """Drop full buckets, which behave exactly like missing ones"""
+        self._connection().execute('DELETE FROM bucket WHERE tat <= ?', (now,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM bucket')
+
+
+class CacheBucketStore:
+    def __init__(self, alias=None):
+        self.alias = alias or settings.THROTTLE_CACHE_ALIAS
+
+    def consume(self, key, interval, limit, now):
+        cache = caches[self.alias]
+        tat = max(cache.get(key, now), now) + interval
+        if tat - now > limit:
+            return tat - now - limit
+        # Expires when the bucket would be full again
+        cache.set(key, tat, math.ceil(tat - now))
+        return 0
+
+    def purge(self, now):
+        pass
+
+    def clear(self):
+        cache = caches[self.alias]
+        delete_pattern = getattr(cache, 'delete_pattern', None)
+        if delete_pattern is not None:
+            delete_pattern(f'{TokenBucketThrottle.key_prefix}*')
+        else:
+            cache.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.THROTTLE_STORE)()
+    return _store
+
+
+def reset_throttles():
+    """Empty every bucket (tests use this between cases)"""
+    get_bucket_store().clear()
+
+
+def request_identity(request, throttle):
+    """``user:<id>`` for a valid bearer token, ``ip:<address>`` otherwise.
+
+    Validating the token checks its signature and expiry but loads nothing,
+    so this is safe to run before authentication.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw_token = authenticator.get_raw_token(header) if header is not None else None
+    if raw_token is not None:
+        try:
+            user_id = authenticator.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+        except InvalidToken:
+            user_id = None
+        if user_id is not None:
+            return f'user:{user_id}'
+    return f'ip:{throttle.get_ident(request)}'
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket for ``scope``, with rates from ``DEFAULT_THROTTLE_RATES``.
+
+    Subclasses narrow what is throttled by overriding ``applies()``.
+    """
+    key_prefix = 'throttle:'
+    purge_interval = 600
+    _purged_at = 0
+
+    def applies(self, request, view):
+        return True
+
+    def get_cache_key(self, request, view):
+        if not self.applies(request, view):
+            return None
+        return f'{self.key_prefix}{self.scope}:{request_identity(request, self)}'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        now = time.time()
+        store = get_bucket_store()
+        self.wait_time = store.consume(key, self.duration / self.num_requests, self.duration, now)
+        if now - TokenBucketThrottle._purged_at >= self.purge_interval:
+            TokenBucketThrottle._purged_at = now
+            store.purge(now)
+        return self.wait_time <= 0
+
+    def wait(self):
+        return self.wait_time
+
+
+class LoginThrottle(TokenBucketThrottle):
+    scope = 'login'
+
+
+class RegisterThrottle(TokenBucketThrottle):
+    scope = 'register'
+
+
+class SearchThrottle(TokenBucketThrottle):
+    """Only full-text searches count; plain listing is cached and cheap"""
+    scope = 'search'
+
+    def applies(self, request, view):
+        return bool(request.query_params.get(api_settings.SEARCH_PARAM, '').strip())
+
+
+class ActionThrottle(TokenBucketThrottle):
+    actions = ()
+
+    def applies(self, request, view):
+        return getattr(view, 'action', None) in self.actions
+
+
+class OrderThrottle(ActionThrottle):
+    scope = 'order'
+    actions = ('create', 'bulk_create')
+
+
+class ReviewThrottle(ActionThrottle):
+    scope = 'review'
+    actions = ('create',)
+
+
+class ThrottleFirstMixin:
+    """Check throttles before authentication and permissions"""
+
+    def initial(self, request, *args, **kwargs):
+        super().check_throttles(request)
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        # Already checked at the start of initial()
+        pass
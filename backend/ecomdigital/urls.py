@@ -3,8 +3,8 @@ URL configuration for ecomdigital project.
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
+from .instrumentation import metrics_view
+from .media import media_urlpatterns
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,8 +12,7 @@ urlpatterns = [
     path('api/products/', include('products.urls')),
     path('api/orders/', include('orders.urls')),
     path('api/reviews/', include('reviews.urls')),
+    path('api/metrics/', metrics_view, name='metrics'),
+    *media_urlpatterns(),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
@@ -1,18 +1,66 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.db import transaction
+from products.models import Product
 from .models import Order, OrderItem
+from .rollups import order_day, rebuild_rollups
+from .stock import InsufficientStock, stock_quantities, unavailable_products
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['subtotal']
+    raw_id_fields = ['product']
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        order = self.instance
+        status = cleaned_data.get('status')
+        # Leaving "cancelled" takes the items out of stock again
+        if order.pk and order._status_snapshot == 'cancelled' and status not in (None, 'cancelled'):
+            short = unavailable_products(stock_quantities(order.items.all()))
+            if short:
+                names = Product.objects.filter(pk__in=short).order_by('name').values_list('name', flat=True)
+                self.add_error('status', f'Not enough stock to restore this order: {", ".join(names)}.')
+        return cleaned_data
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ['id', 'customer_name', 'customer_email', 'total_amount', 'status', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['customer_name', 'customer_email']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [OrderItemInline]
+    actions = ['cancel_orders']
+
+    def save_model(self, request, obj, form, change):
+        try:
+            with transaction.atomic():
+                super().save_model(request, obj, form, change)
+        except InsufficientStock:
+            # Sold out between validation and save: keep the order cancelled
+            obj.status = obj._status_snapshot = 'cancelled'
+            super().save_model(request, obj, form, change)
+            self.message_user(request, 'Not enough stock to restore this order; it stays cancelled.', messages.ERROR)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Item edits, and the items of a new order, are saved after the order
+        # itself, so the rollups for the order's day are recounted here
+        day = order_day(form.instance)
+        rebuild_rollups(day, day)
+
+    @admin.action(description='Cancel selected orders and release their stock')
+    def cancel_orders(self, request, queryset):
+        cancelled = sum(order.cancel() for order in queryset)
+        self.message_user(request, f'{cancelled} order(s) cancelled.')
 
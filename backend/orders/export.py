@@ -0,0 +1,165 @@
+"""
+Streaming export of orders and their items as CSV or NDJSON.
+
+Orders are read in ``(created_at, id)`` order by a single query iterated in
+chunks (``iterator(chunk_size=...)``, a server-side cursor on PostgreSQL,
+``fetchmany`` on SQLite). Each chunk's items are fetched with one
+``order_id IN (...)`` query. Output is written in blocks of about
+``BLOCK_SIZE`` bytes. Memory stays flat however many orders are exported.
+Under ASGI, ``aexport_orders`` hands the blocks over one at a time from a
+worker thread, since Django would otherwise read a synchronous stream into
+memory before sending it.
+
+Every order carries an opaque ``cursor``. Passing the cursor of the last
+order received as ``after`` restarts the export just after that order:
+
+- NDJSON has one line per order, so use the cursor of the last complete line.
+- CSV has one row per item, so drop the rows of the last order, which may be
+  incomplete, and resume from the cursor of the order before it.
+"""
+import base64
+import binascii
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from rest_framework import renderers
+from ecomdigital.renderers import JSONRenderer
+from .models import Order
+
+# Orders per chunk, and so per items query
+CHUNK_SIZE = 2000
+# Bytes buffered before each write to the client
+BLOCK_SIZE = 64 * 1024
+
+ORDER_FIELDS = ['id', 'created_at', 'status', 'customer_name', 'customer_email', 'total_amount']
+ITEM_FIELDS = ['id', 'product_id', 'product_name', 'product_price', 'quantity', 'subtotal']
+CSV_HEADER = ['cursor', *(f'order_{name}' for name in ORDER_FIELDS), *(f'item_{name}' for name in ITEM_FIELDS)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order):
+    position = f'{order.created_at.isoformat()}|{order.pk}'
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` of the order ``cursor`` points at"""
+    try:
+        position = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = position.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor('Invalid cursor.') from exc
+
+
+def export_queryset(created_range=None, statuses=None, after=None):
+    """Orders to export, oldest first, starting after the ``after`` cursor"""
+    queryset = Order.objects.filter(**(created_range or {}))
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    if after:
+        created_at, pk = decode_cursor(after)
+        # created_at >= x keeps the scan an index range; ties are excluded by id
+        queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, pk__lte=pk)
+    return queryset.order_by('created_at', 'id').prefetch_related('items')
+
+
+def format_value(value):
+    if isinstance(value, datetime):
+        # Same form as the API's timestamps
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def order_record(order):
+    record = {name: format_value(getattr(order, name)) for name in ORDER_FIELDS}
+    record['cursor'] = encode_cursor(order)
+    record['items'] = [
+        {name: format_value(getattr(item, name)) for name in ITEM_FIELDS}
+        for item in order.items.all()
+    ]
+    return record
+
+
+def _ndjson(orders):
+    render = JSONRenderer().render
+    for order in orders:
+        yield render(order_record(order)) + b'\n'
+
+
+def _csv(orders):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue().encode()
+    for order in orders:
+        buffer.seek(0)
+        buffer.truncate()
+        record = order_record(order)
+        head = [record['cursor'], *(record[name] for name in ORDER_FIELDS)]
+        for item in record['items'] or [{}]:
+            writer.writerow([*head, *(item.get(name) for name in ITEM_FIELDS)])
+        yield buffer.getvalue().encode()
+
+
+FORMATS = {
+    'csv': _csv,
+    'ndjson': _ndjson,
+}
+
+
+def export_orders(queryset, export_format, chunk_size=CHUNK_SIZE):
+    """Yield ``queryset`` as ``export_format`` in blocks of about ``BLOCK_SIZE`` bytes"""
+    block, size = [], 0
+    for chunk in FORMATS[export_format](queryset.iterator(chunk_size=chunk_size)):
+        block.append(chunk)
+        size += len(chunk)
+        if size >= BLOCK_SIZE:
+            yield b''.join(block)
+            block, size = [], 0
+    if block:
+        yield b''.join(block)
+
+
+async def aexport_orders(queryset, export_format, chunk_size=CHUNK_SIZE):
+    """``export_orders`` for ASGI: each block is read in the thread that runs sync code"""
+    blocks = export_orders(queryset, export_format, chunk_size)
+    next_block = sync_to_async(next)
+    try:
+        while (block := await next_block(blocks, None)) is not None:
+            yield block
+    finally:
+        # Closes the cursor in the thread that opened it
+        await sync_to_async(blocks.close)()
+
+
+class ExportRenderer(renderers.BaseRenderer):
+    """Picks an export format by ``?format=`` or ``Accept``.
+
+    The view streams exports itself; rendering joins the blocks of an
+    ``export_orders`` result for callers that want the whole body. Errors
+    are answered in JSON instead (see ``OrderViewSet.handle_exception``).
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(data or ())
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from orders.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily order and product rollups from the orders, for all days or a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start', type=date.fromisoformat,
+            help='First day to rebuild (YYYY-MM-DD); defaults to the first order'
+        )
+        parser.add_argument(
+            '--end', type=date.fromisoformat,
+            help='Last day to rebuild (YYYY-MM-DD); defaults to the last order'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rollup rows written per INSERT statement'
+        )
+
+    def handle(self, *args, **options):
+        order_rows, product_rows = rebuild_rollups(options['start'], options['end'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {order_rows} daily order rollups and {product_rows} daily product rollups'
+        ))
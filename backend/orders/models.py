@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+from products.models import Product
+from .stock import release_stock, stock_quantities
 
 
 class Order(models.Model):
@@ -22,13 +25,52 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer_email}"
 
+    def cancel(self):
+        """Cancel the order and return its items to stock.
+
+        The status change is a conditional UPDATE from the status last seen,
+        so when two requests race to cancel the same order only one of them
+        releases the stock, and the rollups move the order out of the status
+        it really had. Returns False if the order was already cancelled.
+        """
+        from .rollups import move_orders
+
+        with transaction.atomic():
+            previous = self._status_snapshot or self.status
+            cancelled = False
+            while previous not in (None, 'cancelled'):
+                cancelled = Order.objects.filter(pk=self.pk, status=previous).update(
+                    status='cancelled', updated_at=timezone.now()
+                )
+                if cancelled:
+                    items = list(self.items.all())
+                    release_stock(stock_quantities(items))
+                    move_orders([(self, items)], previous, 'cancelled')
+                    break
+                # Changed since it was loaded; try again from its current status
+                previous = Order.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        self.status = 'cancelled'
+        self._status_snapshot = 'cancelled'
+        return bool(cancelled)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='order_items'
+    )
     product_name = models.CharField(max_length=200)
     product_price = models.DecimalField(
         max_digits=10,
@@ -45,3 +87,35 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product_name} x{self.quantity}"
 
+
+
+class DailyOrderRollup(models.Model):
+    """Orders, units and revenue per day and status, maintained by orders/rollups.py"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'status']
+        ordering = ['date', 'status']
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.order_count} orders"
+
+
+class DailyProductRollup(models.Model):
+    """Units and revenue per day, status and product name"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    product_name = models.CharField(max_length=200)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'status', 'product_name']
+        ordering = ['date', 'status', 'product_name']
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.product_name} x{self.units}"
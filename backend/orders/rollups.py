@@ -0,0 +1,177 @@
+"""
+Daily order rollups for analytics.
+
+``DailyOrderRollup`` holds the order count, units and revenue per day and status,
+and ``DailyProductRollup`` the units and revenue per day, status and product
+name. Reports read these instead of aggregating over ``Order`` and
+``OrderItem``, so a query costs the number of days and names in its range
+whatever the size of the order history.
+
+The rows are kept current in the transaction that changes the orders:
+
+- checkout and bulk checkout add their orders (``record_orders``);
+- a status change, through ``Order.cancel()`` or a plain save, moves the
+  order and its items from the old status to the new one (``move_orders``);
+- a save that changes ``total_amount`` adds the difference to the revenue
+  under the status the order had (``adjust_revenue``);
+- deleting an order takes it out (``remove_orders``).
+
+Each of these is one ``INSERT ... ON CONFLICT DO UPDATE`` per table that adds
+the deltas to existing rows, so concurrent checkouts never overwrite each
+other's counts. The admin saves an order's items after the order itself, so
+it recounts the order's day with ``rebuild_rollups`` instead. Orders written
+any other way (bulk loads, raw SQL) are caught up by the
+``rebuild_order_rollups`` command, which runs it for any date range.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailyOrderRollup, DailyProductRollup, Order, OrderItem
+
+# Rows per INSERT, well under SQLite's bound parameter limit
+UPSERT_BATCH_SIZE = 500
+
+
+def order_day(order):
+    """The rollup date of ``order``: its creation date in the current time zone"""
+    return timezone.localdate(order.created_at)
+
+
+def day_start(day):
+    """Midnight at the start of ``day`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _upsert(model, keys, totals, rows):
+    """Add ``rows`` of ``(*keys, *totals)`` to ``model``'s existing totals"""
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(column) for column in (*keys, *totals))
+    conflict = ', '.join(quote(key) for key in keys)
+    updates = ', '.join(
+        f'{quote(total)} = {table}.{quote(total)} + excluded.{quote(total)}' for total in totals
+    )
+    row_sql = f"({', '.join(['%s'] * (len(keys) + len(totals)))})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) VALUES {", ".join([row_sql] * len(batch))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}',
+                [value for row in batch for value in row],
+            )
+
+
+def apply_rollup_changes(changes):
+    """Apply ``(order, items, status, delta)`` changes to the rollups.
+
+    ``delta`` is 1 to count the order and its items under ``status`` and -1
+    to take them out. Must run in the transaction that changes the orders.
+    """
+    orders = defaultdict(lambda: [0, 0, Decimal('0.00')])
+    products = defaultdict(lambda: [0, Decimal('0.00')])
+    for order, items, status, delta in changes:
+        day = connection.ops.adapt_datefield_value(order_day(order))
+        order_totals = orders[day, status]
+        order_totals[0] += delta
+        order_totals[2] += delta * order.total_amount
+        for item in items:
+            order_totals[1] += delta * item.quantity
+            totals = products[day, status, item.product_name]
+            totals[0] += delta * item.quantity
+            totals[1] += delta * item.subtotal
+    _upsert(
+        DailyOrderRollup, ['date', 'status'], ['order_count', 'units', 'revenue'],
+        [(*key, *totals) for key, totals in orders.items() if any(totals)],
+    )
+    _upsert(
+        DailyProductRollup, ['date', 'status', 'product_name'], ['units', 'revenue'],
+        [(*key, *totals) for key, totals in products.items() if any(totals)],
+    )
+
+
+def record_orders(orders):
+    """Count new ``(order, items)`` pairs under their status"""
+    apply_rollup_changes([(order, items, order.status, 1) for order, items in orders])
+
+
+def move_orders(orders, previous, status):
+    """Move ``(order, items)`` pairs from status ``previous`` to ``status``"""
+    apply_rollup_changes([
+        change
+        for order, items in orders
+        for change in ((order, items, previous, -1), (order, items, status, 1))
+    ])
+
+
+def adjust_revenue(order, previous_total, status):
+    """Move ``order``'s revenue under ``status`` from ``previous_total`` to its total"""
+    difference = order.total_amount - previous_total
+    if difference:
+        day = connection.ops.adapt_datefield_value(order_day(order))
+        _upsert(
+            DailyOrderRollup, ['date', 'status'], ['order_count', 'units', 'revenue'],
+            [(day, status, 0, 0, difference)],
+        )
+
+
+def remove_orders(orders):
+    """Take deleted ``(order, items)`` pairs out of the rollups"""
+    apply_rollup_changes([(order, items, order.status, -1) for order, items in orders])
+
+
+def rebuild_rollups(start=None, end=None, batch_size=1000):
+    """Recompute the rollups for ``start``..``end`` (inclusive dates) from the orders.
+
+    Either bound may be ``None`` for an open range. Rows left at zero by
+    status changes are dropped. Returns the number of order and product
+    rollup rows written.
+    """
+    date_range, created_range = {}, {}
+    # Filter on created_at itself, not its date, so the index bounds the scan
+    if start is not None:
+        date_range['date__gte'] = start
+        created_range['created_at__gte'] = day_start(start)
+    if end is not None:
+        date_range['date__lte'] = end
+        created_range['created_at__lt'] = day_start(end + timedelta(days=1))
+
+    orders = (
+        Order.objects.order_by().filter(**created_range).annotate(day=TruncDate('created_at'))
+        .values('day', 'status').annotate(order_count=Count('id'), revenue=Sum('total_amount'))
+    )
+    items = (
+        OrderItem.objects.order_by()
+        .filter(**{f'order__{lookup}': value for lookup, value in created_range.items()})
+        .annotate(day=TruncDate('order__created_at'), status=F('order__status'))
+        .values('day', 'status', 'product_name').annotate(units=Sum('quantity'), revenue=Sum('subtotal'))
+    )
+    with transaction.atomic():
+        DailyOrderRollup.objects.filter(**date_range).delete()
+        DailyProductRollup.objects.filter(**date_range).delete()
+        # Units per day and status are summed from the product rows
+        units = defaultdict(int)
+        product_rows = []
+        for row in items.iterator():
+            units[row['day'], row['status']] += row['units']
+            product_rows.append(DailyProductRollup(
+                date=row['day'], status=row['status'], product_name=row['product_name'],
+                units=row['units'], revenue=row['revenue'],
+            ))
+        order_rows = [
+            DailyOrderRollup(
+                date=row['day'], status=row['status'], order_count=row['order_count'],
+                units=units[row['day'], row['status']], revenue=row['revenue'],
+            )
+            for row in orders.iterator()
+        ]
+        DailyOrderRollup.objects.bulk_create(order_rows, batch_size=batch_size)
+        DailyProductRollup.objects.bulk_create(product_rows, batch_size=batch_size)
+    return len(order_rows), len(product_rows)
@@ -1,23 +1,65 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_slug
+from django.db import connection, transaction
+from django.utils import timezone
 from rest_framework import serializers
+from ecomdigital.serializers import ModelSerializer
+from products.prices import price_table
 from .models import Order, OrderItem
+from .export import InvalidCursor, decode_cursor
+from .rollups import day_start, record_orders
+from .stock import InsufficientStock, reserve_stock, stock_quantities, unavailable_products
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ModelSerializer):
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
         model = OrderItem
-        fields = ['id', 'product_name', 'product_price', 'quantity', 'subtotal']
+        fields = ['id', 'product', 'product_name', 'product_price', 'quantity', 'subtotal']
+
+
+class ProductReferenceField(serializers.Field):
+    """A product id or slug.
+
+    Only the format is checked here; references are resolved for the whole
+    order at once when it is created, instead of one lookup per line item.
+    """
+    default_error_messages = {
+        'invalid': 'Expected a product id or slug.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.isdigit():
+            data = int(data)
+        if isinstance(data, int) and not isinstance(data, bool):
+            if data < 1:
+                self.fail('invalid')
+            return data
+        if not isinstance(data, str) or not data:
+            self.fail('invalid')
+        try:
+            validate_slug(data)
+        except DjangoValidationError:
+            self.fail('invalid')
+        return data
+
+    def to_representation(self, value):
+        return value
 
 
 class OrderItemCreateSerializer(serializers.Serializer):
-    """Serializer for creating order items (without subtotal)"""
-    product_name = serializers.CharField(max_length=200)
-    product_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    """Serializer for creating order items (without subtotal).
+
+    Names and prices come from the product, never from the client.
+    """
+    product = ProductReferenceField()
     quantity = serializers.IntegerField(min_value=1)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -30,41 +72,162 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['status', 'created_at', 'updated_at']
 
 
-class OrderCreateSerializer(serializers.ModelSerializer):
+def resolve_prices(items_data):
+    """Look up the current name and price of every product in ``items_data``"""
+    prices, missing = price_table.resolve([item_data['product'] for item_data in items_data])
+    if missing:
+        raise serializers.ValidationError({
+            'items': [f'Product {ref} does not exist' for ref in missing]
+        })
+    return prices
+
+
+def build_order_items(items_data, prices):
+    """Price line items in a single pass.
+
+    ``prices`` comes from ``resolve_prices``; each item snapshots the
+    product's current name and price. Returns the unsaved ``OrderItem``
+    instances and the order total.
+    """
+    order_items = []
+    total_amount = Decimal('0.00')
+    for item_data in items_data:
+        product = prices[item_data['product']]
+        price = product.price
+        subtotal = price * item_data['quantity']
+        total_amount += subtotal
+        order_items.append(OrderItem(
+            product_id=product.id,
+            product_name=product.name,
+            product_price=price,
+            quantity=item_data['quantity'],
+            subtotal=subtotal
+        ))
+    return order_items, total_amount
+
+
+def stock_error(exc):
+    # Runs after the failed transaction rolled back, so stock is current
+    unavailable = unavailable_products(exc.quantities) or sorted(exc.quantities)
+    return serializers.ValidationError({
+        'items': [f'Product {pk} is unavailable or out of stock' for pk in unavailable]
+    })
+
+
+class OrderBulkCreateSerializer(serializers.ListSerializer):
+    """Creates a batch of orders and all of their items in one transaction"""
+
+    def create(self, validated_data):
+        prices = resolve_prices([
+            item_data for order_data in validated_data for item_data in order_data['items']
+        ])
+        priced = []
+        for order_data in validated_data:
+            items_data = order_data.pop('items')
+            order_items, total_amount = build_order_items(items_data, prices)
+            priced.append((Order(total_amount=total_amount, **order_data), order_items))
+
+        try:
+            with transaction.atomic():
+                all_items = [item for _, order_items in priced for item in order_items]
+                reserve_stock(stock_quantities(all_items))
+                orders = [order for order, _ in priced]
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Order.objects.bulk_create(orders)
+                else:
+                    for order in orders:
+                        order.save()
+                for order, order_items in priced:
+                    for item in order_items:
+                        item.order = order
+                OrderItem.objects.bulk_create(all_items)
+                record_orders(priced)
+        except InsufficientStock as exc:
+            raise stock_error(exc)
+        return orders
+
+
+class OrderCreateSerializer(ModelSerializer):
     items = OrderItemCreateSerializer(many=True)
 
     class Meta:
         model = Order
         fields = ['customer_name', 'customer_email', 'items']
+        list_serializer_class = OrderBulkCreateSerializer
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        
-        # Calculate total amount first
-        from decimal import Decimal
-        total_amount = Decimal('0.00')
-        for item_data in items_data:
-            price = Decimal(str(item_data['product_price']))
-            subtotal = price * item_data['quantity']
-            total_amount += subtotal
-        
-        # Create order with total_amount
-        order = Order.objects.create(
-            total_amount=total_amount,
-            **validated_data
-        )
-        
-        # Create order items
-        for item_data in items_data:
-            price = Decimal(str(item_data['product_price']))
-            subtotal = price * item_data['quantity']
-            OrderItem.objects.create(
-                order=order,
-                product_name=item_data['product_name'],
-                product_price=price,
-                quantity=item_data['quantity'],
-                subtotal=subtotal
-            )
-        
+        order_items, total_amount = build_order_items(items_data, resolve_prices(items_data))
+
+        try:
+            with transaction.atomic():
+                reserve_stock(stock_quantities(order_items))
+                order = Order.objects.create(
+                    total_amount=total_amount,
+                    **validated_data
+                )
+                for item in order_items:
+                    item.order = order
+                OrderItem.objects.bulk_create(order_items)
+                record_orders([(order, order_items)])
+        except InsufficientStock as exc:
+            raise stock_error(exc)
+
         return order
 
+
+class OrderFilterQuerySerializer(serializers.Serializer):
+    """Date range and status filters shared by the analytics and export endpoints"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+
+    def validate_status(self, value):
+        statuses = [status.strip() for status in value.split(',') if status.strip()]
+        valid = dict(Order.STATUS_CHOICES)
+        invalid = [status for status in statuses if status not in valid]
+        if invalid:
+            raise serializers.ValidationError(f'Unknown status: {", ".join(invalid)}.')
+        return statuses
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'Must not be after end.'})
+        return attrs
+
+
+class OrderAnalyticsQuerySerializer(OrderFilterQuerySerializer):
+    """Query parameters of the order analytics endpoint"""
+    GROUPS = ['day', 'status', 'product']
+    DEFAULT_DAYS = 30
+
+    group = serializers.ChoiceField(choices=GROUPS, default='day')
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=self.DEFAULT_DAYS - 1))
+        return super().validate(attrs)
+
+
+class OrderExportQuerySerializer(OrderFilterQuerySerializer):
+    """Query parameters of the order export endpoint and command"""
+    after = serializers.CharField(required=False)
+
+    def validate_after(self, value):
+        try:
+            decode_cursor(value)
+        except InvalidCursor as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        # Whole days in the current time zone, bounded on created_at itself
+        created_range = {}
+        if attrs.get('start'):
+            created_range['created_at__gte'] = day_start(attrs['start'])
+        if attrs.get('end'):
+            created_range['created_at__lt'] = day_start(attrs['end'] + timedelta(days=1))
+        attrs['created_range'] = created_range
+        return attrs
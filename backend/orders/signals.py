@@ -0,0 +1,44 @@
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+from .models import Order
+from .rollups import adjust_revenue, move_orders, remove_orders
+from .stock import release_stock, reserve_stock, stock_quantities
+
+
+@receiver(post_init, sender=Order)
+def remember_status(sender, instance, **kwargs):
+    # Snapshot the persisted status so a save can tell whether the order
+    # moved in or out of "cancelled" without re-reading the row.
+    instance._status_snapshot = instance.status if instance.pk else None
+    # The revenue counted for the order; None when the field wasn't loaded
+    instance._total_snapshot = instance.__dict__.get('total_amount') if instance.pk else None
+
+
+@receiver(post_save, sender=Order)
+def apply_status_change(sender, instance, created, raw=False, **kwargs):
+    # Order.cancel() updates the status in SQL and applies the change itself;
+    # this covers plain saves such as the admin change form or an API update,
+    # which may also change the total.
+    previous = None if created else instance._status_snapshot
+    previous_total = None if created else instance._total_snapshot
+    instance._status_snapshot = instance.status
+    instance._total_snapshot = instance.__dict__.get('total_amount')
+    if raw or created:
+        return
+    if previous_total is not None and instance._total_snapshot is not None:
+        # Under the old status, so a status move below takes out the new total
+        adjust_revenue(instance, previous_total, previous or instance.status)
+    if previous == instance.status:
+        return
+    items = list(instance.items.all())
+    move_orders([(instance, items)], previous, instance.status)
+    if instance.status == 'cancelled':
+        release_stock(stock_quantities(items))
+    elif previous == 'cancelled':
+        reserve_stock(stock_quantities(items))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_from_rollups(sender, instance, **kwargs):
+    # Before the cascade, while the items are still there
+    remove_orders([(instance, list(instance.items.all()))])
@@ -0,0 +1,87 @@
+"""
+Stock reservation for orders.
+
+A whole order (or batch of orders) is reserved with one conditional UPDATE::
+
+    UPDATE products_product
+       SET stock = stock - CASE WHEN id IN (7, 9) THEN 1 WHEN id IN (4) THEN 2 END
+     WHERE id IN (4, 7, 9) AND is_active AND stock >= CASE ... END
+
+The availability check and the decrement are the same statement, so two
+concurrent checkouts can never both read the same stock level and oversell
+it, and no row is locked before the write itself. If fewer rows match than
+products were requested, ``InsufficientStock`` is raised and the caller's
+``transaction.atomic()`` rolls back the rows that did match.
+"""
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Value, When
+from products.cache import bump_catalog_version
+from products.models import Product
+
+
+class InsufficientStock(Exception):
+    def __init__(self, quantities):
+        self.quantities = dict(quantities)
+        super().__init__('Insufficient stock')
+
+
+def stock_quantities(items):
+    """Total quantity per product id for ``items`` (``OrderItem`` instances)"""
+    quantities = Counter()
+    for item in items:
+        if item.product_id is not None:
+            quantities[item.product_id] += item.quantity
+    return quantities
+
+
+def _per_product(quantities):
+    # One WHEN per distinct quantity rather than per product: carts mostly
+    # repeat a handful of quantities, and "id IN (...)" is an indexed lookup,
+    # so large carts don't turn into an N-branch CASE evaluated N times.
+    by_quantity = {}
+    for pk, quantity in quantities.items():
+        by_quantity.setdefault(quantity, []).append(pk)
+    return Case(
+        *[When(pk__in=pks, then=Value(quantity)) for quantity, pks in sorted(by_quantity.items())],
+        output_field=IntegerField()
+    )
+
+
+def reserve_stock(quantities):
+    """Take ``{product_id: quantity}`` out of stock, all or nothing.
+
+    Must run inside a transaction. Raises ``InsufficientStock`` when any
+    product is missing, inactive or short.
+    """
+    if not quantities:
+        return
+    requested = _per_product(quantities)
+    reserved = Product.objects.filter(
+        pk__in=quantities, is_active=True, stock__gte=requested
+    ).update(stock=F('stock') - requested)
+    if reserved != len(quantities):
+        raise InsufficientStock(quantities)
+    # Product responses include the stock level
+    bump_catalog_version()
+
+
+def release_stock(quantities):
+    """Return ``{product_id: quantity}`` to stock"""
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=F('stock') + _per_product(quantities)
+    )
+    bump_catalog_version()
+
+
+def unavailable_products(quantities):
+    """Product ids in ``quantities`` that can't currently be reserved.
+
+    Only used to explain a failed reservation, after it was rolled back.
+    """
+    available = Product.objects.filter(
+        pk__in=quantities, is_active=True, stock__gte=_per_product(quantities)
+    ).values_list('pk', flat=True)
+    return sorted(set(quantities) - set(available))
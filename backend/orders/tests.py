@@ -1,8 +1,29 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+import time
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Order, OrderItem
+from ecomdigital.testing import QueryBudgetMixin, QueryPlanAssertionsMixin, viewset_queryset
+from products.models import Category, Product
+from products.prices import price_table
+from .models import DailyOrderRollup, DailyProductRollup, Order, OrderItem
+from .export import NDJSONRenderer, decode_cursor, export_orders, export_queryset
+from .rollups import rebuild_rollups
+from .views import OrderViewSet
 
 
 class OrderModelTest(TestCase):
@@ -42,9 +63,22 @@ class OrderItemModelTest(TestCase):
         self.assertIn("x3", str(self.order_item))
 
 
+def create_products(count, prefix="product", stock=100, price="9.99"):
+    category, _ = Category.objects.get_or_create(name="Streaming", slug="streaming")
+    return [
+        Product.objects.create(
+            name=f"{prefix} {i}", slug=f"{prefix}-{i}", description="Test",
+            price=price, category=category, stock=stock
+        )
+        for i in range(count)
+    ]
+
+
 class OrderAPITest(TestCase):
     def setUp(self):
         self.client = APIClient()
+        self.spotify, = create_products(1, prefix="spotify")
+        self.chatgpt, = create_products(1, prefix="chatgpt", price="20.00")
 
     def test_create_order(self):
         url = reverse('order-list')
@@ -53,13 +87,11 @@ class OrderAPITest(TestCase):
             "customer_email": "jane@example.com",
             "items": [
                 {
-                    "product_name": "Spotify Premium",
-                    "product_price": "9.99",
+                    "product": self.spotify.pk,
                     "quantity": 1
                 },
                 {
-                    "product_name": "ChatGPT Plus",
-                    "product_price": "20.00",
+                    "product": self.chatgpt.pk,
                     "quantity": 1
                 }
             ]
@@ -100,3 +132,721 @@ class OrderAPITest(TestCase):
         self.assertEqual(response.data['customer_email'], "john@example.com")
         self.assertEqual(len(response.data['items']), 1)
 
+
+    def test_create_order_uses_single_items_insert(self):
+        products = create_products(50, prefix="bulk", stock=10, price="1.50")
+        url = reverse('order-list')
+        data = {
+            "customer_name": "Jane Doe",
+            "customer_email": "jane@example.com",
+            "items": [
+                {"product": product.pk, "quantity": 2}
+                for product in products
+            ]
+        }
+        # price lookup, savepoint, stock reservation, order insert, items
+        # bulk insert, two rollup upserts, release, items fetch
+        with self.assertNumQueries(9):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(float(response.data['total_amount']), 150.00)
+        self.assertEqual(OrderItem.objects.count(), 50)
+
+    def test_bulk_create_orders(self):
+        url = reverse('order-bulk-create')
+        data = [
+            {
+                "customer_name": f"Customer {i}",
+                "customer_email": f"customer{i}@example.com",
+                "items": [
+                    {"product": self.spotify.pk, "quantity": i + 1},
+                    {"product": self.chatgpt.pk, "quantity": 1}
+                ]
+            }
+            for i in range(3)
+        ]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 6)
+        totals = sorted(float(order['total_amount']) for order in response.data)
+        self.assertEqual(totals, [29.99, 39.98, 49.97])
+
+    def test_bulk_create_is_all_or_nothing(self):
+        url = reverse('order-bulk-create')
+        data = [
+            {
+                "customer_name": "Valid",
+                "customer_email": "valid@example.com",
+                "items": [{"product": self.spotify.pk, "quantity": 1}]
+            },
+            {
+                "customer_name": "Invalid",
+                "customer_email": "not-an-email",
+                "items": [{"product": self.spotify.pk, "quantity": 0}]
+            }
+        ]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_bulk_create_rejects_empty_batch(self):
+        url = reverse('order-bulk-create')
+        response = self.client.post(url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(PRICE_TABLE_SIZE=100)
+class OrderPricingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product, = create_products(1, prefix="spotify", price="9.99")
+
+    def post(self, *items):
+        return self.client.post(reverse('order-list'), {
+            "customer_name": "Jane Doe",
+            "customer_email": "jane@example.com",
+            "items": list(items)
+        }, format='json')
+
+    def test_client_prices_are_ignored(self):
+        response = self.post({
+            "product": self.product.pk, "quantity": 2,
+            "product_name": "Free stuff", "product_price": "0.01"
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_amount'], '19.98')
+        item = response.data['items'][0]
+        self.assertEqual((item['product_name'], item['product_price']), ("spotify 0", "9.99"))
+
+    def test_products_by_slug(self):
+        response = self.post({"product": self.product.slug, "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['items'][0]['product'], self.product.pk)
+
+    def test_unknown_and_malformed_products(self):
+        response = self.post({"product": "no-such-product", "quantity": 1}, {"product": 999999, "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data['items']), 2)
+        response = self.post({"product": "not a slug!", "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_warm_price_table_skips_lookup(self):
+        self.post({"product": self.product.pk, "quantity": 1})
+        # savepoint, stock reservation, order insert, items insert, two rollup
+        # upserts, release, items fetch; no product lookup
+        with self.assertNumQueries(8):
+            response = self.post({"product": self.product.slug, "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_price_change_invalidates_table(self):
+        self.post({"product": self.product.pk, "quantity": 1})
+        self.product.price = "4.50"
+        self.product.save()
+        response = self.post({"product": self.product.pk, "quantity": 1})
+        self.assertEqual(response.data['items'][0]['product_price'], '4.50')
+
+    def test_price_change_bumps_again_on_commit(self):
+        self.post({"product": self.product.pk, "quantity": 1})
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.price = "4.50"
+            self.product.save()
+            # A concurrent checkout still sees the committed price and caches
+            # it under the version the save just bumped
+            Product.objects.filter(pk=self.product.pk).update(price="9.99")
+            price_table.resolve([self.product.pk])
+            Product.objects.filter(pk=self.product.pk).update(price="4.50")
+        for callback in callbacks:
+            callback()
+        response = self.post({"product": self.product.pk, "quantity": 1})
+        self.assertEqual(response.data['items'][0]['product_price'], '4.50')
+
+    def test_entries_expire(self):
+        self.post({"product": self.product.pk, "quantity": 1})
+        Product.objects.filter(pk=self.product.pk).update(price="4.50")
+        self.assertEqual(price_table.resolve([self.product.pk])[0][self.product.pk].price, Decimal('9.99'))
+        with mock.patch('products.prices.time.monotonic', return_value=time.monotonic() + 301):
+            entry = price_table.resolve([self.product.pk])[0][self.product.pk]
+        self.assertEqual(entry.price, Decimal('4.50'))
+
+    @override_settings(PRICE_TABLE_SIZE=0)
+    def test_table_off_prices_from_database(self):
+        self.post({"product": self.product.pk, "quantity": 1})
+        Product.objects.filter(pk=self.product.pk).update(price="4.50")
+        with self.assertNumQueries(1):
+            found, missing = price_table.resolve([self.product.pk, self.product.slug])
+        self.assertEqual(found[self.product.slug].price, Decimal('4.50'))
+
+
+class OrderStockTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.spotify, self.chatgpt = create_products(2, stock=5)
+
+    def order(self, *lines, email="jane@example.com"):
+        return {
+            "customer_name": "Jane Doe",
+            "customer_email": email,
+            "items": [
+                {"product": product.pk, "quantity": quantity}
+                for product, quantity in lines
+            ]
+        }
+
+    def stock(self, product):
+        product.refresh_from_db(fields=['stock'])
+        return product.stock
+
+    def test_create_reserves_stock(self):
+        response = self.client.post(
+            reverse('order-list'), self.order((self.spotify, 2), (self.chatgpt, 5)), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['items'][0]['product'], self.spotify.pk)
+        self.assertEqual(self.stock(self.spotify), 3)
+        self.assertEqual(self.stock(self.chatgpt), 0)
+
+    def test_repeated_lines_are_reserved_together(self):
+        response = self.client.post(
+            reverse('order-list'), self.order((self.spotify, 3), (self.spotify, 3)), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.stock(self.spotify), 5)
+
+    def test_short_item_rolls_back_whole_order(self):
+        response = self.client.post(
+            reverse('order-list'), self.order((self.spotify, 1), (self.chatgpt, 6)), format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['items'], [f'Product {self.chatgpt.pk} is unavailable or out of stock'])
+        self.assertEqual(self.stock(self.spotify), 5)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_inactive_and_missing_products_are_unavailable(self):
+        Product.objects.filter(pk=self.spotify.pk).update(is_active=False)
+        response = self.client.post(reverse('order-list'), self.order((self.spotify, 1)), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        data = self.order((self.chatgpt, 1))
+        data['items'][0]['product'] = 999999
+        response = self.client.post(reverse('order-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_bulk_create_reserves_across_orders(self):
+        batch = [self.order((self.spotify, 2), email=f"c{i}@example.com") for i in range(3)]
+        response = self.client.post(reverse('order-bulk-create'), batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.stock(self.spotify), 5)
+
+        response = self.client.post(reverse('order-bulk-create'), batch[:2], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.stock(self.spotify), 1)
+
+    def test_cancel_releases_stock_once(self):
+        response = self.client.post(
+            reverse('order-list'), self.order((self.spotify, 2), (self.chatgpt, 1)), format='json'
+        )
+        url = reverse('order-cancel', kwargs={'pk': response.data['id']})
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(User.objects.create_user(username='jane', password='testpass123'))
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.stock(self.spotify), 3)
+        self.client.force_authenticate(
+            User.objects.create_user(username='support', password='testpass123', is_staff=True)
+        )
+        with self.assertQueryBudget('POST order-cancel'):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'cancelled')
+        self.assertEqual(self.stock(self.spotify), 5)
+        self.assertEqual(self.stock(self.chatgpt), 5)
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.stock(self.spotify), 5)
+
+    def test_status_change_through_save_moves_stock(self):
+        response = self.client.post(reverse('order-list'), self.order((self.spotify, 2)), format='json')
+        order = Order.objects.get(pk=response.data['id'])
+        order.status = 'cancelled'
+        order.save()
+        self.assertEqual(self.stock(self.spotify), 5)
+        order.save()
+        self.assertEqual(self.stock(self.spotify), 5)
+        order.status = 'pending'
+        order.save()
+        self.assertEqual(self.stock(self.spotify), 3)
+
+    def admin_change(self, order, status):
+        item = order.items.get()
+        return self.client.post(reverse('admin:orders_order_change', args=[order.pk]), {
+            'customer_name': order.customer_name, 'customer_email': order.customer_email,
+            'total_amount': order.total_amount, 'status': status,
+            'items-TOTAL_FORMS': 1, 'items-INITIAL_FORMS': 1, 'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+            'items-0-id': item.pk, 'items-0-order': order.pk, 'items-0-product': item.product_id,
+            'items-0-product_name': item.product_name, 'items-0-product_price': item.product_price,
+            'items-0-quantity': item.quantity,
+        })
+
+    def test_admin_uncancel_without_stock_is_a_form_error(self):
+        response = self.client.post(reverse('order-list'), self.order((self.spotify, 2)), format='json')
+        order = Order.objects.get(pk=response.data['id'])
+        order.cancel()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123'))
+        Product.objects.filter(pk=self.spotify.pk).update(stock=1)
+
+        response = self.admin_change(order, 'pending')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'Not enough stock to restore this order: product 0.')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(self.stock(self.spotify), 1)
+
+        Product.objects.filter(pk=self.spotify.pk).update(stock=2)
+        self.assertEqual(self.admin_change(order, 'pending').status_code, status.HTTP_302_FOUND)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.stock(self.spotify), 0)
+
+    def test_admin_uncancel_sold_out_during_save_stays_cancelled(self):
+        response = self.client.post(reverse('order-list'), self.order((self.spotify, 2)), format='json')
+        order = Order.objects.get(pk=response.data['id'])
+        order.cancel()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123'))
+        # Stock runs out after the form validated
+        with mock.patch('orders.admin.unavailable_products', return_value=[]):
+            Product.objects.filter(pk=self.spotify.pk).update(stock=1)
+            response = self.admin_change(order, 'pending')
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(self.stock(self.spotify), 1)
+
+
+class OrderStockConcurrencyTest(TransactionTestCase):
+    """Parallel checkouts racing for the last units of one product"""
+    checkouts = 24
+    stock = 10
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a test database that allows concurrent connections')
+        self.product, = create_products(1, stock=self.stock)
+
+    def checkout(self, i):
+        try:
+            response = APIClient().post(reverse('order-list'), {
+                "customer_name": f"Customer {i}",
+                "customer_email": f"c{i}@example.com",
+                "items": [{"product": self.product.pk, "quantity": 1}]
+            }, format='json', REMOTE_ADDR=f'10.0.0.{i}')  # separate customers, separate order throttles
+            return response.status_code
+        finally:
+            connection.close()
+
+    def test_parallel_checkouts_never_oversell(self):
+        barrier = threading.Barrier(self.checkouts)
+
+        def run(i):
+            barrier.wait()
+            started = time.perf_counter()
+            code = self.checkout(i)
+            return code, time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=self.checkouts) as pool:
+            results = list(pool.map(run, range(self.checkouts)))
+
+        codes = [code for code, _ in results]
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), self.stock)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST), self.checkouts - self.stock)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).count(), self.stock)
+        # Every checkout holds the write lock for one short transaction, so
+        # none of them should queue behind the others for long.
+        self.assertLess(max(elapsed for _, elapsed in results), 5)
+
+
+class OrderCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        Order.objects.bulk_create([
+            Order(customer_name=f"Customer {i}", customer_email=f"c{i}@example.com", total_amount=i)
+            for i in range(30)
+        ])
+
+    def test_cursor_mode_walks_every_order_once(self):
+        url = reverse('order-list')
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+
+        seen = []
+        while True:
+            seen.extend(order['id'] for order in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(sorted(seen), sorted(Order.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_deep_page_costs_same_as_first(self):
+        url = reverse('order-list')
+        # page query + items prefetch, no COUNT(*)
+        with self.assertNumQueries(2):
+            first = self.client.get(url, {'pagination': 'cursor'})
+        with self.assertNumQueries(2):
+            self.client.get(first.data['next'])
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.data['count'], 30)
+
+
+class OrderQueryPlanTest(QueryPlanAssertionsMixin, TestCase):
+    def test_list_uses_index(self):
+        self.assertIndexedPlan(viewset_queryset(OrderViewSet)[:12])
+        self.assertIndexedPlan(viewset_queryset(OrderViewSet).order_by('-created_at', '-id')[:12])
+
+    def test_admin_status_filter_uses_index(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        request = RequestFactory().get('/admin/orders/order/', {'status__exact': 'pending'})
+        request.user = user
+        changelist = admin.site._registry[Order].get_changelist_instance(request)
+        self.assertIndexedPlan(changelist.queryset[:100])
+
+
+class OrderQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(5):
+            order = Order.objects.create(
+                customer_name=f"Customer {i}",
+                customer_email=f"c{i}@example.com",
+                total_amount=19.98
+            )
+            for name in ("Spotify Premium", "Netflix Premium"):
+                OrderItem.objects.create(
+                    order=order, product_name=name, product_price=9.99, quantity=1, subtotal=9.99
+                )
+        self.order = order
+        self.products = create_products(20)
+
+    def payload(self, lines):
+        return {
+            "customer_name": "Jane Doe",
+            "customer_email": "jane@example.com",
+            "items": [
+                {"product": product.pk, "quantity": 1}
+                for product in self.products[:lines]
+            ]
+        }
+
+    def test_read_endpoints_within_budget(self):
+        with self.assertQueryBudget('GET order-list'):
+            self.client.get(reverse('order-list'))
+        with self.assertQueryBudget('GET order-detail'):
+            self.client.get(reverse('order-detail', kwargs={'pk': self.order.pk}))
+
+    def test_create_endpoints_within_budget(self):
+        with self.assertQueryBudget('POST order-list'):
+            response = self.client.post(reverse('order-list'), self.payload(20), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertQueryBudget('POST order-bulk-create'):
+            response = self.client.post(
+                reverse('order-bulk-create'), [self.payload(10) for _ in range(5)], format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+def rollup_snapshot():
+    """Non-zero rollup rows, comparable across rebuilds"""
+    orders = {
+        (row.date, row.status): (row.order_count, row.units, row.revenue)
+        for row in DailyOrderRollup.objects.all() if row.order_count or row.units or row.revenue
+    }
+    products = {
+        (row.date, row.status, row.product_name): (row.units, row.revenue)
+        for row in DailyProductRollup.objects.all() if row.units or row.revenue
+    }
+    return orders, products
+
+
+class OrderRollupTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.spotify, self.chatgpt = create_products(2, stock=100)
+        self.today = timezone.localdate()
+
+    def order(self, *lines, email="jane@example.com"):
+        return {
+            "customer_name": "Jane Doe",
+            "customer_email": email,
+            "items": [{"product": product.pk, "quantity": quantity} for product, quantity in lines],
+        }
+
+    def create(self, *lines):
+        response = self.client.post(reverse('order-list'), self.order(*lines), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Order.objects.get(pk=response.data['id'])
+
+    def assertMatchesRebuild(self):
+        maintained = rollup_snapshot()
+        rebuild_rollups()
+        self.assertEqual(maintained, rollup_snapshot())
+
+    def test_checkout_is_counted(self):
+        self.create((self.spotify, 2), (self.chatgpt, 1))
+        self.create((self.spotify, 1))
+        rollup = DailyOrderRollup.objects.get()
+        self.assertEqual((rollup.date, rollup.status, rollup.order_count), (self.today, 'pending', 2))
+        self.assertEqual(str(rollup.revenue), '39.96')
+        spotify = DailyProductRollup.objects.get(product_name=self.spotify.name)
+        self.assertEqual((spotify.units, str(spotify.revenue)), (3, '29.97'))
+        self.assertMatchesRebuild()
+
+    def test_bulk_checkout_is_counted(self):
+        batch = [self.order((self.spotify, 1), (self.chatgpt, 2), email=f"c{i}@example.com") for i in range(3)]
+        response = self.client.post(reverse('order-bulk-create'), batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(DailyOrderRollup.objects.get().order_count, 3)
+        self.assertEqual(DailyProductRollup.objects.get(product_name=self.chatgpt.name).units, 6)
+        self.assertMatchesRebuild()
+
+    def test_failed_checkout_is_not_counted(self):
+        response = self.client.post(reverse('order-list'), self.order((self.spotify, 101)), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DailyOrderRollup.objects.exists())
+
+    def test_status_changes_move_orders(self):
+        cancelled = self.create((self.spotify, 2))
+        completed = self.create((self.chatgpt, 1))
+        self.client.force_authenticate(
+            User.objects.create_user(username='support', password='testpass123', is_staff=True)
+        )
+        self.client.post(reverse('order-cancel', kwargs={'pk': cancelled.pk}))
+        completed.status = 'completed'
+        completed.save()
+        counts = dict(DailyOrderRollup.objects.values_list('status', 'order_count'))
+        self.assertEqual(counts, {'pending': 0, 'cancelled': 1, 'completed': 1})
+        self.assertMatchesRebuild()
+
+    def test_cancel_moves_from_current_status(self):
+        order = self.create((self.spotify, 1))
+        stale = Order.objects.get(pk=order.pk)
+        order.status = 'completed'
+        order.save()
+        # Loaded as pending, but completed since
+        self.assertTrue(stale.cancel())
+        self.assertFalse(stale.cancel())
+        self.assertMatchesRebuild()
+
+    def test_total_changes_follow_revenue(self):
+        order = self.create((self.spotify, 2))
+        response = self.client.patch(reverse('order-detail', kwargs={'pk': order.pk}),
+                                     {'total_amount': '15.00'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(str(DailyOrderRollup.objects.get().revenue), '15.00')
+        self.assertMatchesRebuild()
+        order = Order.objects.get(pk=order.pk)
+        order.total_amount = Decimal('12.50')
+        order.status = 'completed'
+        order.save()
+        revenue = {row.status: str(row.revenue) for row in DailyOrderRollup.objects.all()}
+        self.assertEqual(revenue, {'pending': '0.00', 'completed': '12.50'})
+        self.assertMatchesRebuild()
+
+    def test_delete_removes_orders(self):
+        order = self.create((self.spotify, 1))
+        self.create((self.chatgpt, 1))
+        order.delete()
+        self.assertEqual(DailyOrderRollup.objects.get().order_count, 1)
+        self.assertMatchesRebuild()
+
+    def test_rebuild_range_leaves_other_days_alone(self):
+        old = self.create((self.spotify, 1))
+        Order.objects.filter(pk=old.pk).update(created_at=old.created_at - timedelta(days=3))
+        self.create((self.chatgpt, 1))
+        # Checkout counted the moved order under today
+        self.assertEqual(DailyOrderRollup.objects.get().order_count, 2)
+        out = StringIO()
+        call_command('rebuild_order_rollups', start=self.today, end=self.today, stdout=out)
+        self.assertIn('Rebuilt 1 daily order rollups and 1 daily product rollups', out.getvalue())
+        self.assertEqual(list(DailyOrderRollup.objects.values_list('date', 'order_count')), [(self.today, 1)])
+        rebuild_rollups(start=self.today - timedelta(days=3), end=self.today - timedelta(days=3))
+        self.assertEqual(
+            list(DailyOrderRollup.objects.values_list('date', 'order_count')),
+            [(self.today - timedelta(days=3), 1), (self.today, 1)],
+        )
+
+    def test_analytics_requires_staff(self):
+        url = reverse('order-analytics')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(User.objects.create_user(username='jane', password='testpass123'))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_analytics_reads_rollups(self):
+        self.create((self.spotify, 2), (self.chatgpt, 1))
+        cancelled = self.create((self.chatgpt, 3))
+        cancelled.cancel()
+        staff = User.objects.create_user(username='finance', password='testpass123', is_staff=True)
+        self.client.force_authenticate(staff)
+        url = reverse('order-analytics')
+
+        with self.assertQueryBudget('GET order-analytics'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['end'], self.today)
+        self.assertEqual(response.data['results'], [{'date': self.today, 'orders': 2, 'units': 6, 'revenue': '59.94'}])
+
+        response = self.client.get(url, {'group': 'status'})
+        self.assertEqual(response.data['results'], [
+            {'status': 'cancelled', 'orders': 1, 'units': 3, 'revenue': '29.97'},
+            {'status': 'pending', 'orders': 1, 'units': 3, 'revenue': '29.97'},
+        ])
+        self.assertEqual(response.data['totals'], {'orders': 2, 'units': 6, 'revenue': '59.94'})
+
+        with self.assertQueryBudget('GET order-analytics'):
+            response = self.client.get(url, {'group': 'product', 'status': 'pending,completed'})
+        self.assertEqual(response.data['results'], [
+            {'product_name': self.spotify.name, 'units': 2, 'revenue': '19.98'},
+            {'product_name': self.chatgpt.name, 'units': 1, 'revenue': '9.99'},
+        ])
+        self.assertEqual(response.data['totals'], {'units': 3, 'revenue': '29.97'})
+
+        response = self.client.get(url, {'start': self.today + timedelta(days=1), 'end': self.today + timedelta(days=7)})
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['totals'], {'orders': 0, 'units': 0, 'revenue': '0.00'})
+
+    def test_analytics_validates_parameters(self):
+        staff = User.objects.create_user(username='finance', password='testpass123', is_staff=True)
+        self.client.force_authenticate(staff)
+        url = reverse('order-analytics')
+        for params in ({'start': '2024-02-01', 'end': '2024-01-01'}, {'status': 'shipped'},
+                       {'group': 'week'}, {'start': 'yesterday'}):
+            self.assertEqual(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username='finance', password='testpass123', is_staff=True)
+        self.client.force_authenticate(self.staff)
+        self.now = timezone.now()
+        self.orders = []
+        for i, status_ in enumerate(['pending', 'completed', 'cancelled', 'completed']):
+            order = Order.objects.create(
+                customer_name=f"Customer {i}", customer_email=f"c{i}@example.com",
+                total_amount="19.98", status=status_,
+            )
+            for name in ("Spotify Premium", "Netflix, Premium"):
+                OrderItem.objects.create(
+                    order=order, product_name=name, product_price="9.99", quantity=1, subtotal="9.99"
+                )
+            self.orders.append(order)
+        # One order per day, oldest first; the last two share a timestamp
+        for i, order in enumerate(self.orders):
+            order.created_at = self.now - timedelta(days=3 - min(i, 2))
+            Order.objects.filter(pk=order.pk).update(created_at=order.created_at)
+        self.url = reverse('order-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def ndjson(self, **params):
+        return [json.loads(line) for line in self.export(**params)[1].splitlines()]
+
+    def test_requires_staff(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(User.objects.create_user(username='jane', password='testpass123'))
+        response = self.client.get(self.url, {'format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_ndjson_streams_orders_with_items(self):
+        response, _ = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        records = self.ndjson()
+        self.assertEqual([record['id'] for record in records], [order.pk for order in self.orders])
+        self.assertEqual(records[0]['total_amount'], '19.98')
+        self.assertEqual(records[0]['created_at'][-1], 'Z')
+        self.assertEqual(
+            [item['product_name'] for item in records[0]['items']], ["Spotify Premium", "Netflix, Premium"]
+        )
+
+    def test_csv_has_a_row_per_item(self):
+        response, body = self.export(format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual(rows[1]['order_id'], str(self.orders[0].pk))
+        self.assertEqual(rows[1]['item_product_name'], "Netflix, Premium")
+        self.assertEqual(rows[1]['item_product_id'], '')
+        # Accept header works as well as ?format=
+        response = self.client.get(self.url, HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_filters(self):
+        records = self.ndjson(status='completed')
+        self.assertEqual([record['id'] for record in records], [self.orders[1].pk, self.orders[3].pk])
+        today = timezone.localdate(self.now)
+        records = self.ndjson(start=today - timedelta(days=2), end=today - timedelta(days=1))
+        self.assertEqual([record['id'] for record in records], [order.pk for order in self.orders[1:]])
+
+    @mock.patch('orders.export.BLOCK_SIZE', 1)
+    async def test_streams_under_asgi(self):
+        response = await self.async_client.post(reverse('token_obtain_pair'), {
+            'username': 'finance', 'password': 'testpass123'
+        }, content_type='application/json')
+        headers = {'Authorization': f'Bearer {response.json()["access"]}'}
+        with warnings.catch_warnings():
+            # Not "StreamingHttpResponse must consume synchronous iterators..."
+            warnings.simplefilter('error')
+            response = await self.async_client.get(self.url, headers=headers)
+            self.assertTrue(response.is_async)
+            blocks = [block async for block in response.streaming_content]
+        # A block per order with BLOCK_SIZE 1
+        self.assertEqual(len(blocks), 4)
+        records = [json.loads(line) for line in b''.join(blocks).splitlines()]
+        self.assertEqual([record['id'] for record in records], [order.pk for order in self.orders])
+
+    def test_renderer_joins_blocks(self):
+        _, body = self.export()
+        rendered = NDJSONRenderer().render(export_orders(export_queryset(), 'ndjson'))
+        self.assertEqual(rendered.decode(), body)
+
+    def test_resumes_after_cursor(self):
+        records = self.ndjson()
+        # Resuming after the third order must still include the fourth,
+        # which has the same created_at
+        self.assertEqual(decode_cursor(records[2]['cursor']), (self.orders[2].created_at, self.orders[2].pk))
+        resumed = self.ndjson(after=records[2]['cursor'])
+        self.assertEqual([record['id'] for record in resumed], [self.orders[3].pk])
+        self.assertEqual(self.ndjson(after=records[3]['cursor']), [])
+
+    def test_invalid_parameters_are_json_errors(self):
+        for params in ({'after': 'not-a-cursor'}, {'status': 'shipped'}, {'format': 'csv', 'start': 'soon'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+            self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(self.client.get(self.url, {'format': 'xml'}).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_items_are_fetched_per_chunk(self):
+        queryset = Order.objects.order_by('created_at', 'id').prefetch_related('items')
+        from .export import export_orders
+        # One orders query, then one items query per chunk of two orders
+        with self.assertNumQueries(3):
+            b''.join(export_orders(queryset, 'ndjson', chunk_size=2))
+
+    def test_command_writes_export(self):
+        out = StringIO()
+        call_command('export_orders', format='csv', status='cancelled', stdout=out)
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual({row['order_id'] for row in rows}, {str(self.orders[2].pk)})
@@ -1,16 +1,30 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .models import Order
-from .serializers import OrderSerializer, OrderCreateSerializer
+from ecomdigital.renderers import JSONRenderer
+from ecomdigital.throttling import OrderThrottle, ThrottleFirstMixin
+from .export import CSVRenderer, NDJSONRenderer, aexport_orders, export_orders, export_queryset
+from .models import DailyOrderRollup, DailyProductRollup, Order
+from .serializers import (
+    OrderAnalyticsQuerySerializer, OrderExportQuerySerializer, OrderSerializer, OrderCreateSerializer,
+)
 
+# Upper bound on orders accepted by a single bulk request
+MAX_BULK_ORDERS = 100
 
-class OrderViewSet(viewsets.ModelViewSet):
+
+class OrderViewSet(ThrottleFirstMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all().prefetch_related('items')
     serializer_class = OrderSerializer
+    throttle_classes = [OrderThrottle]
 
     def get_serializer_class(self):
-        if self.action == 'create':
+        if self.action in ('create', 'bulk_create'):
             return OrderCreateSerializer
         return OrderSerializer
 
@@ -23,3 +37,96 @@ class OrderViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def cancel(self, request, pk=None):
+        """Cancel the order and return its items to stock (staff only)"""
+        order = self.get_object()
+        if not order.cancel():
+            return Response(
+                {'detail': 'Order is already cancelled.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(OrderSerializer(order).data)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """Create a batch of orders in one transaction"""
+        serializer = self.get_serializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=MAX_BULK_ORDERS
+        )
+        serializer.is_valid(raise_exception=True)
+        orders = serializer.save()
+        created = self.queryset.filter(pk__in=[order.pk for order in orders]).order_by('pk')
+        return Response(
+            OrderSerializer(created, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def analytics(self, request):
+        """Orders, revenue and units over a date range, from the daily rollups"""
+        query = OrderAnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        filters = {'date__gte': params['start'], 'date__lte': params['end']}
+        if params.get('status'):
+            filters['status__in'] = params['status']
+
+        if params['group'] == 'product':
+            # Totals come from the much smaller per-day table
+            totals = DailyOrderRollup.objects.filter(**filters).aggregate(
+                units=Sum('units'), revenue=Sum('revenue')
+            )
+            results = list(
+                DailyProductRollup.objects.filter(**filters).values('product_name')
+                .annotate(units=Sum('units'), revenue=Sum('revenue'))
+                .order_by('-revenue', 'product_name')[:params['limit']]
+            )
+        else:
+            key = 'date' if params['group'] == 'day' else 'status'
+            results = list(
+                DailyOrderRollup.objects.filter(**filters).values(key)
+                .annotate(orders=Sum('order_count'), units=Sum('units'), revenue=Sum('revenue')).order_by(key)
+            )
+            totals = {
+                name: sum(row[name] for row in results) for name in ('orders', 'units', 'revenue')
+            }
+        for row in [totals, *results]:
+            row['revenue'] = f"{row['revenue'] or 0:.2f}"
+        totals = {name: value or 0 for name, value in totals.items()}
+        return Response({
+            'start': params['start'],
+            'end': params['end'],
+            'group': params['group'],
+            'totals': totals,
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser],
+            renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream every matching order with its items as NDJSON or CSV (see orders/export.py)"""
+        query = OrderExportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        queryset = export_queryset(params['created_range'], params.get('status'), params.get('after'))
+        renderer = request.accepted_renderer
+        # ASGI servers need an async iterator to stream instead of buffering
+        stream = aexport_orders if isinstance(request._request, ASGIRequest) else export_orders
+        response = StreamingHttpResponse(
+            stream(queryset, renderer.format),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        filename = f'orders-{timezone.now():%Y%m%d-%H%M%S}.{renderer.format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def handle_exception(self, exc):
+        # Errors from the export action are reported as JSON
+        if self.action == 'export':
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
@@ -1,4 +1,13 @@
-from django.contrib import admin
+import csv
+import io
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from .importer import FEED_FORMATS, feed_format_for, import_catalog, read_feed
 from .models import Category, Product
 
 
@@ -8,6 +17,23 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+class CatalogImportForm(forms.Form):
+    feed = forms.FileField(help_text='CSV, NDJSON or JSON rows keyed by product slug')
+    format = forms.ChoiceField(
+        choices=[('', 'From the file name'), *((name, name.upper()) for name in FEED_FORMATS)],
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        feed = cleaned_data.get('feed')
+        if feed and not cleaned_data.get('format'):
+            cleaned_data['format'] = feed_format_for(feed.name)
+            if cleaned_data['format'] is None:
+                self.add_error('format', 'Cannot tell the format from the file name; pick one.')
+        return cleaned_data
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'price', 'stock', 'is_active', 'created_at']
@@ -15,4 +41,43 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ['price', 'stock', 'is_active']
+    change_list_template = 'admin/products/product/change_list.html'
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='products_product_import'),
+            *super().get_urls(),
+        ]
+
+    def import_view(self, request):
+        """Upload a supplier feed; runs it through ``products.importer`` in the request.
 
+        Large feeds are better served by the ``import_catalog`` command.
+        """
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['feed'].file, encoding='utf-8-sig', newline='')
+            try:
+                stats = import_catalog(read_feed(stream, form.cleaned_data['format']))
+            except (csv.Error, ValueError) as exc:
+                self.message_user(request, f'Cannot parse feed: {exc}', messages.ERROR)
+            else:
+                self.message_user(request, (
+                    f'Imported {stats.rows} rows: {stats.created} created, {stats.updated} updated, '
+                    f'{stats.unchanged} unchanged, {stats.categories_created} categories created.'
+                ))
+                for line, errors in sorted(stats.errors, key=lambda error: error[0])[:20]:
+                    detail = '; '.join(
+                        f'{field}: {" ".join(str(error) for error in details)}' for field, details in errors.items()
+                    )
+                    self.message_user(request, f'Line {line} rejected: {detail}', messages.WARNING)
+                return redirect(reverse('admin:products_product_changelist'))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import products',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/products/product/import.html', context)
@@ -0,0 +1,176 @@
+"""
+Versioned response cache for the read-only catalog endpoints.
+
+Cached responses are keyed on the catalog version and the full request URL.
+Any write to the catalog bumps the version, which orphans every cached entry
+at once instead of deleting keys one by one.
+"""
+import hashlib
+import math
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_catalog_version():
+    """Return the current catalog version (the time of the last write)"""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY, time.time())
+    return version
+
+
+async def _cache_call(cache, method, *args):
+    # LocMemCache does no I/O, and its a*() methods only move the call to a
+    # worker thread, so call it inline on the event loop.
+    if isinstance(cache, LocMemCache):
+        return getattr(cache, method)(*args)
+    return await getattr(cache, f'a{method}')(*args)
+
+
+async def aget_catalog_version():
+    """Async ``get_catalog_version``"""
+    cache = get_cache()
+    version = await _cache_call(cache, 'get', VERSION_KEY)
+    if version is None:
+        await _cache_call(cache, 'add', VERSION_KEY, time.time(), None)
+        version = await _cache_call(cache, 'get', VERSION_KEY, time.time())
+    return version
+
+
+def _bump():
+    get_cache().set(VERSION_KEY, time.time(), None)
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response.
+
+    The version is bumped immediately and again once the surrounding
+    transaction commits, so a response rendered from pre-commit data can
+    never outlive the write.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+def _url_digest(request):
+    # Sort the query string so equivalent URLs share one entry
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def _timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+
+
+def _last_modified(version):
+    """HTTP date (whole seconds) for ``version``, or ``None`` while it is too fresh.
+
+    The date is rounded up, and left out until its second is over: a write
+    later in the same second would otherwise share it, and clients that only
+    send ``If-Modified-Since`` would get a stale 304. Until then the ETag
+    alone validates.
+    """
+    last_modified = math.ceil(version)
+    return last_modified if last_modified <= time.time() else None
+
+
+def _validators(request, version):
+    tag = f'{_url_digest(request)}-{version:.6f}'
+    return f'catalog:{tag}', quote_etag(tag), _last_modified(version)
+
+
+def cache_catalog_response(view_method):
+    """Serve a viewset action from the catalog cache.
+
+    Successful responses are cached until the next catalog write and carry
+    ETag/Last-Modified validators; matching conditional requests get a 304
+    without touching the cache or the database. Works on sync and async
+    actions alike.
+    """
+    if iscoroutinefunction(view_method):
+        @wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            key, etag, last_modified = _validators(request, await aget_catalog_version())
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return _set_validators(not_modified, etag, last_modified)
+
+            cache = get_cache()
+            data = await _cache_call(cache, 'get', key)
+            if data is None:
+                response = await view_method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                await _cache_call(cache, 'set', key, response.data, _timeout())
+            else:
+                response = Response(data)
+            return _set_validators(response, etag, last_modified)
+
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key, etag, last_modified = _validators(request, get_catalog_version())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return _set_validators(not_modified, etag, last_modified)
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is None:
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, _timeout())
+        else:
+            response = Response(data)
+        return _set_validators(response, etag, last_modified)
+
+    return wrapper
+
+
+class CatalogCacheMixin:
+    """Caches ``list``/``retrieve`` and their async twins on a read-only viewset"""
+
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @cache_catalog_response
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+    @cache_catalog_response
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
@@ -0,0 +1,186 @@
+"""
+Resized derivatives of product images.
+
+Product grids only need small images, so every uploaded ``Product.image``
+gets a ``thumb`` and a ``card`` rendition, each as WebP and JPEG. Each one
+is stored under a name derived from a hash of the original's bytes and the
+rendition's settings (``products/derived/<hash>-card.webp``). A name
+therefore always holds the same bytes and can be cached forever. Uploading
+the same picture twice reuses the files already written.
+
+``Product.image_variants`` records what was built, keyed by size:
+``{"card": {"width": 480, "height": 270, "webp": <name>, "jpeg": <name>}}``.
+The serializers turn the names into URLs.
+
+Saving a product with a new image schedules the work once the transaction
+commits. It runs on a per-process pool of ``IMAGE_WORKERS`` threads, so
+the request returns without waiting. Pillow releases the GIL while it
+decodes, resizes and encodes, so the threads run in parallel. The
+``build_image_derivatives`` command backfills existing products on a
+process pool.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+from .cache import bump_catalog_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = 'products/derived'
+
+# Size name -> bounding box in pixels; images are never enlarged
+SIZES = {
+    'thumb': 160,
+    'card': 480,
+}
+
+# Format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# What Pillow and storage raise for a missing file or an unreadable image
+IMAGE_ERRORS = (OSError, Image.DecompressionBombError, SyntaxError, ValueError)
+
+# Part of every derivative's hash: bump it when rendering changes so the
+# new files get new names
+RENDER_VERSION = 1
+
+
+def image_storage():
+    return Product._meta.get_field('image').storage
+
+
+def derivative_name(source_hash, size, fmt):
+    """Storage name of one derivative of an original hashed as ``source_hash``"""
+    extension, options = FORMATS[fmt]
+    spec = f'{RENDER_VERSION}:{SIZES[size]}:{sorted(options.items())}'
+    digest = source_hash.copy()
+    digest.update(spec.encode())
+    return f'{DERIVED_DIR}/{digest.hexdigest()[:32]}-{size}.{extension}'
+
+
+def render(image, fmt):
+    """Encode an RGB or RGBA ``image`` as ``fmt``"""
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        # JPEG has no alpha channel: composite over white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, **FORMATS[fmt][1])
+    return buffer.getvalue()
+
+
+def build_derivatives(name, storage=None):
+    """Render and store every derivative of the image stored as ``name``.
+
+    Files that already exist under their content-hashed names are not
+    written again. Returns the ``image_variants`` map.
+    """
+    storage = storage or image_storage()
+    with storage.open(name, 'rb') as original:
+        source = original.read()
+    source_hash = hashlib.sha256(source)
+
+    image = Image.open(io.BytesIO(source))
+    # Lets the JPEG decoder scale by up to 1/8 while decoding, which is most
+    # of the cost for a multi-megapixel original
+    largest = max(SIZES.values())
+    image.draft(image.mode, (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    variants = {}
+    # Largest first, each resized from the one before
+    for size, box in sorted(SIZES.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((box, box), Image.LANCZOS, reducing_gap=3.0)
+        variant = {'width': image.width, 'height': image.height}
+        for fmt in FORMATS:
+            derived = derivative_name(source_hash, size, fmt)
+            if not storage.exists(derived):
+                derived = storage.save(derived, ContentFile(render(image, fmt)))
+            variant[fmt] = derived
+        variants[size] = variant
+    return {size: variants[size] for size in SIZES}
+
+
+def store_derivatives(product_id, name, variants):
+    """Record ``variants`` if the product still has the image ``name``"""
+    updated = Product.objects.filter(pk=product_id, image=name).update(image_variants=variants)
+    if updated:
+        bump_catalog_version()
+    return bool(updated)
+
+
+def process_image(product_id, name):
+    """Build and record the derivatives of one product's image"""
+    try:
+        variants = build_derivatives(name)
+    except IMAGE_ERRORS:
+        logger.exception('Cannot build derivatives of %s for product %s', name, product_id)
+        variants = {}
+    return store_derivatives(product_id, name, variants)
+
+
+def variant_urls(variants, url):
+    """``variants`` with every stored name passed through ``url``"""
+    return {
+        size: {key: url(value) if key in FORMATS else value for key, value in variant.items()}
+        for size, variant in (variants or {}).items()
+    }
+
+
+class ImagePool:
+    def __init__(self, workers=None):
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def workers(self):
+        return self._workers if self._workers is not None else settings.IMAGE_WORKERS
+
+    def _get_executor(self):
+        # Started on first use, and again in forked children, which don't
+        # inherit the parent's threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='images')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, product_id, name):
+        close_old_connections()
+        try:
+            process_image(product_id, name)
+        except Exception:
+            logger.exception('Failed to store derivatives of %s for product %s', name, product_id)
+        finally:
+            close_old_connections()
+
+    def submit(self, product_id, name):
+        """Build the derivatives on the pool, or right here with no workers"""
+        if not self.workers:
+            return process_image(product_id, name)
+        return self._get_executor().submit(self._run, product_id, name)
+
+    def schedule(self, product_id, name):
+        """``submit`` once the current transaction commits"""
+        transaction.on_commit(lambda: self.submit(product_id, name))
+
+
+image_pool = ImagePool()
@@ -0,0 +1,82 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from products.cache import bump_catalog_version
+from products.images import IMAGE_ERRORS, build_derivatives
+from products.models import Product
+
+
+def build(job):
+    """Worker process: ``(product_id, name, variants or None)``"""
+    product_id, name = job
+    try:
+        return product_id, name, build_derivatives(name)
+    except IMAGE_ERRORS:
+        return product_id, name, None
+
+
+class Command(BaseCommand):
+    help = 'Builds the resized WebP/JPEG derivatives of existing product images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Worker processes (default: one per core); 1 builds in this process'
+        )
+        parser.add_argument('--force', action='store_true', help='Rebuild products that already have derivatives')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products recorded per transaction')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_variants={})
+        jobs = list(products.order_by('pk').values_list('pk', 'image'))
+        if not jobs:
+            self.stdout.write('No product images to process')
+            return
+
+        workers = options['workers']
+        if workers > 1:
+            # Children are forked and must not share the parent's connections;
+            # they only touch storage, and results are recorded here
+            connections.close_all()
+            pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            pool = nullcontext()
+        started = time.perf_counter()
+        done = failed = 0
+        batch = []
+        with pool:
+            if workers > 1:
+                results = pool.map(build, jobs, chunksize=max(1, min(32, len(jobs) // (workers * 4))))
+            else:
+                results = map(build, jobs)
+            for product_id, name, variants in results:
+                if variants is None:
+                    failed += 1
+                    self.stderr.write(f'\n  product {product_id}: cannot read {name}')
+                batch.append((product_id, name, variants or {}))
+                if len(batch) >= options['batch_size']:
+                    self.record(batch)
+                    batch = []
+                done += 1
+                rate = done / max(time.perf_counter() - started, 1e-9)
+                self.stdout.write(f'\r  images: {done}/{len(jobs)} ({rate:,.1f} images/s)', ending='')
+        self.record(batch)
+        bump_catalog_version()
+        self.stdout.write('')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Built derivatives for {done - failed} images in {elapsed:.1f}s ({failed} failed)'
+        ))
+
+    def record(self, batch):
+        # Products whose image changed meanwhile are left to the upload path
+        with transaction.atomic():
+            for product_id, name, variants in batch:
+                Product.objects.filter(pk=product_id, image=name).update(image_variants=variants)
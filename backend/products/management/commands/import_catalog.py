@@ -0,0 +1,74 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import BATCH_SIZE, FEED_FORMATS, feed_format_for, import_catalog, read_feed
+
+
+class Command(BaseCommand):
+    help = 'Creates and updates products from a CSV, NDJSON or JSON supplier feed, matched by slug'
+
+    def add_arguments(self, parser):
+        parser.add_argument('feed', help='Feed file to import, or - for stdin')
+        parser.add_argument(
+            '--format', choices=FEED_FORMATS,
+            help='Feed format; defaults to the file extension (.csv, .ndjson/.jsonl, .json)'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per transaction')
+        parser.add_argument(
+            '--defer-index', action='store_true',
+            help='Rebuild the search index once at the end instead of row by row (SQLite)'
+        )
+        parser.add_argument('--max-errors', type=int, default=20, help='Rejected rows to list')
+
+    def handle(self, *args, **options):
+        feed_format = options['format'] or feed_format_for(options['feed'])
+        if feed_format is None:
+            raise CommandError('Cannot tell the feed format from the file name; pass --format')
+
+        started = time.perf_counter()
+
+        def progress(stats):
+            rate = stats.rows / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(
+                f'\r  rows: {stats.rows} (created {stats.created}, updated {stats.updated}, '
+                f'unchanged {stats.unchanged}, rejected {len(stats.errors)}; {rate:,.0f} rows/s)',
+                ending=''
+            )
+
+        if options['feed'] == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(options['feed'], encoding='utf-8-sig', newline='')
+            except OSError as exc:
+                raise CommandError(f'Cannot read {options["feed"]}: {exc.strerror}')
+        try:
+            stats = import_catalog(
+                read_feed(stream, feed_format), options['batch_size'], options['defer_index'], progress
+            )
+        except (csv.Error, ValueError) as exc:
+            # Malformed CSV or JSON array, or not UTF-8; batches before it are committed
+            raise CommandError(f'Cannot parse feed: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write('')
+
+        for line, errors in sorted(stats.errors, key=lambda error: error[0])[:options['max_errors']]:
+            detail = '; '.join(
+                f'{field}: {" ".join(str(error) for error in messages)}' for field, messages in errors.items()
+            )
+            self.stderr.write(f'  line {line}: {detail}')
+        if len(stats.errors) > options['max_errors']:
+            self.stderr.write(f'  ... and {len(stats.errors) - options["max_errors"]} more rejected rows')
+        timings = ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in stats.timings.items())
+        self.stdout.write(f'Timings: {timings}')
+        summary = (
+            f'Imported {stats.rows} rows in {time.perf_counter() - started:.1f}s: '
+            f'{stats.created} created, {stats.updated} updated, {stats.unchanged} unchanged, '
+            f'{len(stats.errors)} rejected, {stats.categories_created} categories created'
+        )
+        style = self.style.WARNING if stats.errors else self.style.SUCCESS
+        self.stdout.write(style(summary))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from products.cache import bump_catalog_version
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to rebuild the index on'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        backend = get_search_backend()
+        self.stdout.write(f'Rebuilding search index with {type(backend).__name__}...')
+        backend.install(connection)
+        backend.rebuild(connection)
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -1,11 +1,91 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from orders.models import Order, OrderItem
+from products.cache import bump_catalog_version
 from products.models import Category, Product
+from reviews.models import Review
+
+WORDS = tuple((
+    'premium pro plus ultra cloud studio music video stream ai smart creative '
+    'suite office focus sync vault secure fast global family team business '
+    'starter lite max prime edge flow spark nova pulse zen orbit'
+).split())
+
+LOREM = tuple((
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod '
+    'tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam '
+    'quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum'
+).split())
+
+# Star ratings skew positive, as they do in real review data
+RATING_WEIGHTS = [(1, 0.06), (2, 0.07), (3, 0.15), (4, 0.30), (5, 0.42)]
+
+# Taken (product, user) pairs drawn in a row before the remaining free pairs
+# are listed and drawn from directly
+MAX_REVIEW_MISSES = 1000
+
+
+def restore_created_at(model, objects, values):
+    """Write the generated ``created_at`` values back to rows just created.
+
+    ``bulk_create`` replaces them with the current time (``auto_now_add``),
+    so they go in with one prepared ``UPDATE`` per row.
+    """
+    field = model._meta.get_field('created_at')
+    quote = connection.ops.quote_name
+    sql = f'UPDATE {quote(model._meta.db_table)} SET {quote(field.column)} = %s WHERE {quote("id")} = %s'
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (field.get_db_prep_save(value, connection), obj.pk) for obj, value in zip(objects, values)
+        ])
+    for obj, value in zip(objects, values):
+        obj.created_at = value
+
+
+class ZipfSampler:
+    """Draws indexes in [0, n) with probability proportional to 1 / rank**s"""
+
+    def __init__(self, rng, n, s=1.1):
+        self.rng = rng
+        weights = [1 / (rank ** s) for rank in range(1, n + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def sample(self):
+        return self.rng.choices(range(len(self.cumulative)), cum_weights=self.cumulative)[0]
 
 
 class Command(BaseCommand):
-    help = 'Seeds the database with sample products'
+    help = 'Seeds the database with sample products, or a large synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=0, help='Synthetic categories to create')
+        parser.add_argument('--products', type=int, default=0, help='Synthetic products to create')
+        parser.add_argument('--users', type=int, default=0, help='Synthetic users to create')
+        parser.add_argument('--reviews', type=int, default=0, help='Synthetic reviews to create')
+        parser.add_argument('--orders', type=int, default=0, help='Synthetic orders to create')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; same seed, same data')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk_create chunk')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days')
 
     def handle(self, *args, **options):
+        scale = [options[name] for name in ('categories', 'products', 'users', 'reviews', 'orders')]
+        if any(scale):
+            self.seed_synthetic(options)
+        else:
+            self.seed_sample()
+
+    def seed_sample(self):
         self.stdout.write('Creating categories...')
         
         # Create categories
@@ -107,3 +187,231 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS('Database seeded successfully!'))
 
+
+    def seed_synthetic(self, options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        self.corpora = {words: self.build_corpus(words) for words in (WORDS, LOREM)}
+        started = time.perf_counter()
+
+        categories = self.create_categories(options['categories'])
+        products = self.create_products(options['products'], categories)
+        users = self.create_users(options['users'])
+        self.create_reviews(options['reviews'], products, users)
+        self.create_orders(options['orders'], products)
+
+        if options['reviews']:
+            call_command('rebuild_rating_aggregates', stdout=self.stdout)
+        if options['orders']:
+            call_command('rebuild_order_rollups', stdout=self.stdout)
+        bump_catalog_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Synthetic dataset created in {elapsed:.1f}s'))
+
+    def random_time(self):
+        # Recent activity is denser than old activity
+        age = self.days * (self.rng.random() ** 2)
+        return self.now - timedelta(days=age)
+
+    def build_corpus(self, words, size=50000):
+        """Random text plus word offsets, so text() is a single slice"""
+        corpus = ' '.join(self.rng.choices(words, k=size))
+        offsets = [0] + [i + 1 for i, char in enumerate(corpus) if char == ' ']
+        return corpus, offsets
+
+    def text(self, words, min_words, max_words):
+        corpus, offsets = self.corpora[words]
+        length = self.rng.randint(min_words, max_words)
+        start = self.rng.randrange(len(offsets) - length - 1)
+        return corpus[offsets[start]:offsets[start + length] - 1]
+
+    def bulk_insert(self, model, rows, total):
+        """bulk_create ``rows`` in chunks, one transaction per chunk"""
+        label = model._meta.verbose_name_plural
+        started = time.perf_counter()
+        created = []
+        done = 0
+        iterator = iter(rows)
+        while True:
+            chunk = list(itertools.islice(iterator, self.batch_size))
+            if not chunk:
+                break
+            timestamped = model is not User
+            if timestamped:
+                created_at = [obj.created_at for obj in chunk]
+            with transaction.atomic():
+                chunk = model.objects.bulk_create(chunk)
+                if timestamped:
+                    restore_created_at(model, chunk, created_at)
+            created.extend(chunk)
+            done += len(chunk)
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'\r  {label}: {done}/{total} ({rate:,.0f} rows/s)', ending='')
+        self.stdout.write('')
+        return created
+
+    def create_categories(self, count):
+        existing = list(Category.objects.all())
+        if not count:
+            return existing
+        offset = Category.objects.count()
+        rows = (
+            Category(
+                name=f'{self.text(WORDS, 1, 2).title()} {offset + i}',
+                slug=f'category-{offset + i}',
+                description=self.text(LOREM, 8, 20),
+                created_at=self.random_time(),
+            )
+            for i in range(count)
+        )
+        return existing + self.bulk_insert(Category, rows, count)
+
+    def create_products(self, count, categories):
+        if not count:
+            return list(Product.objects.only('id', 'name', 'price'))
+        if not categories:
+            categories = self.create_categories(1)
+        # A few categories hold most of the catalog
+        category_sampler = ZipfSampler(self.rng, len(categories), s=0.8)
+        offset = Product.objects.count()
+        rows = (
+            Product(
+                name=f'{self.text(WORDS, 2, 3).title()} {offset + i}',
+                slug=f'product-{offset + i}',
+                description=self.text(LOREM, 30, 120),
+                price=Decimal(self.rng.randint(99, 19999)) / 100,
+                category=categories[category_sampler.sample()],
+                stock=self.rng.randint(0, 1000),
+                is_active=self.rng.random() > 0.05,
+                created_at=self.random_time(),
+            )
+            for i in range(count)
+        )
+        return self.bulk_insert(Product, rows, count)
+
+    def create_users(self, count):
+        if not count:
+            return list(User.objects.values_list('id', flat=True))
+        # Hash once: PBKDF2 per user would dominate the run time
+        password = make_password('seedpass123')
+        offset = User.objects.count()
+        rows = (
+            User(
+                username=f'seed_user_{offset + i}',
+                email=f'seed_user_{offset + i}@example.com',
+                first_name=self.rng.choice(WORDS).title(),
+                last_name=self.rng.choice(WORDS).title(),
+                password=password,
+            )
+            for i in range(count)
+        )
+        return [user.id for user in self.bulk_insert(User, rows, count)]
+
+    def create_reviews(self, count, products, user_ids):
+        if not count:
+            return
+        if not products or not user_ids:
+            self.stdout.write(self.style.WARNING('Skipping reviews: no products or users'))
+            return
+        product_ids = [product.id for product in products]
+        seen = set(Review.objects.values_list('product_id', 'user_id'))
+        # Pairs already reviewed, e.g. by an earlier --reviews run, aren't free
+        wanted_products, wanted_users = set(product_ids), set(user_ids)
+        taken = sum(1 for product_id, user_id in seen if product_id in wanted_products and user_id in wanted_users)
+        free = len(product_ids) * len(user_ids) - taken
+        if count > free:
+            self.stdout.write(self.style.WARNING(f'Only {free} product/user pairs left: creating {free} reviews'))
+            count = free
+        if not count:
+            return
+        product_sampler = ZipfSampler(self.rng, len(products))
+        ratings, rating_weights = zip(*RATING_WEIGHTS)
+
+        def pairs():
+            misses = 0
+            while misses < MAX_REVIEW_MISSES:
+                pair = (product_ids[product_sampler.sample()], self.rng.choice(user_ids))
+                if pair in seen:
+                    misses += 1
+                    continue
+                misses = 0
+                seen.add(pair)
+                yield pair
+            # Close to every pair taken: sampling would mostly miss
+            remaining = [
+                (product_id, user_id) for product_id in product_ids for user_id in user_ids
+                if (product_id, user_id) not in seen
+            ]
+            self.rng.shuffle(remaining)
+            yield from remaining
+
+        def rows():
+            for product_id, user_id in itertools.islice(pairs(), count):
+                yield Review(
+                    product_id=product_id,
+                    user_id=user_id,
+                    rating=self.rng.choices(ratings, weights=rating_weights)[0],
+                    title=self.text(WORDS, 2, 6).capitalize(),
+                    comment=self.text(LOREM, 20, 400),
+                    created_at=self.random_time(),
+                )
+
+        self.bulk_insert(Review, rows(), count)
+
+    def create_orders(self, count, products):
+        if not count:
+            return
+        if not products:
+            self.stdout.write(self.style.WARNING('Skipping orders: no products'))
+            return
+        product_sampler = ZipfSampler(self.rng, len(products))
+        statuses = ['pending', 'completed', 'completed', 'completed', 'cancelled']
+        started = time.perf_counter()
+        done = 0
+        while done < count:
+            size = min(self.batch_size, count - done)
+            carts = []
+            orders = []
+            for i in range(size):
+                # Geometric cart sizes: most carts are small, a few are large
+                lines = 1
+                while lines < 50 and self.rng.random() < 0.45:
+                    lines += 1
+                items = []
+                total = Decimal('0.00')
+                for product_index in {product_sampler.sample() for _ in range(lines)}:
+                    product = products[product_index]
+                    quantity = self.rng.choice([1, 1, 1, 2, 3])
+                    subtotal = product.price * quantity
+                    total += subtotal
+                    items.append(OrderItem(
+                        product=product,
+                        product_name=product.name,
+                        product_price=product.price,
+                        quantity=quantity,
+                        subtotal=subtotal,
+                    ))
+                orders.append(Order(
+                    customer_name=f'Customer {done + i}',
+                    customer_email=f'customer{done + i}@example.com',
+                    total_amount=total,
+                    status=self.rng.choice(statuses),
+                    created_at=self.random_time(),
+                ))
+                carts.append(items)
+            created_at = [order.created_at for order in orders]
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                restore_created_at(Order, orders, created_at)
+                for order, items in zip(orders, carts):
+                    for item in items:
+                        item.order = order
+                OrderItem.objects.bulk_create(
+                    [item for items in carts for item in items], batch_size=self.batch_size
+                )
+            done += size
+            rate = done / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'\r  orders: {done}/{count} ({rate:,.0f} orders/s)', ending='')
+        self.stdout.write('')
@@ -26,15 +26,59 @@ class Product(models.Model):
         validators=[MinValueValidator(0)]
     )
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized copies of image, built by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
     stock = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized review aggregates, maintained by reviews.signals
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-created_at']
+        # Partial indexes: the storefront only ever lists active products,
+        # and a bare boolean WHERE can't use a leading is_active column.
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'], name='product_active_created_idx',
+                condition=models.Q(is_active=True)
+            ),
+            models.Index(
+                fields=['price'], name='product_active_price_idx',
+                condition=models.Q(is_active=True)
+            ),
+            models.Index(
+                fields=['name'], name='product_active_name_idx',
+                condition=models.Q(is_active=True)
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def compute_average_rating(rating_sum, rating_count):
+        if not rating_count:
+            return 0
+        return round(rating_sum / rating_count, 2)
+
+    @property
+    def average_rating(self):
+        return self.compute_average_rating(self.rating_sum, self.rating_count)
+
+    @property
+    def rating_histogram(self):
+        return {
+            star: getattr(self, f'rating_{star}_count')
+            for star in range(1, 6)
+        }
+
@@ -0,0 +1,140 @@
+"""
+In-process price table used to price order items.
+
+Checkout resolves every line item's product (by id or slug) to its current
+name and price. Entries are kept in a per-process dict so a warm cart costs
+no queries at all, and anything missing is fetched with one query for the
+whole cart.
+
+The table is tagged with a version stored in the shared cache. Saving or
+deleting a product bumps the version, again once the transaction commits,
+and every worker drops its table the next time it sees the new version.
+QuerySet.update() bypasses signals; callers changing prices that way must
+call ``invalidate_prices()`` themselves. Entries are also dropped after
+``PRICE_TABLE_TTL`` seconds, which bounds the damage of a missed bump.
+
+A local-memory cache can't carry the version between workers, so the table
+is off by default with one (``PRICE_TABLE_SIZE`` is 0) and every cart is
+priced with one query.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from .cache import get_cache
+from .models import Product
+
+VERSION_KEY = 'catalog:prices:version'
+
+PriceEntry = namedtuple('PriceEntry', ['id', 'slug', 'name', 'price'])
+
+
+def get_prices_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY, time.time())
+    return version
+
+
+def _bump():
+    get_cache().set(VERSION_KEY, time.time(), None)
+
+
+def invalidate_prices():
+    """Make every worker drop its price table.
+
+    Bumped now and again once the surrounding transaction commits, so a
+    price read by a concurrent checkout before the commit can't be kept
+    under the new version.
+    """
+    _bump()
+    transaction.on_commit(_bump)
+
+
+class PriceTable:
+    def __init__(self, max_entries=None, ttl=None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = None
+        self._by_id = {}
+        self._by_slug = {}
+
+    @property
+    def max_entries(self):
+        return self._max_entries if self._max_entries is not None else settings.PRICE_TABLE_SIZE
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else settings.PRICE_TABLE_TTL
+
+    def _clear(self):
+        self._by_id = {}
+        self._by_slug = {}
+        self._expires = None
+
+    def _sync(self):
+        version = get_prices_version()
+        expired = self._expires is not None and time.monotonic() >= self._expires
+        if version != self._version or expired:
+            with self._lock:
+                self._clear()
+                self._version = version
+
+    def _fetch(self, ids, slugs):
+        rows = Product.objects.filter(Q(pk__in=ids) | Q(slug__in=slugs)).values_list(
+            'id', 'slug', 'name', 'price'
+        )
+        entries = [PriceEntry(*row) for row in rows]
+        if not self.max_entries:
+            return entries
+        with self._lock:
+            if len(self._by_id) + len(entries) > self.max_entries:
+                self._clear()
+            if self._expires is None:
+                # Nothing in the table outlives the first entry by more than the TTL
+                self._expires = time.monotonic() + self.ttl
+            for entry in entries:
+                self._by_id[entry.id] = entry
+                self._by_slug[entry.slug] = entry
+        return entries
+
+    def resolve(self, refs):
+        """Map product ids and slugs in ``refs`` to ``PriceEntry`` objects.
+
+        Returns ``(found, missing)``: a dict keyed by the original reference
+        and the references that don't name any product. At most one query is
+        run, however many references there are.
+        """
+        if self.max_entries:
+            self._sync()
+            by_id, by_slug = self._by_id, self._by_slug
+        else:
+            by_id = by_slug = {}
+        found = {}
+        ids, slugs = set(), set()
+        for ref in refs:
+            entry = by_slug.get(ref) if isinstance(ref, str) else by_id.get(ref)
+            if entry is not None:
+                found[ref] = entry
+            elif isinstance(ref, str):
+                slugs.add(ref)
+            else:
+                ids.add(ref)
+        if ids or slugs:
+            for entry in self._fetch(ids, slugs):
+                if entry.id in ids:
+                    found[entry.id] = entry
+                if entry.slug in slugs:
+                    found[entry.slug] = entry
+        missing = [ref for ref in dict.fromkeys(refs) if ref not in found]
+        return found, missing
+
+
+price_table = PriceTable()
@@ -0,0 +1,225 @@
+"""
+Full-text search over product names and descriptions.
+
+The backend is picked from the database vendor: an FTS5 index kept in sync by
+triggers on SQLite, a GIN-indexed ``tsvector`` expression on PostgreSQL, and a
+plain ``icontains`` scan everywhere else. ``PRODUCT_SEARCH_BACKEND`` can name a
+backend class explicitly.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+from .models import Product
+
+SEARCH_FIELDS = ('name', 'description')
+
+
+class SearchBackend:
+    """Base class for product search backends"""
+
+    def install(self, connection):
+        """Create or repair the index structures (idempotent)"""
+
+    def rebuild(self, connection):
+        """Re-index every product from scratch"""
+
+    def suspend(self, connection):
+        """Stop maintaining the index row by row until the next ``install``"""
+
+    def search(self, queryset, terms, rank=True):
+        """Filter ``queryset`` to rows matching every term.
+
+        When ``rank`` is true the result is ordered by relevance.
+        """
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Unindexed fallback matching DRF's SearchFilter semantics"""
+
+    def search(self, queryset, terms, rank=True):
+        conditions = [
+            reduce(operator.or_, [
+                models.Q(**{f'{field}__icontains': term}) for field in SEARCH_FIELDS
+            ])
+            for term in terms
+        ]
+        return queryset.filter(reduce(operator.and_, conditions))
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 external-content index over ``products_product``"""
+
+    table = 'products_product_fts'
+    # bm25 column weights: a hit in the name outranks one in the description
+    weights = (10.0, 1.0)
+
+    def install(self, connection):
+        table = self.table
+        source = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table]
+            )
+            created = cursor.fetchone() is None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                f"name, description, content='{source}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            # Table rebuilds during migrations drop triggers, so always
+            # recreate them and re-index if any had gone missing.
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{table}_%']
+            )
+            missing = cursor.fetchone()[0] < 3
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN "
+                f"INSERT INTO {table}(rowid, name, description) "
+                f"VALUES (new.id, new.name, new.description); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} BEGIN "
+                f"INSERT INTO {table}({table}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF name, description "
+                f"ON {source} BEGIN "
+                f"INSERT INTO {table}({table}, rowid, name, description) "
+                f"VALUES ('delete', old.id, old.name, old.description); "
+                f"INSERT INTO {table}(rowid, name, description) "
+                f"VALUES (new.id, new.name, new.description); END"
+            )
+        if created or missing:
+            self.rebuild(connection)
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def suspend(self, connection):
+        # install() finds the triggers missing, recreates them and re-indexes
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {self.table}_{suffix}")
+
+    def build_query(self, terms):
+        # Quote every term so user input can't inject FTS5 syntax, and match
+        # it as a prefix so "spot" finds "Spotify".
+        tokens = [re.sub(r'\W+', ' ', term).strip() for term in terms]
+        return ' AND '.join(f'"{token}"*' for token in tokens if token)
+
+    def search(self, queryset, terms, rank=True):
+        match = self.build_query(terms)
+        if not match:
+            return queryset.none()
+        table = self.table
+        queryset = queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", (match,))
+        )
+        if not rank:
+            return queryset
+        source = Product._meta.db_table
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f"SELECT bm25({table}, {weights}) FROM {table} "
+                f"WHERE {table} MATCH %s AND rowid = {source}.id",
+                (match,)
+            )
+        ).order_by('search_rank', '-created_at')
+
+
+class PostgresSearchBackend(SearchBackend):
+    """``tsvector`` search backed by a GIN expression index"""
+
+    config = 'english'
+    index_name = 'products_product_search_gin'
+
+    def _vector(self):
+        from django.contrib.postgres.search import SearchVector
+        return SearchVector(*SEARCH_FIELDS, config=self.config)
+
+    def install(self, connection):
+        # Must match the expression SearchVector compiles to so the planner
+        # can use the index.
+        source = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.index_name} ON {source} USING GIN ("
+                f"to_tsvector('{self.config}'::regconfig, "
+                f"COALESCE(name, '') || ' ' || COALESCE(description, '')))"
+            )
+
+    def rebuild(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"REINDEX INDEX {self.index_name}")
+
+    def search(self, queryset, terms, rank=True):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        tokens = [re.sub(r'\W+', ' ', term).strip() for term in terms]
+        raw = ' & '.join(
+            f'{word}:*' for token in tokens for word in token.split()
+        )
+        if not raw:
+            return queryset.none()
+        query = SearchQuery(raw, search_type='raw', config=self.config)
+        queryset = queryset.annotate(search_vector=self._vector()).filter(search_vector=query)
+        if not rank:
+            return queryset
+        return queryset.annotate(
+            search_rank=SearchRank(models.F('search_vector'), query)
+        ).order_by('-search_rank', '-created_at')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connection.vendor, LikeSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def install_search_index(using='default', **kwargs):
+    """post_migrate hook: make sure the index and its triggers exist"""
+    from django.db import connections
+    connection = connections[using]
+    if Product._meta.db_table not in connection.introspection.table_names():
+        return
+    get_search_backend().install(connection)
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by the configured full-text backend.
+
+    Results are ranked by relevance unless the client asked for an explicit
+    ``?ordering=``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        ordering_param = filters.OrderingFilter.ordering_param
+        rank = not request.query_params.get(ordering_param)
+        return get_search_backend().search(queryset, terms, rank=rank)
@@ -1,14 +1,16 @@
 from rest_framework import serializers
+from ecomdigital.serializers import ModelSerializer
+from .images import image_storage, variant_urls
 from .models import Category, Product
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -18,15 +20,19 @@ class ProductSerializer(serializers.ModelSerializer):
         allow_null=True
     )
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'price',
-            'image', 'image_url', 'category', 'category_id',
-            'stock', 'is_active', 'created_at', 'updated_at'
+            'image', 'image_url', 'image_variants', 'category', 'category_id',
+            'stock', 'is_active', 'average_rating', 'rating_count',
+            'rating_histogram', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['rating_count', 'created_at', 'updated_at']
 
     def get_image_url(self, obj):
         if obj.image:
@@ -36,3 +42,10 @@ class ProductSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        storage = image_storage()
+        if request:
+            return variant_urls(obj.image_variants, lambda name: request.build_absolute_uri(storage.url(name)))
+        return variant_urls(obj.image_variants, storage.url)
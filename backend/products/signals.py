@@ -0,0 +1,57 @@
+from django.db.models import DEFERRED
+from django.db.models.signals import post_init, post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .cache import bump_catalog_version
+from .images import image_pool
+from .models import Category, Product
+from .prices import invalidate_prices
+
+
+# Admin edits (including ProductAdmin.list_editable) go through Model.save()
+# and land here. QuerySet.update() bypasses signals, so callers doing raw
+# bulk writes must call bump_catalog_version() (and invalidate_prices() for
+# price changes) themselves.
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_price_table(sender, raw=False, **kwargs):
+    # Product saves are rare admin edits, so any save drops the price tables
+    # rather than tracking which fields changed.
+    if not raw:
+        invalidate_prices()
+
+
+def _image_name(instance):
+    # Read from __dict__ so a deferred image column isn't loaded
+    value = instance.__dict__.get('image', DEFERRED)
+    return getattr(value, 'name', value)
+
+
+@receiver(post_init, sender=Product)
+def remember_image(sender, instance, **kwargs):
+    # Snapshot the persisted image so a save can tell whether it changed
+    instance._image_snapshot = _image_name(instance) if instance.pk else None
+
+
+@receiver(pre_save, sender=Product)
+def drop_stale_variants(sender, instance, raw=False, **kwargs):
+    # A new or removed image must not keep the old one's thumbnails
+    name = _image_name(instance)
+    if not raw and name is not DEFERRED and name != instance._image_snapshot:
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    name = _image_name(instance)
+    previous, instance._image_snapshot = instance._image_snapshot, name
+    if not raw and name and name is not DEFERRED and name != previous:
+        image_pool.schedule(instance.pk, name)
@@ -1,8 +1,34 @@
-from django.test import TestCase
-from django.urls import reverse
-from rest_framework.test import APIClient
+import json
+import os
+import shutil
+import tempfile
+import threading
+from io import BytesIO, StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework import status
+from ecomdigital.pagination import CreatedAtCursorPagination
+from ecomdigital.testing import (
+    AsyncViewsMixin, QueryBudgetMixin, QueryPlanAssertionsMixin, async_views_urlconf, viewset_queryset,
+)
+from .images import ImagePool, image_storage
+from .importer import import_catalog, read_feed
+from .lean import LeanProductSerializer, readable_fields
 from .models import Category, Product
+from .search import get_search_backend
+from .serializers import ProductSerializer
+from .views import CategoryViewSet, ProductViewSet
 
 
 class CategoryModelTest(TestCase):
@@ -129,3 +155,711 @@ class CategoryAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], "Streaming Services")
 
+
+
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(
+            name="Streaming Services",
+            slug="streaming-services"
+        )
+        self.product = Product.objects.create(
+            name="Spotify Premium",
+            slug="spotify-premium",
+            description="Premium music streaming service",
+            price=9.99,
+            category=self.category,
+            stock=100,
+            is_active=True
+        )
+
+    def test_repeat_request_served_from_cache(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_query_string_is_part_of_key(self):
+        url = reverse('product-list')
+        self.client.get(url, {'search': 'Spotify'})
+        response = self.client.get(url, {'search': 'Netflix'})
+        self.assertEqual(len(response.data['results']), 0)
+
+    def test_product_save_invalidates(self):
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        self.client.get(url)
+        self.product.price = 12.49
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(float(response.data['price']), 12.49)
+
+    def test_category_delete_invalidates(self):
+        url = reverse('category-list')
+        self.assertEqual(len(self.client.get(url).data['results']), 1)
+        self.category.delete()
+        self.assertEqual(len(self.client.get(url).data['results']), 0)
+
+    def test_conditional_request_returns_not_modified(self):
+        url = reverse('product-featured')
+        response = self.client.get(url)
+        self.assertIn('ETag', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = response['ETag']
+        Product.objects.get(pk=self.product.pk).save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_never_repeats_across_writes(self):
+        url = reverse('product-featured')
+        clock = mock.patch('products.cache.time.time')
+        now = clock.start()
+        self.addCleanup(clock.stop)
+
+        now.return_value = 100.2
+        self.product.save()
+        response = self.client.get(url)
+        # Still in the version's second: a later write could share the date
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('ETag', response)
+
+        now.return_value = 100.7
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(100))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        now.return_value = 101.5
+        response = self.client.get(url)
+        self.assertEqual(response['Last-Modified'], http_date(101))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        now.return_value = 101.7
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(101))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AsyncCatalogViewsTest(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="Streaming",
+                price=5 + i, category=self.category, image=f"products/product-{i}.png"
+            )
+            for i in range(15)
+        ]
+
+    def test_catalog_routes_are_async(self):
+        for name, kwargs in [
+            ('product-list', {}), ('product-featured', {}), ('category-list', {}),
+            ('product-detail', {'pk': 1}), ('category-detail', {'pk': 1}),
+        ]:
+            with self.subTest(name=name):
+                url = reverse(name, kwargs=kwargs)
+                self.assertTrue(iscoroutinefunction(resolve(url).func))
+                # The WSGI URLconf keeps the sync views
+                self.assertFalse(iscoroutinefunction(resolve(url, 'ecomdigital.urls').func))
+
+    async def async_get(self, url, params):
+        return await self.async_client.get(url, params)
+
+    def test_async_responses_match_sync(self):
+        product = self.products[0]
+        requests = [
+            (reverse('product-list'), {}),
+            (reverse('product-list'), {'page': 2, 'fields': 'id,name,image'}),
+            (reverse('product-list'), {'pagination': 'cursor', 'search': 'streaming', 'ordering': 'price'}),
+            (reverse('product-featured'), {}),
+            (reverse('product-detail', kwargs={'pk': product.pk}), {}),
+            (reverse('category-list'), {}),
+            (reverse('category-detail', kwargs={'pk': self.category.pk}), {}),
+        ]
+        for url, params in requests:
+            with self.subTest(url=url, params=params):
+                cache.clear()
+                async_response = async_to_sync(self.async_get)(url, params)
+                cache.clear()
+                with override_settings(ROOT_URLCONF='ecomdigital.urls'):
+                    sync_response = self.client.get(url, params)
+                self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+                self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+
+    async def test_async_errors(self):
+        missing = reverse('product-detail', kwargs={'pk': 999999})
+        self.assertEqual((await self.async_client.get(missing)).status_code, status.HTTP_404_NOT_FOUND)
+        invalid = reverse('product-list')
+        response = await self.async_client.get(invalid, {'page': 99})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.async_client.get(invalid, {'fields': 'nope'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await self.async_client.post(invalid, {})
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    async def test_async_conditional_request(self):
+        url = reverse('product-featured')
+        response = await self.async_client.get(url)
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_bad_credentials_rejected_on_public_reads(self):
+        # As under WSGI
+        url = reverse('product-list')
+        response = await self.async_client.get(url, headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with override_settings(ROOT_URLCONF='ecomdigital.urls'):
+            response = await sync_to_async(self.client.get)(url, HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_initial_checks_run_off_the_event_loop(self):
+        threads = []
+        initial = ProductViewSet.initial
+
+        def record_thread(view, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return initial(view, *args, **kwargs)
+
+        with mock.patch.object(ProductViewSet, 'initial', record_thread):
+            response = await self.async_client.get(reverse('product-list'), {'search': 'streaming'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product-list')
+        self.category = Category.objects.create(name="AI Tools", slug="ai-tools")
+        self.in_description = Product.objects.create(
+            name="Notion Pro",
+            slug="notion-pro",
+            description="Workspace with a built-in assistant",
+            price=8.00,
+            category=self.category
+        )
+        self.in_name = Product.objects.create(
+            name="Assistant Plus",
+            slug="assistant-plus",
+            description="Advanced AI assistant with priority access",
+            price=20.00,
+            category=self.category
+        )
+
+    def search(self, term, **params):
+        response = self.client.get(self.url, {'search': term, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['slug'] for product in response.data['results']]
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search('notio'), ['notion-pro'])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('assistant priority'), ['assistant-plus'])
+        self.assertEqual(self.search('assistant missingword'), [])
+
+    def test_ranked_by_relevance(self):
+        self.assertEqual(self.search('assistant'), ['assistant-plus', 'notion-pro'])
+
+    def test_explicit_ordering_overrides_rank(self):
+        self.assertEqual(self.search('assistant', ordering='price'), ['notion-pro', 'assistant-plus'])
+
+    def test_cursor_pages_need_explicit_ordering(self):
+        response = self.client.get(self.url, {'search': 'assistant', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pagination', response.data)
+        self.assertEqual(
+            self.search('assistant', ordering='price', pagination='cursor'), ['notion-pro', 'assistant-plus']
+        )
+
+    def test_syntax_characters_are_escaped(self):
+        self.assertEqual(self.search('"notion OR*'), [])
+        self.assertEqual(self.search('notion)'), ['notion-pro'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.in_description.name = "Obsidian Sync"
+        self.in_description.save()
+        self.assertEqual(self.search('notion'), [])
+        self.assertEqual(self.search('obsidian'), ['notion-pro'])
+
+        self.in_name.delete()
+        self.assertEqual(self.search('assistant'), ['notion-pro'])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('assistant'), ['assistant-plus', 'notion-pro'])
+
+
+class ProductQueryPlanTest(QueryPlanAssertionsMixin, TestCase):
+    def test_list_orderings_use_index(self):
+        for ordering in [None, 'created_at', 'price', '-price', 'name', '-name']:
+            with self.subTest(ordering=ordering):
+                params = {'ordering': ordering} if ordering else {}
+                queryset = viewset_queryset(ProductViewSet, query_params=params)
+                self.assertIndexedPlan(queryset[:12])
+
+    def test_featured_uses_index(self):
+        queryset = viewset_queryset(ProductViewSet, action='featured')
+        self.assertIndexedPlan(queryset[:8])
+
+    def test_category_list_uses_index(self):
+        self.assertIndexedPlan(viewset_queryset(CategoryViewSet))
+
+
+class ProductQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for i in range(3):
+            category = Category.objects.create(name=f"Category {i}", slug=f"category-{i}")
+            for j in range(4):
+                Product.objects.create(
+                    name=f"Product {i}-{j}",
+                    slug=f"product-{i}-{j}",
+                    description="Streaming service",
+                    price=5 + j,
+                    category=category
+                )
+        self.product = Product.objects.first()
+        cache.clear()
+
+    def test_list_endpoints_within_budget(self):
+        with self.assertQueryBudget('GET product-list'):
+            self.client.get(reverse('product-list'), {'search': 'streaming', 'ordering': 'price'})
+        with self.assertQueryBudget('GET product-featured'):
+            self.client.get(reverse('product-featured'))
+        with self.assertQueryBudget('GET category-list'):
+            self.client.get(reverse('category-list'))
+
+    def test_detail_endpoints_within_budget(self):
+        with self.assertQueryBudget('GET product-detail'):
+            self.client.get(reverse('product-detail', kwargs={'pk': self.product.pk}))
+        with self.assertQueryBudget('GET category-detail'):
+            self.client.get(reverse('category-detail', kwargs={'pk': self.product.category_id}))
+
+
+class SyntheticSeedTest(TestCase):
+    options = dict(categories=3, products=40, users=6, reviews=60, orders=15, seed=7)
+
+    def seed(self, **overrides):
+        call_command('seed_data', stdout=StringIO(), **{**self.options, **overrides})
+
+    def snapshot(self):
+        from orders.models import OrderItem
+        from reviews.models import Review
+        return (
+            list(Product.objects.order_by('name').values_list('name', 'price', 'stock', 'is_active')),
+            sorted(Review.objects.values_list('product__name', 'user__username', 'rating')),
+            sorted(OrderItem.objects.values_list('order__customer_email', 'product_name', 'quantity')),
+        )
+
+    def reset(self):
+        from django.contrib.auth.models import User
+        from orders.models import Order
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        User.objects.all().delete()
+
+    def test_creates_requested_rows(self):
+        from orders.models import Order
+        from reviews.models import Review
+        self.seed()
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Review.objects.count(), 60)
+        self.assertEqual(Order.objects.count(), 15)
+        self.assertTrue(Order.objects.filter(items__isnull=False).exists())
+
+    def test_created_at_spread_without_touching_fields(self):
+        from orders.models import Order
+        from reviews.models import Review
+        self.seed(days=30)
+        for model in (Category, Product, Order, Review):
+            dates = set(model.objects.values_list('created_at__date', flat=True))
+            self.assertGreater(len(dates), 1, model.__name__)
+            self.assertTrue(model._meta.get_field('created_at').auto_now_add)
+
+    def test_reviews_stop_at_free_pairs(self):
+        from reviews.models import Review
+        self.seed(products=4, users=5, reviews=15, orders=0)
+        # 20 pairs, 15 taken: a second run can only add 5
+        out = StringIO()
+        call_command('seed_data', stdout=out, **{**self.options, 'categories': 0, 'products': 0,
+                                                  'users': 0, 'reviews': 50, 'orders': 0})
+        self.assertIn('Only 5 product/user pairs left', out.getvalue())
+        self.assertEqual(Review.objects.count(), 20)
+        call_command('seed_data', stdout=out, **{**self.options, 'categories': 0, 'products': 0,
+                                                  'users': 0, 'reviews': 5, 'orders': 0})
+        self.assertEqual(Review.objects.count(), 20)
+
+    def test_aggregates_match_reviews(self):
+        self.seed()
+        product = Product.objects.order_by('-rating_count').first()
+        ratings = list(product.reviews.values_list('rating', flat=True))
+        self.assertEqual(product.rating_count, len(ratings))
+        self.assertEqual(product.rating_sum, sum(ratings))
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        first = self.snapshot()
+        self.reset()
+        self.seed()
+        self.assertEqual(self.snapshot(), first)
+
+    def test_different_seed_different_data(self):
+        self.seed()
+        first = self.snapshot()
+        self.reset()
+        self.seed(seed=8)
+        self.assertNotEqual(self.snapshot()[0], first[0])
+
+
+class LeanProductSerializerTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Streaming", slug="streaming", description="Música")
+        Product.objects.create(
+            name="Spotify Premium", slug="spotify-premium", description="Ad-free ♫",
+            price="9.90", category=category, stock=100, image="products/spötify logo.png",
+            rating_count=3, rating_sum=11, rating_4_count=1, rating_3_count=0, rating_5_count=2
+        )
+        Product.objects.filter(slug="spotify-premium").update(image_variants={
+            'thumb': {'width': 160, 'height': 90, 'webp': 'products/derived/ab-thumb.webp',
+                      'jpeg': 'products/derived/ab-thumb.jpg'},
+        })
+        Product.objects.create(
+            name="Orphan", slug="orphan", description="No category", price="1234567.89",
+            category=None, stock=0, rating_count=3, rating_sum=7
+        )
+        self.request = Request(APIRequestFactory().get('/api/products/'))
+
+    def render_both(self, fields):
+        queryset = Product.objects.select_related('category').order_by('-created_at', '-id')
+        context = {'request': self.request}
+        full = ProductSerializer(queryset, many=True, context=context).data
+        expected = [{name: row[name] for name in fields} for row in full]
+        rows = LeanProductSerializer.values_queryset(queryset, fields)
+        lean = LeanProductSerializer(rows, fields=fields, context=context).data
+        return JSONRenderer().render(expected), JSONRenderer().render(lean)
+
+    def test_matches_product_serializer_byte_for_byte(self):
+        expected, lean = self.render_both(readable_fields())
+        self.assertEqual(lean, expected)
+
+    def test_matches_in_other_timezones(self):
+        with self.settings(TIME_ZONE='Asia/Kathmandu'):
+            expected, lean = self.render_both(('created_at', 'updated_at'))
+        self.assertIn(b'+05:45', lean)
+        self.assertEqual(lean, expected)
+
+    def test_sparse_fields_match(self):
+        for fields in [('id',), ('name', 'price'), ('category', 'image_url', 'average_rating', 'created_at')]:
+            with self.subTest(fields=fields):
+                expected, lean = self.render_both(fields)
+                self.assertEqual(lean, expected)
+
+    def test_list_endpoint_accepts_fields(self):
+        response = APIClient().get(reverse('product-list'), {'fields': 'price,name'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Serializer order, not request order
+        self.assertEqual(list(response.data['results'][0]), ['name', 'price'])
+
+        response = APIClient().get(reverse('product-list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields_with_cursor_pagination(self):
+        client = APIClient()
+        for ordering, expected in [('price', ['Spotify Premium', 'Orphan']), ('-name', ['Spotify Premium', 'Orphan'])]:
+            with mock.patch.object(CreatedAtCursorPagination, 'page_size', 1):
+                response = client.get(
+                    reverse('product-list'), {'fields': 'name', 'pagination': 'cursor', 'ordering': ordering}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['results'], [{'name': expected[0]}])
+                response = client.get(response.data['next'])
+            self.assertEqual(response.data['results'], [{'name': expected[1]}])
+            self.assertIsNone(response.data['next'])
+
+    def test_cursor_pages_break_ties_by_id(self):
+        category = Category.objects.get()
+        for i in range(5):
+            Product.objects.create(name=f"Tied {i}", slug=f"tied-{i}", price="5.00", category=category)
+        seen = []
+        url, params = reverse('product-list'), {'fields': 'id,price', 'pagination': 'cursor', 'ordering': 'price'}
+        with mock.patch.object(CreatedAtCursorPagination, 'page_size', 2), \
+                CaptureQueriesContext(connection) as queries:
+            while url:
+                response = APIClient().get(url, params)
+                seen.extend(row['id'] for row in response.data['results'])
+                url, params = response.data['next'], {}
+        self.assertIn('"products_product"."price" ASC, "products_product"."id" ASC', queries[-1]['sql'])
+        tied = list(Product.objects.filter(price="5.00").order_by('id').values_list('id', flat=True))
+        self.assertEqual(seen[:5], tied)
+        self.assertEqual(len(seen), Product.objects.count())
+
+    def test_sparse_fields_trim_select(self):
+        rows = LeanProductSerializer.values_queryset(Product.objects.all(), ('name',))
+        self.assertNotIn('description', str(rows.query))
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Streaming", slug="streaming")
+        self.spotify = Product.objects.create(
+            name="Spotify Premium", slug="spotify-premium", description="Music", price="9.99",
+            category=self.category, stock=100, rating_count=2, rating_sum=9,
+        )
+        self.netflix = Product.objects.create(
+            name="Netflix Premium", slug="netflix-premium", description="Video", price="15.99",
+            category=self.category, stock=75,
+        )
+
+    def run_import(self, rows, **kwargs):
+        return import_catalog(enumerate(rows, start=1), **kwargs)
+
+    def test_creates_updates_and_skips(self):
+        updated_at = Product.objects.get(pk=self.netflix.pk).updated_at
+        stats = self.run_import([
+            {'slug': 'spotify-premium', 'price': '10.99', 'stock': 90},
+            {'slug': 'netflix-premium', 'name': 'Netflix Premium', 'price': '15.99'},
+            {'slug': 'chatgpt-plus', 'name': 'ChatGPT Plus', 'price': '20', 'category': 'ai-tools',
+             'category_name': 'AI Tools'},
+        ])
+        self.assertEqual((stats.rows, stats.created, stats.updated, stats.unchanged), (3, 1, 1, 1))
+        self.assertEqual(stats.categories_created, 1)
+        spotify = Product.objects.get(pk=self.spotify.pk)
+        self.assertEqual((str(spotify.price), spotify.stock, spotify.name), ('10.99', 90, 'Spotify Premium'))
+        # Fields the feed doesn't set are left alone
+        self.assertEqual((spotify.rating_count, spotify.description), (2, 'Music'))
+        self.assertGreater(spotify.updated_at, updated_at)
+        self.assertEqual(Product.objects.get(pk=self.netflix.pk).updated_at, updated_at)
+        chatgpt = Product.objects.get(slug='chatgpt-plus')
+        self.assertEqual((chatgpt.category.name, chatgpt.is_active, chatgpt.stock), ('AI Tools', True, 0))
+        self.assertEqual(set(stats.timings), {'read', 'categories', 'diff', 'write', 'invalidate'})
+
+    def test_rejected_rows(self):
+        Category.objects.create(name="AI Tools", slug="ai")
+        stats = self.run_import([
+            {'slug': 'not a slug', 'name': 'Bad', 'price': '1'},
+            {'slug': 'new-product', 'name': 'No price'},
+            {'slug': 'spotify-premium', 'price': '-1'},
+            {'slug': 'spotify-premium', 'stock': 1},
+            {'slug': 'spotify-premium', 'stock': 2},
+            {'slug': 'gpt', 'name': 'GPT', 'price': '1', 'category': 'gpt', 'category_name': 'AI Tools'},
+            ['not', 'an', 'object'],
+        ])
+        self.assertEqual(sorted(line for line, _ in stats.errors), [1, 2, 3, 5, 6, 7])
+        self.assertIn('price', dict(stats.errors)[2])
+        self.assertEqual(stats.updated, 1)
+        self.assertFalse(Product.objects.filter(slug__in=['new-product', 'gpt']).exists())
+        self.assertFalse(Category.objects.filter(slug='gpt').exists())
+
+    def test_batches_and_queries(self):
+        rows = [
+            {'slug': f'product-{i}', 'name': f'Product {i}', 'price': '1.00', 'category': f'category-{i % 2}'}
+            for i in range(10)
+        ]
+        self.run_import(rows)
+        for row in rows[:5]:
+            row['price'] = '2.00'
+        for row in rows[8:]:
+            row['name'] += ' v2'
+        # The category map, then per batch of 4 a savepoint, the slug lookup,
+        # one UPDATE per set of changed fields and the release
+        with self.assertNumQueries(1 + 3 * 4):
+            stats = self.run_import(rows, batch_size=4)
+        self.assertEqual((stats.updated, stats.unchanged), (7, 3))
+        self.assertEqual(Product.objects.filter(price='2.00').count(), 5)
+
+    def test_invalidates_caches_once(self):
+        with mock.patch('products.importer.bump_catalog_version') as bump, \
+                mock.patch('products.importer.invalidate_prices') as invalidate:
+            self.run_import([{'slug': 'spotify-premium', 'price': '10.99'}])
+            self.run_import([{'slug': f'p-{i}', 'name': 'P', 'price': '1'} for i in range(5)], batch_size=2)
+            self.assertEqual((bump.call_count, invalidate.call_count), (2, 2))
+            self.run_import([{'slug': 'spotify-premium', 'price': '10.99'}])
+            self.assertEqual((bump.call_count, invalidate.call_count), (2, 2))
+
+    def test_search_index_follows_import(self):
+        for defer_index in (False, True):
+            with self.subTest(defer_index=defer_index):
+                self.run_import([
+                    {'slug': 'spotify-premium', 'name': f'Spotify Family {defer_index}'},
+                    {'slug': 'tidal', 'name': f'Tidal HiFi {defer_index}', 'price': '10'},
+                ], defer_index=defer_index)
+                results = get_search_backend().search(Product.objects.all(), [f'{defer_index}'])
+                self.assertEqual({product.slug for product in results}, {'spotify-premium', 'tidal'})
+                # Per-row maintenance is back after a deferred import
+                Product.objects.filter(slug='tidal').update(name='Tidal Lossless')
+                self.assertTrue(get_search_backend().search(Product.objects.all(), ['lossless']).exists())
+
+    def test_feed_formats(self):
+        feeds = {
+            'csv': 'slug,name,price,stock,is_active\nspotify-premium,,,5,false\nnew-one,"New, One",3.50,,\n',
+            'ndjson': '{"slug": "spotify-premium", "stock": 5, "is_active": false}\n\n'
+                      '{"slug": "new-one", "name": "New, One", "price": "3.50"}\nnot json\n',
+            'json': '[{"slug": "spotify-premium", "stock": 5, "is_active": false},'
+                    ' {"slug": "new-one", "name": "New, One", "price": 3.5}]',
+        }
+        for feed_format, text in feeds.items():
+            with self.subTest(feed_format=feed_format):
+                Product.objects.filter(slug='new-one').delete()
+                Product.objects.filter(pk=self.spotify.pk).update(stock=100, is_active=True)
+                stats = import_catalog(read_feed(StringIO(text), feed_format))
+                self.assertEqual((stats.created, stats.updated), (1, 1))
+                spotify = Product.objects.get(pk=self.spotify.pk)
+                self.assertEqual((spotify.stock, spotify.is_active), (5, False))
+                self.assertEqual(Product.objects.get(slug='new-one').name, 'New, One')
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('slug,price\nspotify-premium,11.00\nunknown,1\n')
+        self.addCleanup(os.unlink, feed.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', feed.name, stdout=out, stderr=err)
+        self.assertIn('1 updated, 0 unchanged, 1 rejected', out.getvalue())
+        self.assertIn('line 3: name: Required for a new product.', err.getvalue())
+        self.assertEqual(str(Product.objects.get(pk=self.spotify.pk).price), '11.00')
+        with self.assertRaisesMessage(CommandError, 'pass --format'):
+            call_command('import_catalog', 'feed.txt', stdout=out)
+
+    def test_admin_import(self):
+        from django.contrib.auth.models import User
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        url = reverse('admin:products_product_import')
+        self.assertContains(self.client.get(reverse('admin:products_product_changelist')), url)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        feed = SimpleUploadedFile('feed.ndjson', b'{"slug": "netflix-premium", "price": "17.99"}\n')
+        response = self.client.post(url, {'feed': feed}, follow=True)
+        self.assertContains(response, '1 updated')
+        self.assertEqual(str(Product.objects.get(pk=self.netflix.pk).price), '17.99')
+
+        self.client.force_login(User.objects.create_user('clerk', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+def image_file(name='photo.jpg', size=(1200, 800), mode='RGB', color=(200, 30, 30), fmt='JPEG'):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new(mode, size, color).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(IMAGE_WORKERS=0)
+class ProductImageDerivativesTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.category = Category.objects.create(name="Streaming", slug="streaming")
+
+    def create(self, slug, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name=slug.title(), slug=slug, description="", price="9.99", category=self.category, image=image,
+            )
+        product.refresh_from_db()
+        return product
+
+    def test_upload_builds_derivatives(self):
+        from PIL import Image
+        product = self.create('spotify', image_file())
+        variants = product.image_variants
+        self.assertEqual(list(variants), ['thumb', 'card'])
+        self.assertEqual((variants['card']['width'], variants['card']['height']), (480, 320))
+        self.assertEqual((variants['thumb']['width'], variants['thumb']['height']), (160, 107))
+        storage = image_storage()
+        for variant in variants.values():
+            self.assertRegex(variant['webp'], r'^products/derived/[0-9a-f]{32}-(thumb|card)\.webp$')
+            for fmt, expected in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with storage.open(variant[fmt]) as derived:
+                    image = Image.open(derived)
+                    self.assertEqual((image.format, image.size), (expected, (variant['width'], variant['height'])))
+
+    def test_names_are_content_hashed(self):
+        first = self.create('first', image_file('a.jpg')).image_variants
+        # Same bytes under another upload name: same derivatives, no new files
+        with mock.patch('products.images.render', side_effect=AssertionError('re-rendered')):
+            self.assertEqual(self.create('second', image_file('b.jpg')).image_variants, first)
+        other = self.create('third', image_file(color=(0, 0, 255))).image_variants
+        self.assertNotEqual(other['card']['jpeg'], first['card']['jpeg'])
+
+    def test_transparent_png(self):
+        from PIL import Image
+        product = self.create('logo', image_file('logo.png', (300, 600), 'RGBA', (0, 0, 0, 0), 'PNG'))
+        card = product.image_variants['card']
+        self.assertEqual((card['width'], card['height']), (240, 480))
+        with image_storage().open(card['webp']) as webp, image_storage().open(card['jpeg']) as jpeg:
+            self.assertEqual(Image.open(webp).mode, 'RGBA')
+            # Flattened onto white
+            self.assertEqual(Image.open(jpeg).convert('RGB').getpixel((10, 10)), (255, 255, 255))
+
+    def test_only_image_changes_rebuild(self):
+        product = self.create('spotify', image_file())
+        with mock.patch('products.signals.image_pool.submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=product.pk)
+            product.price = '10.99'
+            product.save()
+            Product.objects.only('id', 'price').get(pk=product.pk).save()
+        submit.assert_not_called()
+
+        product.image = image_file('new.jpg', color=(0, 255, 0))
+        with mock.patch('products.signals.image_pool.submit') as submit, \
+                self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        submit.assert_called_once_with(product.pk, product.image.name)
+        # The old image's variants are gone until the new ones are built
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+
+        product.image = None
+        product.save()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, {})
+
+    def test_unreadable_image(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        with self.assertLogs('products.images', 'ERROR'):
+            product = self.create('broken', SimpleUploadedFile('broken.jpg', b'not an image'))
+        self.assertEqual(product.image_variants, {})
+
+    def test_serializers_return_urls(self):
+        product = self.create('spotify', image_file())
+        response = APIClient().get(reverse('product-detail', kwargs={'pk': product.pk}))
+        card = response.data['image_variants']['card']
+        self.assertEqual(card['width'], 480)
+        self.assertEqual(card['webp'], f"http://testserver/media/{product.image_variants['card']['webp']}")
+        rows = LeanProductSerializer.values_queryset(Product.objects.all(), ('image_variants',))
+        lean = LeanProductSerializer(rows, fields=('image_variants',), context={'request': response.wsgi_request})
+        self.assertEqual(lean.data[0]['image_variants'], response.data['image_variants'])
+
+    def test_pool_runs_off_thread(self):
+        with mock.patch('products.images.process_image') as process:
+            future = ImagePool(workers=2).submit(7, 'products/a.jpg')
+            future.result()
+        self.assertIsNotNone(future)
+        process.assert_called_once_with(7, 'products/a.jpg')
+
+    def test_backfill_command(self):
+        product = self.create('spotify', image_file())
+        built = product.image_variants
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        with mock.patch('products.management.commands.build_image_derivatives.bump_catalog_version') as bump:
+            call_command('build_image_derivatives', workers=1, stdout=StringIO())
+        bump.assert_called_once()
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, built)
+        out = StringIO()
+        call_command('build_image_derivatives', workers=1, stdout=out)
+        self.assertIn('No product images', out.getvalue())
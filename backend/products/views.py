@@ -1,32 +1,81 @@
-from rest_framework import viewsets, filters
+from rest_framework import filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from ecomdigital.async_views import AsyncReadOnlyModelViewSet
+from ecomdigital.throttling import SearchThrottle, ThrottleFirstMixin
+from .cache import CatalogCacheMixin, cache_catalog_response
+from .lean import LeanProductSerializer, parse_fields
 from .models import Category, Product
+from .search import ProductSearchFilter
 from .serializers import CategorySerializer, ProductSerializer
 
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, AsyncReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(ThrottleFirstMixin, CatalogCacheMixin, AsyncReadOnlyModelViewSet):
     queryset = Product.objects.filter(is_active=True).select_related('category')
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    throttle_classes = [SearchThrottle]
+    # Ordering runs first so search can replace it with relevance ranking
+    filter_backends = [filters.OrderingFilter, ProductSearchFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'created_at', 'name']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def get_lean_serializer(self, rows, fields):
+        return LeanProductSerializer(rows, fields=fields, context=self.get_serializer_context())
+
+    def lean_queryset(self, request):
+        fields = parse_fields(request)
+        queryset = LeanProductSerializer.values_queryset(
+            self.filter_queryset(self.get_queryset()), fields
+        )
+        return fields, queryset
+
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        """List products, optionally trimmed with ``?fields=``.
+
+        Rows are rendered from ``.values()`` by LeanProductSerializer, which
+        produces the same JSON as ProductSerializer without building model
+        instances.
+        """
+        fields, queryset = self.lean_queryset(request)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_lean_serializer(page, fields).data)
+        return Response(self.get_lean_serializer(queryset, fields).data)
+
+    @cache_catalog_response
+    async def alist(self, request, *args, **kwargs):
+        fields, queryset = self.lean_queryset(request)
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_lean_serializer(page, fields).data)
+        rows = [row async for row in queryset]
+        return Response(self.get_lean_serializer(rows, fields).data)
+
+    def featured_queryset(self, request):
+        fields = parse_fields(request)
+        return fields, LeanProductSerializer.values_queryset(self.get_queryset(), fields)[:8]
+
     @action(detail=False, methods=['get'])
+    @cache_catalog_response
     def featured(self, request):
         """Get featured products"""
-        featured_products = self.queryset[:8]
-        serializer = self.get_serializer(featured_products, many=True)
-        return Response(serializer.data)
+        fields, queryset = self.featured_queryset(request)
+        return Response(self.get_lean_serializer(queryset, fields).data)
 
+    @cache_catalog_response
+    async def afeatured(self, request):
+        fields, queryset = self.featured_queryset(request)
+        rows = [row async for row in queryset]
+        return Response(self.get_lean_serializer(rows, fields).data)
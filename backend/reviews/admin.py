@@ -5,6 +5,7 @@ from .models import Review
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['user', 'product', 'rating', 'title', 'created_at']
+    list_select_related = ['user', 'product']
     list_filter = ['rating', 'created_at', 'product']
     search_fields = ['title', 'comment', 'user__username', 'product__name']
     readonly_fields = ['created_at', 'updated_at']
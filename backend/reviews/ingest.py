@@ -0,0 +1,258 @@
+"""
+Write-behind review ingestion.
+
+With ``REVIEW_WRITE_BEHIND`` on, ``POST /api/reviews/`` validates the review,
+puts it on this worker's queue and answers ``202`` with a submission id. A
+background thread takes up to ``REVIEW_BATCH_SIZE`` queued reviews at a time,
+or whatever arrived within ``REVIEW_BATCH_INTERVAL`` seconds of the first,
+and commits them together: one transaction, one multi-row INSERT, and one
+aggregate UPDATE per product. On SQLite, where every write transaction takes
+the database lock, a launch-day burst costs a few commits instead of one per
+review.
+
+A review can still lose a race between being queued and being written: its
+author may have reviewed the product through another worker, or the product
+may have been deleted. ``write_reviews`` drops those rows and writes the rest.
+The client polls its submission id to find out which happened.
+
+A batch that fails for any other reason (the database is locked or down) is
+retried ``REVIEW_WRITE_RETRIES`` times with a growing delay. The reviews were
+already acknowledged, so if every attempt fails they are appended to the
+dead-letter file ``REVIEW_DEAD_LETTER_PATH`` instead of being dropped. The
+``replay_review_dead_letters`` command writes them once the database is back.
+
+The queue lives in memory. Reviews still queued when the process exits are
+written by an ``atexit`` hook, but a crash loses them, and their submissions
+report ``failed`` once ``REVIEW_WRITE_BEHIND_TIMEOUT`` has passed.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from products.models import Product
+from .models import Review
+from .signals import apply_rating_changes
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION_SALT = 'reviews.submission'
+
+
+class ReviewQueueFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many reviews at the moment, please try again shortly.')
+    default_code = 'review_queue_full'
+    # Sent as Retry-After by DRF's exception handler
+    wait = 1
+
+
+def make_submission_id(entry):
+    return signing.dumps(
+        {'p': entry['product_id'], 'u': entry['user_id'], 't': entry['submitted_at']},
+        salt=SUBMISSION_SALT,
+    )
+
+
+def read_submission_id(submission_id):
+    """``(product_id, user_id, submitted_at)``, or ``None`` if tampered with"""
+    try:
+        data = signing.loads(submission_id, salt=SUBMISSION_SALT)
+        return data['p'], data['u'], data['t']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def _insert(entries):
+    """Insert the entries that can still be written; returns how many were"""
+    pairs = {(entry['product_id'], entry['user_id']) for entry in entries}
+    product_ids = {product_id for product_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+    taken = set(
+        Review.objects.filter(product_id__in=product_ids, user_id__in=user_ids)
+        .values_list('product_id', 'user_id')
+    )
+    live = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+
+    reviews, changes = [], {}
+    for entry in entries:
+        pair = (entry['product_id'], entry['user_id'])
+        if pair in taken or pair[0] not in live:
+            continue
+        # The first of two queued reviews of the same product wins
+        taken.add(pair)
+        reviews.append(Review(
+            product_id=pair[0], user_id=pair[1], rating=entry['rating'],
+            title=entry['title'], comment=entry['comment'],
+        ))
+        changes.setdefault(pair[0], []).append((entry['rating'], 1))
+
+    # bulk_create sends no post_save, so the aggregates are applied here
+    Review.objects.bulk_create(reviews)
+    for product_id, product_changes in changes.items():
+        apply_rating_changes(product_id, product_changes)
+    return len(reviews)
+
+
+def write_reviews(entries, attempts=3):
+    """Commit queued review ``entries`` in one transaction.
+
+    Entries whose author has reviewed the product meanwhile, or whose product
+    is gone, are skipped. A row committed by another worker between the check
+    and the INSERT fails the batch, which is retried; if it keeps failing,
+    entries are written one at a time. Returns how many reviews were written.
+    """
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                return _insert(entries)
+        except IntegrityError:
+            continue
+    written = 0
+    for entry in entries:
+        try:
+            with transaction.atomic():
+                written += _insert([entry])
+        except IntegrityError:
+            logger.exception('Dropped queued review of product %s by user %s', entry['product_id'], entry['user_id'])
+    return written
+
+
+def dead_letter(entries, path=None):
+    """Append ``entries`` that couldn't be written to the dead-letter file"""
+    with open(path or settings.REVIEW_DEAD_LETTER_PATH, 'a', encoding='utf-8') as file:
+        for entry in entries:
+            file.write(json.dumps(entry) + '\n')
+
+
+def replay_dead_letters(path=None):
+    """Write the reviews in the dead-letter file; returns ``(read, written)``.
+
+    The file is moved aside first, so batches failing meanwhile start a new
+    one. If writing fails, the moved file is kept and read again next time.
+    """
+    path = str(path or settings.REVIEW_DEAD_LETTER_PATH)
+    replaying = path + '.replaying'
+    if not os.path.exists(replaying):
+        if not os.path.exists(path):
+            return 0, 0
+        os.replace(path, replaying)
+    with open(replaying, encoding='utf-8') as file:
+        entries = [json.loads(line) for line in file if line.strip()]
+    written = write_reviews(entries)
+    os.remove(replaying)
+    return len(entries), written
+
+
+class ReviewWriter:
+    def __init__(self, batch_size=None, interval=None, queue_size=None, autostart=True, retry_delay=1.0):
+        self.batch_size = batch_size or settings.REVIEW_BATCH_SIZE
+        self.interval = interval if interval is not None else settings.REVIEW_BATCH_INTERVAL
+        # Seconds before the first retry of a failed batch, doubled after each
+        self.retry_delay = retry_delay
+        self.autostart = autostart
+        self._queue = queue.Queue(queue_size if queue_size is not None else settings.REVIEW_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        # (product_id, user_id) pairs queued and not yet written
+        self._pending = set()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # Started on first use, and again in forked children, which don't
+        # inherit the parent's threads
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='review-writer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def is_pending(self, product_id, user_id):
+        return (product_id, user_id) in self._pending
+
+    def submit(self, entry):
+        """Queue ``entry`` for writing.
+
+        Returns ``False`` if this worker already holds a review of the product
+        by the same user, and raises ``ReviewQueueFull`` when the queue is.
+        """
+        pair = (entry['product_id'], entry['user_id'])
+        with self._lock:
+            if pair in self._pending:
+                return False
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                raise ReviewQueueFull()
+            self._pending.add(pair)
+        if self.autostart:
+            self._ensure_thread()
+        return True
+
+    def _take_batch(self, timeout):
+        """Up to ``batch_size`` entries, waiting ``timeout`` for the first"""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            for attempt in range(settings.REVIEW_WRITE_RETRIES + 1):
+                try:
+                    write_reviews(batch)
+                    return
+                except Exception:
+                    logger.exception('Failed to write %d queued reviews (attempt %d)', len(batch), attempt + 1)
+                if attempt < settings.REVIEW_WRITE_RETRIES:
+                    time.sleep(self.retry_delay * 2 ** attempt)
+            try:
+                dead_letter(batch)
+            except OSError:
+                logger.exception('Lost %d queued reviews: %r', len(batch), batch)
+            else:
+                logger.error('Wrote %d queued reviews to %s', len(batch), settings.REVIEW_DEAD_LETTER_PATH)
+        finally:
+            with self._lock:
+                self._pending.difference_update((entry['product_id'], entry['user_id']) for entry in batch)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(timeout=None)
+            close_old_connections()
+            self._write(batch)
+
+    def flush(self):
+        """Write everything queued so far in the calling thread"""
+        while True:
+            try:
+                batch = [self._queue.get_nowait()]
+            except queue.Empty:
+                return
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+
+review_writer = ReviewWriter()
+atexit.register(review_writer.flush)
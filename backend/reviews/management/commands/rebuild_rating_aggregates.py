@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from products.models import Product
+from reviews.models import Review
+
+
+def review_aggregate(aggregate, **filters):
+    """Correlated subquery computing ``aggregate`` over a product's reviews"""
+    reviews = (
+        Review.objects.filter(product=OuterRef('pk'), **filters)
+        .order_by().values('product').annotate(value=aggregate).values('value')
+    )
+    return Coalesce(Subquery(reviews), Value(0), output_field=IntegerField())
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized rating aggregates on every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products written per UPDATE statement'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # Each product's aggregates are computed by the database from the
+        # (product, created_at) review index; nothing round-trips through Python.
+        aggregates = {
+            'rating_count': review_aggregate(Count('id')),
+            'rating_sum': review_aggregate(Sum('rating')),
+        }
+        for star in range(1, 6):
+            aggregates[f'rating_{star}_count'] = review_aggregate(Count('id'), rating=star)
+
+        self.stdout.write('Updating products...')
+        updated = 0
+        pks = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        with transaction.atomic():
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                updated += Product.objects.filter(
+                    pk__gte=batch[0], pk__lte=batch[-1]
+                ).update(**aggregates)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products'))
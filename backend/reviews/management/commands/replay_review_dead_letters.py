@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from reviews.ingest import replay_dead_letters
+
+
+class Command(BaseCommand):
+    help = 'Writes the queued reviews that the write-behind writer could not commit'
+
+    def handle(self, *args, **options):
+        read, written = replay_dead_letters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {read} dead-lettered reviews, wrote {written}'
+        ))
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
 from products.models import Product
@@ -18,6 +18,16 @@ class Review(models.Model):
     class Meta:
         unique_together = ['product', 'user']
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the row write and the product rating aggregates in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating} stars"
@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from ecomdigital.serializers import ModelSerializer
 from .models import Review
 from products.serializers import ProductSerializer
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ModelSerializer):
     user = serializers.SerializerMethodField()
     product_name = serializers.CharField(source='product.name', read_only=True)
 
@@ -24,7 +25,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         }
 
 
-class ReviewCreateSerializer(serializers.ModelSerializer):
+class ReviewCreateSerializer(ModelSerializer):
     class Meta:
         model = Review
         fields = ['product', 'rating', 'title', 'comment']
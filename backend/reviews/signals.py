@@ -0,0 +1,61 @@
+from collections import Counter
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from products.cache import bump_catalog_version
+from products.models import Product
+from .models import Review
+
+
+def apply_rating_changes(product_id, changes):
+    """Apply ``(rating, delta)`` pairs to a product's aggregates in one UPDATE"""
+    if product_id is None:
+        return
+    totals = Counter()
+    for rating, delta in changes:
+        totals['rating_count'] += delta
+        totals['rating_sum'] += delta * rating
+        totals[f'rating_{rating}_count'] += delta
+    updates = {field: F(field) + n for field, n in totals.items() if n}
+    if not updates:
+        return
+    Product.objects.filter(pk=product_id).update(**updates)
+    # Product responses embed the aggregates
+    bump_catalog_version()
+
+
+def apply_rating_delta(product_id, rating, delta):
+    """Add ``delta`` reviews of ``rating`` stars to a product's aggregates"""
+    apply_rating_changes(product_id, [(rating, delta)])
+
+
+@receiver(post_init, sender=Review)
+def remember_rating(sender, instance, **kwargs):
+    # Snapshot the persisted (product, rating) pair so updates can be applied
+    # as a delta without re-reading the old row.
+    instance._rating_snapshot = (
+        (instance.product_id, instance.rating) if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    current = (instance.product_id, instance.rating)
+    previous = None if created else instance._rating_snapshot
+    if previous is not None and previous[0] == current[0]:
+        if previous[1] != current[1]:
+            apply_rating_changes(current[0], [(previous[1], -1), (current[1], 1)])
+    else:
+        if previous is not None:
+            apply_rating_delta(*previous, -1)
+        apply_rating_delta(*current, 1)
+    instance._rating_snapshot = current
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    snapshot = instance._rating_snapshot or (instance.product_id, instance.rating)
+    apply_rating_delta(*snapshot, -1)
+    instance._rating_snapshot = None
@@ -1,10 +1,23 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError
+from django.urls import resolve, reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import RefreshToken
 from products.models import Category, Product
+from ecomdigital.testing import AsyncViewsMixin, QueryBudgetMixin, QueryPlanAssertionsMixin, viewset_queryset
+from .ingest import ReviewWriter, write_reviews
+from . import ingest
 from .models import Review
+from .views import ReviewViewSet
 
 
 class ReviewModelTest(TestCase):
@@ -204,3 +217,429 @@ class ReviewAPITest(TestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+
+
+class AsyncReviewViewsTest(AsyncViewsMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        self.product = Product.objects.create(
+            name="Spotify Premium", slug="spotify-premium", description="Premium music streaming",
+            price=9.99, category=category, stock=100
+        )
+        self.other = Product.objects.create(
+            name="Netflix", slug="netflix", description="Video streaming", price=15.49, category=category
+        )
+        Review.objects.create(product=self.other, user=self.user, rating=4, title="Good", comment="Good")
+
+    async def test_product_reviews(self):
+        url = reverse('review-product-reviews')
+        self.assertTrue(iscoroutinefunction(resolve(url).func))
+        response = await self.async_client.get(url, {'product_id': self.other.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['reviews']), 1)
+        self.assertEqual(response.json()['total_reviews'], 1)
+        response = await self.async_client.get(url, {'product_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_sync_routes_work_under_async_client(self):
+        # Writes stay synchronous on the same viewset
+        self.assertFalse(iscoroutinefunction(resolve(reverse('review-list')).func))
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        response = await self.async_client.post(
+            reverse('review-list'),
+            {'product': self.product.id, 'rating': 5, 'title': 'Great', 'comment': 'Great'},
+            content_type='application/json', headers={'Authorization': f'Bearer {token}'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(await Review.objects.filter(user=self.user).acount(), 2)
+
+
+class RatingAggregateTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', password='pass123')
+        self.category = Category.objects.create(
+            name="Streaming Services",
+            slug="streaming-services"
+        )
+        self.product = Product.objects.create(
+            name="Spotify Premium",
+            slug="spotify-premium",
+            description="Premium music streaming",
+            price=9.99,
+            category=self.category,
+            stock=100
+        )
+        self.other_product = Product.objects.create(
+            name="Netflix Premium",
+            slug="netflix-premium",
+            description="Video streaming",
+            price=15.99,
+            category=self.category,
+            stock=100
+        )
+
+    def test_create_updates_aggregates(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5, title="A", comment="A")
+        Review.objects.create(product=self.product, user=self.user2, rating=2, title="B", comment="B")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_sum, 7)
+        self.assertEqual(self.product.average_rating, 3.5)
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+    def test_update_moves_rating_and_product(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=5, title="A", comment="A")
+        review.rating = 3
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_sum, 3)
+        self.assertEqual(self.product.rating_histogram[5], 0)
+        self.assertEqual(self.product.rating_histogram[3], 1)
+
+        review = Review.objects.get(pk=review.pk)
+        review.product = self.other_product
+        review.save()
+        self.product.refresh_from_db()
+        self.other_product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.rating_sum, 0)
+        self.assertEqual(self.other_product.rating_count, 1)
+        self.assertEqual(self.other_product.rating_3_count, 1)
+
+    def test_delete_and_cascade_update_aggregates(self):
+        review = Review.objects.create(product=self.product, user=self.user, rating=4, title="A", comment="A")
+        Review.objects.create(product=self.product, user=self.user2, rating=1, title="B", comment="B")
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_sum, 1)
+
+        self.user2.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.rating_histogram[1], 0)
+
+    def test_rebuild_command(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5, title="A", comment="A")
+        Review.objects.create(product=self.product, user=self.user2, rating=4, title="B", comment="B")
+        Product.objects.update(rating_count=0, rating_sum=0, rating_4_count=0, rating_5_count=7)
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.other_product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_sum, 9)
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+        self.assertEqual(self.other_product.rating_5_count, 0)
+
+    def test_product_reviews_uses_aggregates(self):
+        Review.objects.create(product=self.product, user=self.user, rating=5, title="A", comment="A")
+        url = reverse('review-product-reviews')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'product_id': self.product.id})
+        self.assertEqual(response.data['total_reviews'], 1)
+        self.assertEqual(response.data['rating_histogram'][5], 1)
+
+    def test_product_serializer_exposes_aggregates(self):
+        Review.objects.create(product=self.product, user=self.user, rating=4, title="A", comment="A")
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.data['average_rating'], 4.0)
+        self.assertEqual(response.data['rating_count'], 1)
+        self.assertEqual(response.data['rating_histogram']['4'], 1)
+
+
+class ReviewCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        products = [
+            Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="Streaming",
+                price=9.99, category=category
+            )
+            for i in range(15)
+        ]
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        for product in products:
+            Review.objects.create(product=product, user=user, rating=5, title="Great", comment="Great")
+
+    def test_cursor_links_paginate_reviews(self):
+        url = reverse('review-list')
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+
+
+class ReviewQueryPlanTest(QueryPlanAssertionsMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def test_list_uses_index(self):
+        self.assertIndexedPlan(viewset_queryset(ReviewViewSet)[:12])
+        self.assertIndexedPlan(viewset_queryset(ReviewViewSet).order_by('-created_at', '-id')[:12])
+
+    def test_product_reviews_uses_index(self):
+        self.assertIndexedPlan(viewset_queryset(ReviewViewSet).filter(product_id=1))
+
+    def test_my_reviews_uses_index(self):
+        self.assertIndexedPlan(viewset_queryset(ReviewViewSet).filter(user=self.user))
+
+
+class ReviewQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="Streaming",
+                price=9.99, category=category
+            )
+            for i in range(4)
+        ]
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='testpass123')
+            for i in range(3)
+        ]
+        for user in self.users:
+            for product in self.products[1:]:
+                Review.objects.create(product=product, user=user, rating=4, title="Good", comment="Good")
+        self.user = self.users[0]
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_read_endpoints_within_budget(self):
+        review = Review.objects.filter(user=self.user).first()
+        with self.assertQueryBudget('GET review-list'):
+            self.client.get(reverse('review-list'))
+        with self.assertQueryBudget('GET review-detail'):
+            self.client.get(reverse('review-detail', kwargs={'pk': review.pk}))
+        with self.assertQueryBudget('GET review-product-reviews'):
+            self.client.get(reverse('review-product-reviews'), {'product_id': self.products[1].id})
+        with self.assertQueryBudget('GET review-my-reviews'):
+            self.client.get(reverse('review-my-reviews'))
+
+    def test_write_endpoints_within_budget(self):
+        data = {'product': self.products[0].id, 'rating': 5, 'title': 'Great', 'comment': 'Great'}
+        with self.assertQueryBudget('POST review-list'):
+            response = self.client.post(reverse('review-list'), data, format='json')
+        url = reverse('review-detail', kwargs={'pk': response.data['id']})
+        with self.assertQueryBudget('PUT review-detail'):
+            self.client.put(url, dict(data, rating=2), format='json')
+        with self.assertQueryBudget('DELETE review-detail'):
+            self.client.delete(url)
+
+
+@override_settings(REVIEW_WRITE_BEHIND=True)
+class WriteBehindReviewTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        category = Category.objects.create(name="Streaming Services", slug="streaming-services")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="Streaming",
+                price=9.99, category=category
+            )
+            for i in range(2)
+        ]
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='testpass123')
+            for i in range(3)
+        ]
+        self.user = self.users[0]
+        self.client.force_authenticate(user=self.user)
+        # Written on flush() in the test's thread and transaction
+        self.writer = ReviewWriter(autostart=False)
+        patcher = mock.patch('reviews.views.review_writer', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, product, rating=5):
+        data = {'product': product.id, 'rating': rating, 'title': 'Great', 'comment': 'Great'}
+        return self.client.post(reverse('review-list'), data, format='json')
+
+    def entry(self, product, user, rating=5):
+        return {
+            'product_id': product.id, 'user_id': user.id, 'rating': rating,
+            'title': 'Great', 'comment': 'Great', 'submitted_at': 0,
+        }
+
+    def test_create_is_queued_then_written(self):
+        response = self.post(self.products[0], rating=4)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response['Location'], response.data['url'])
+        self.assertFalse(Review.objects.exists())
+
+        poll = self.client.get(response.data['url'])
+        self.assertEqual(poll.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(poll.data['status'], 'pending')
+
+        self.writer.flush()
+        poll = self.client.get(response.data['url'])
+        self.assertEqual(poll.status_code, status.HTTP_200_OK)
+        self.assertEqual(poll.data['status'], 'created')
+        self.assertEqual(poll.data['review']['rating'], 4)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].rating_count, 1)
+        self.assertEqual(self.products[0].rating_sum, 4)
+
+    def test_duplicate_review_rejected_while_queued_and_after(self):
+        self.assertEqual(self.post(self.products[0]).status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.post(self.products[0]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.writer.flush()
+        self.assertEqual(self.post(self.products[0]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_invalid_review_is_not_queued(self):
+        response = self.post(self.products[0], rating=6)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.writer.flush()
+        self.assertFalse(Review.objects.exists())
+
+    def test_full_queue_answers_503(self):
+        self.writer = ReviewWriter(queue_size=1, autostart=False)
+        with mock.patch('reviews.views.review_writer', self.writer):
+            self.assertEqual(self.post(self.products[0]).status_code, status.HTTP_202_ACCEPTED)
+            response = self.post(self.products[1])
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_batch_is_one_insert_and_one_update_per_product(self):
+        entries = [
+            self.entry(product, user, rating=i % 5 + 1)
+            for i, (product, user) in enumerate(
+                (product, user) for product in self.products for user in self.users
+            )
+        ]
+        # Existing pairs, live products, INSERT, one UPDATE per product
+        with self.assertNumQueries(3 + len(self.products) + 2):
+            self.assertEqual(write_reviews(entries), 6)
+        for product in self.products:
+            product.refresh_from_db()
+            ratings = list(product.reviews.values_list('rating', flat=True))
+            self.assertEqual(product.rating_count, 3)
+            self.assertEqual(product.rating_sum, sum(ratings))
+
+    def test_batch_skips_conflicts_and_deleted_products(self):
+        Review.objects.create(product=self.products[0], user=self.users[1], rating=1, title="A", comment="A")
+        entries = [
+            self.entry(self.products[0], self.users[0], rating=5),
+            # Reviewed meanwhile through another worker
+            self.entry(self.products[0], self.users[1], rating=5),
+            # Queued twice; the first one wins
+            self.entry(self.products[0], self.users[2], rating=3),
+            self.entry(self.products[0], self.users[2], rating=4),
+            self.entry(self.products[1], self.users[0], rating=5),
+        ]
+        self.products[1].delete()
+        self.assertEqual(write_reviews(entries), 2)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].rating_count, 3)
+        self.assertEqual(self.products[0].rating_sum, 9)
+
+    def test_batch_retries_after_a_race(self):
+        entries = [self.entry(product, self.user) for product in self.products]
+        insert = Review.objects.bulk_create
+        # Another worker commits a conflicting row between the check and the INSERT
+        race = [IntegrityError('UNIQUE constraint failed')]
+
+        def racing_insert(reviews, **kwargs):
+            if race:
+                raise race.pop()
+            return insert(reviews, **kwargs)
+
+        with mock.patch.object(Review.objects, 'bulk_create', side_effect=racing_insert) as bulk_create:
+            self.assertEqual(write_reviews(entries), 2)
+        self.assertEqual(bulk_create.call_count, 2)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].rating_count, 1)
+
+    def test_batch_falls_back_to_single_rows(self):
+        entries = [self.entry(product, self.user) for product in self.products]
+        insert = Review.objects.bulk_create
+
+        def failing_insert(reviews, **kwargs):
+            if reviews and reviews[0].product_id == self.products[0].id:
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return insert(reviews, **kwargs)
+
+        with mock.patch.object(Review.objects, 'bulk_create', side_effect=failing_insert), \
+                self.assertLogs('reviews.ingest', 'ERROR'):
+            self.assertEqual(write_reviews(entries), 1)
+        self.assertEqual(list(Review.objects.values_list('product_id', flat=True)), [self.products[1].id])
+
+    def dead_letter_path(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        return os.path.join(directory, 'dead-letters.jsonl')
+
+    @override_settings(REVIEW_WRITE_RETRIES=2)
+    def test_failed_batch_is_retried(self):
+        self.writer.retry_delay = 0
+        self.post(self.products[0])
+        failures = [OperationalError('database is locked')] * 2
+        write = ingest.write_reviews
+
+        def flaky_write(entries):
+            if failures:
+                raise failures.pop()
+            return write(entries)
+
+        with mock.patch('reviews.ingest.write_reviews', side_effect=flaky_write), \
+                self.assertLogs('reviews.ingest', 'ERROR'):
+            self.writer.flush()
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_failing_batch_is_dead_lettered_then_replayed(self):
+        path = self.dead_letter_path()
+        self.writer.retry_delay = 0
+        url = self.post(self.products[0], rating=3).data['url']
+        with override_settings(REVIEW_WRITE_RETRIES=1, REVIEW_DEAD_LETTER_PATH=path), \
+                mock.patch('reviews.ingest.write_reviews', side_effect=OperationalError('disk I/O error')), \
+                self.assertLogs('reviews.ingest', 'ERROR') as logs:
+            self.writer.flush()
+        self.assertEqual(len(logs.records), 3)
+        self.assertFalse(Review.objects.exists())
+        self.assertTrue(os.path.exists(path))
+
+        out = StringIO()
+        with override_settings(REVIEW_DEAD_LETTER_PATH=path):
+            call_command('replay_review_dead_letters', stdout=out)
+            self.assertIn('Replayed 1 dead-lettered reviews, wrote 1', out.getvalue())
+            call_command('replay_review_dead_letters', stdout=out)
+        self.assertIn('Replayed 0', out.getvalue())
+        self.assertEqual(self.client.get(url).data['review']['rating'], 3)
+
+    def test_submission_ids_are_private_and_signed(self):
+        url = self.post(self.products[0]).data['url']
+        self.client.force_authenticate(user=self.users[1])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        bad = reverse('review-submission', args=['not-a-submission'])
+        self.assertEqual(self.client.get(bad).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_lost_submission_reports_failed(self):
+        url = self.post(self.products[0]).data['url']
+        self.products[0].delete()
+        self.writer.flush()
+        with override_settings(REVIEW_WRITE_BEHIND_TIMEOUT=0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'failed')
+
+    def test_endpoints_within_budget(self):
+        with self.assertQueryBudget('POST review-list'):
+            url = self.post(self.products[0]).data['url']
+        self.writer.flush()
+        with self.assertQueryBudget('GET review-submission'):
+            self.client.get(url)
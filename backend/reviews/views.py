@@ -1,15 +1,26 @@
+import time
+
+from django.conf import settings
+from django.db import IntegrityError
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
+from ecomdigital.async_views import AsyncViewSetMixin
+from ecomdigital.throttling import ReviewThrottle, ThrottleFirstMixin
+from .ingest import make_submission_id, read_submission_id, review_writer
 from .models import Review
 from .serializers import ReviewSerializer, ReviewCreateSerializer
 from products.models import Product
 
+ALREADY_REVIEWED = 'You have already reviewed this product. You can update your existing review instead.'
+
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ThrottleFirstMixin, AsyncViewSetMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all().select_related('user', 'product')
     permission_classes = [IsAuthenticatedOrReadOnly]
+    throttle_classes = [ReviewThrottle]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -27,27 +38,70 @@ class ReviewViewSet(viewsets.ModelViewSet):
                 user=request.user
             ).first()
             if existing_review:
-                return Response(
-                    {'error': 'You have already reviewed this product. You can update your existing review instead.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+                return self.already_reviewed()
         
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        if settings.REVIEW_WRITE_BEHIND:
+            return self.enqueue(request, serializer.validated_data)
         try:
             review = serializer.save(user=request.user)
-        except Exception as e:
-            if 'UNIQUE constraint' in str(e) or 'unique' in str(e).lower():
-                return Response(
-                    {'error': 'You have already reviewed this product. You can update your existing review instead.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            raise
+        except IntegrityError:
+            # Lost a race with another request for the same product
+            return self.already_reviewed()
         
         # Return full review with ReviewSerializer
         output_serializer = ReviewSerializer(review, context={'request': request})
         return Response(output_serializer.data, status=status.HTTP_201_CREATED)
 
+    def already_reviewed(self):
+        return Response({'error': ALREADY_REVIEWED}, status=status.HTTP_400_BAD_REQUEST)
+
+    def enqueue(self, request, validated_data):
+        """Queue the review for the batch writer (see reviews/ingest.py)"""
+        entry = {
+            'product_id': validated_data['product'].pk,
+            'user_id': request.user.pk,
+            'rating': validated_data['rating'],
+            'title': validated_data['title'],
+            'comment': validated_data['comment'],
+            'submitted_at': time.time(),
+        }
+        if not review_writer.submit(entry):
+            return self.already_reviewed()
+        submission_id = make_submission_id(entry)
+        url = reverse('review-submission', args=[submission_id], request=request)
+        return Response(
+            {'id': submission_id, 'status': 'pending', 'url': url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': url},
+        )
+
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+        url_path=r'submissions/(?P<submission_id>[^/.]+)',
+    )
+    def submission(self, request, submission_id=None):
+        """Status of a review queued by a write-behind create"""
+        submission = read_submission_id(submission_id)
+        if submission is None or submission[1] != request.user.pk:
+            return Response({'error': 'Submission not found'}, status=status.HTTP_404_NOT_FOUND)
+        product_id, user_id, submitted_at = submission
+        review = self.queryset.filter(product_id=product_id, user_id=user_id).first()
+        if review is not None:
+            return Response({
+                'id': submission_id,
+                'status': 'created',
+                'review': ReviewSerializer(review, context={'request': request}).data,
+            })
+        if (
+            review_writer.is_pending(product_id, user_id)
+            or time.time() - submitted_at < settings.REVIEW_WRITE_BEHIND_TIMEOUT
+        ):
+            return Response({'id': submission_id, 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+        # Dropped by the writer (the product was deleted) or lost in a crash
+        return Response({'id': submission_id, 'status': 'failed'})
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
@@ -61,34 +115,48 @@ class ReviewViewSet(viewsets.ModelViewSet):
         """Get reviews for a specific product"""
         product_id = request.query_params.get('product_id')
         if not product_id:
-            return Response(
-                {'error': 'product_id parameter is required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return self.product_id_required()
         
         try:
             product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return Response(
-                {'error': 'Product not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        except (Product.DoesNotExist, ValueError):
+            return self.product_not_found()
         
         reviews = self.queryset.filter(product=product)
+        return self.product_reviews_response(product, reviews)
+
+    async def aproduct_reviews(self, request):
+        product_id = request.query_params.get('product_id')
+        if not product_id:
+            return self.product_id_required()
+        try:
+            product = await Product.objects.aget(id=product_id)
+        except (Product.DoesNotExist, ValueError):
+            return self.product_not_found()
+        reviews = [review async for review in self.queryset.filter(product=product)]
+        return self.product_reviews_response(product, reviews)
+
+    def product_id_required(self):
+        return Response(
+            {'error': 'product_id parameter is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def product_not_found(self):
+        return Response(
+            {'error': 'Product not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    def product_reviews_response(self, product, reviews):
         serializer = self.get_serializer(reviews, many=True)
         
-        # Calculate average rating
-        if reviews.exists():
-            avg_rating = sum(r.rating for r in reviews) / reviews.count()
-            total_reviews = reviews.count()
-        else:
-            avg_rating = 0
-            total_reviews = 0
-        
+        # Aggregates are denormalized onto the product row
         return Response({
             'reviews': serializer.data,
-            'average_rating': round(avg_rating, 2),
-            'total_reviews': total_reviews
+            'average_rating': product.average_rating,
+            'total_reviews': product.rating_count,
+            'rating_histogram': product.rating_histogram,
         })
 
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
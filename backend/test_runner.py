@@ -18,6 +18,7 @@ if __name__ == "__main__":
         'orders.tests',
         'authentication.tests',
         'reviews.tests',
+        'ecomdigital.tests',
     ])
     
     if failures:
@@ -28,8 +28,7 @@ export default function CartPage() {
         customer_name: customerName,
         customer_email: customerEmail,
         items: cartItems.map(item => ({
-          product_name: item.product_name,
-          product_price: item.product_price,
+          product: item.product,
           quantity: item.quantity,
         })),
       }
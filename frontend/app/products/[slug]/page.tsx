@@ -44,6 +44,7 @@ export default function ProductDetailPage() {
   const handleAddToCart = () => {
     if (product) {
       addToCart({
+        product: product.id,
         product_name: product.name,
         product_price: product.price,
         quantity: 1,
@@ -13,10 +13,13 @@ interface ProductCardProps {
 
 export default function ProductCard({ product }: ProductCardProps) {
   const { addToCart } = useContext(CartContext)
+  // The card-sized copy is a few KB; fall back to the original until it's built
+  const imageSrc = product.image_variants?.card?.webp ?? product.image_url
 
   const handleAddToCart = (e: React.MouseEvent) => {
     e.preventDefault()
     addToCart({
+      product: product.id,
       product_name: product.name,
       product_price: product.price.toString(),
       quantity: 1,
@@ -27,9 +30,9 @@ export default function ProductCard({ product }: ProductCardProps) {
     <div className="bg-white rounded-lg shadow-md overflow-hidden hover:shadow-xl transition-shadow duration-300">
       <Link href={`/products/${product.slug}`}>
         <div className="relative h-48 bg-gradient-to-br from-primary-100 to-primary-200">
-          {product.image_url ? (
+          {imageSrc ? (
             <Image
-              src={product.image_url}
+              src={imageSrc}
               alt={product.name}
               fill
               className="object-cover"
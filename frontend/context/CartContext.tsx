@@ -3,6 +3,7 @@
 import { createContext, useState, useEffect, ReactNode } from 'react'
 
 export interface CartItem {
+  product: number
   product_name: string
   product_price: string
   quantity: number
@@ -41,7 +42,7 @@ export function CartProvider({ children }: { children: ReactNode }) {
   const addToCart = (item: CartItem) => {
     setCartItems((prev) => {
       const existingIndex = prev.findIndex(
-        (i) => i.product_name === item.product_name
+        (i) => i.product === item.product
       )
       if (existingIndex >= 0) {
         const updated = [...prev]
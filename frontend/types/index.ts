@@ -5,6 +5,13 @@ export interface Category {
   description?: string
 }
 
+export interface ImageVariant {
+  width: number
+  height: number
+  webp: string
+  jpeg: string
+}
+
 export interface Product {
   id: number
   name: string
@@ -13,15 +20,20 @@ export interface Product {
   price: string
   image?: string
   image_url?: string | null
+  image_variants?: Record<string, ImageVariant>
   category?: Category
   stock: number
   is_active: boolean
+  average_rating?: number
+  rating_count?: number
+  rating_histogram?: Record<string, number>
   created_at: string
   updated_at: string
 }
 
 export interface OrderItem {
   id: number
+  product: number | null
   product_name: string
   product_price: string
   quantity: number
@@ -96,5 +108,6 @@ export interface ProductReviewsResponse {
   reviews: Review[]
   average_rating: number
   total_reviews: number
+  rating_histogram?: Record<string, number>
 }
 
@@ -0,0 +1,340 @@
+"""
+Load-testing harness for the backend API.
+
+Replays the flows covered by backend_api_tests.py (register, login, browse
+products, post a review, create an order) as concurrent virtual users and
+reports latency percentiles and throughput per endpoint.
+
+Examples:
+    # Against a server that is already running
+    python load_harness.py --users 20 --duration 60 --output run.json
+
+    # Start a local server (optionally seeding it first) and compare with a
+    # previous run, failing if any endpoint's p95 regressed by more than 20%
+    python load_harness.py --start-server --seed --compare baseline.json
+
+    # Drive a different server command, e.g. gunicorn with 4 workers
+    python load_harness.py --start-server \\
+        --server-cmd "gunicorn ecomdigital.wsgi -w 4 -b 127.0.0.1:{port}"
+"""
+import argparse
+import json
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+from backend_api_tests import BASE_URL
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+PASSWORD = 'LoadTest!pass123'
+
+# Every virtual user comes from one address and signs up, logs in, reviews and
+# orders far faster than a person, so the started server gets rates that don't
+# turn the load into 429s. --server-env overrides them.
+LOAD_THROTTLE_RATES = {
+    f'THROTTLE_{scope}_RATE': '100000/min' for scope in ('LOGIN', 'REGISTER', 'SEARCH', 'ORDER', 'REVIEW')
+}
+
+
+class Recorder:
+    """Thread-safe collection of per-endpoint latency samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label, elapsed, ok):
+        with self._lock:
+            self.samples[label].append(elapsed)
+            if not ok:
+                self.errors[label] += 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples, errors, duration):
+    values = sorted(samples)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'rps': round(len(values) / duration, 2) if duration else 0.0,
+        'mean_ms': round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+class VirtualUser:
+    """One simulated shopper with its own session and account"""
+
+    def __init__(self, base_url, recorder, product_ids, rng):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.product_ids = product_ids
+        self.rng = rng
+        self.session = requests.Session()
+        self.username = f'load_{uuid.uuid4().hex[:12]}'
+        self.reviewed = set()
+
+    def request(self, method, label, path, expected=(200,), **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', timeout=30, **kwargs)
+            ok = response.status_code in expected
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(label, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    def pick_product(self):
+        # Skew towards the first products so caches see a realistic hot set
+        index = min(int(self.rng.paretovariate(1.2)) - 1, len(self.product_ids) - 1)
+        return self.product_ids[index]
+
+    def register_and_login(self):
+        self.request('POST', 'POST /auth/register/', '/auth/register/', expected=(201,), json={
+            'username': self.username,
+            'email': f'{self.username}@example.com',
+            'password': PASSWORD,
+            'password2': PASSWORD,
+            'first_name': 'Load',
+            'last_name': 'Test',
+        })
+        response = self.request('POST', 'POST /auth/login/', '/auth/login/', json={
+            'username': self.username,
+            'password': PASSWORD,
+        })
+        if response is not None:
+            self.session.headers['Authorization'] = f'Bearer {response.json()["access"]}'
+
+    def browse(self):
+        page = self.rng.choice([1, 1, 1, 2, 3])
+        self.request('GET', 'GET /products/', '/products/', params={'page': page}, expected=(200, 404))
+        self.request('GET', 'GET /products/featured/', '/products/featured/')
+        if self.rng.random() < 0.3:
+            term = self.rng.choice(['premium', 'stream', 'pro', 'ai', 'music'])
+            self.request('GET', 'GET /products/?search=', '/products/', params={'search': term})
+        product_id = self.pick_product()
+        self.request('GET', 'GET /products/{id}/', f'/products/{product_id}/')
+        self.request(
+            'GET', 'GET /reviews/product_reviews/', '/reviews/product_reviews/',
+            params={'product_id': product_id}
+        )
+        return product_id
+
+    def post_review(self, product_id):
+        if product_id in self.reviewed:
+            return
+        self.reviewed.add(product_id)
+        # 202 when the server queues reviews (REVIEW_WRITE_BEHIND)
+        self.request('POST', 'POST /reviews/', '/reviews/', expected=(201, 202), json={
+            'product': product_id,
+            'rating': self.rng.randint(1, 5),
+            'title': 'Load test review',
+            'comment': 'Submitted by the load-testing harness.',
+        })
+
+    def create_order(self):
+        product_ids = {self.pick_product() for _ in range(self.rng.randint(1, 4))}
+        # 400 means a product sold out, which is a normal outcome under load
+        self.request('POST', 'POST /orders/', '/orders/', expected=(201, 400), json={
+            'customer_name': 'Load Test',
+            'customer_email': f'{self.username}@example.com',
+            'items': [
+                {'product': product_id, 'quantity': 1}
+                for product_id in sorted(product_ids)
+            ],
+        })
+
+    def run(self, deadline, iterations, review_ratio, order_ratio):
+        self.register_and_login()
+        done = 0
+        while time.monotonic() < deadline and (iterations is None or done < iterations):
+            product_id = self.browse()
+            if self.rng.random() < review_ratio:
+                self.post_review(product_id)
+            if self.rng.random() < order_ratio:
+                self.create_order()
+            done += 1
+
+
+def fetch_product_ids(base_url, pages=5):
+    ids = []
+    for page in range(1, pages + 1):
+        response = requests.get(f'{base_url}/products/', params={'page': page}, timeout=30)
+        if response.status_code != 200:
+            break
+        ids.extend(product['id'] for product in response.json()['results'])
+    if not ids:
+        sys.exit('No products found; seed the database first (--seed)')
+    return ids
+
+
+def wait_for_server(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/products/', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    sys.exit(f'Server at {base_url} did not become ready within {timeout}s')
+
+
+def start_server(command, port, env):
+    if command is None:
+        command = f'{shlex.quote(sys.executable)} manage.py runserver --noreload 127.0.0.1:{port}'
+    return subprocess.Popen(
+        shlex.split(command.format(port=port)),
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def seed(args):
+    command = [sys.executable, 'manage.py', 'seed_data', *shlex.split(args)]
+    subprocess.run(command, cwd=BACKEND_DIR, check=True)
+
+
+def run_load(args):
+    recorder = Recorder()
+    product_ids = fetch_product_ids(args.base_url)
+    deadline = time.monotonic() + args.duration
+    started = time.perf_counter()
+
+    def user_task(index):
+        # Stagger start-up over the ramp-up window
+        time.sleep(args.ramp_up * index / max(args.users, 1))
+        rng = random.Random(args.random_seed + index)
+        VirtualUser(args.base_url, recorder, product_ids, rng).run(
+            deadline, args.iterations, args.review_ratio, args.order_ratio
+        )
+
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user_task, range(args.users)))
+
+    elapsed = time.perf_counter() - started
+    endpoints = {
+        label: summarize(samples, recorder.errors[label], elapsed)
+        for label, samples in sorted(recorder.samples.items())
+    }
+    all_samples = [value for samples in recorder.samples.values() for value in samples]
+    return {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'base_url': args.base_url,
+            'users': args.users,
+            'duration_s': round(elapsed, 2),
+            'label': args.label,
+        },
+        'endpoints': endpoints,
+        'total': summarize(all_samples, sum(recorder.errors.values()), elapsed),
+    }
+
+
+def print_report(report):
+    headers = ['endpoint', 'count', 'err', 'rps', 'p50', 'p95', 'p99', 'max']
+    rows = [
+        [label, stats['count'], stats['errors'], stats['rps'],
+         stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']]
+        for label, stats in [*report['endpoints'].items(), ('TOTAL', report['total'])]
+    ]
+    widths = [max(len(str(row[i])) for row in [headers, *rows]) for i in range(len(headers))]
+    for row in [headers, *rows]:
+        print('  '.join(str(value).rjust(width) if i else str(value).ljust(width)
+                        for i, (value, width) in enumerate(zip(row, widths))))
+
+
+def compare(report, baseline, max_regression):
+    """Print p95 deltas against a baseline run; return False on regression"""
+    ok = True
+    print(f'\nComparison with baseline (p95, fail above +{max_regression:.0%}):')
+    for label, stats in report['endpoints'].items():
+        before = baseline['endpoints'].get(label)
+        if not before or not before['p95_ms']:
+            continue
+        change = stats['p95_ms'] / before['p95_ms'] - 1
+        regressed = change > max_regression
+        ok = ok and not regressed
+        marker = 'REGRESSION' if regressed else ''
+        print(f'  {label:<34} {before["p95_ms"]:>9.2f} -> {stats["p95_ms"]:>9.2f} ms  {change:+.1%} {marker}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--iterations', type=int, help='Stop each user after N iterations')
+    parser.add_argument('--ramp-up', type=float, default=2, help='Seconds to start all users')
+    parser.add_argument('--review-ratio', type=float, default=0.2)
+    parser.add_argument('--order-ratio', type=float, default=0.3)
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--label', default='', help='Free-form label stored in the output')
+    parser.add_argument('--output', help='Write machine-readable results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2)
+    parser.add_argument('--start-server', action='store_true', help='Launch a local server')
+    parser.add_argument('--server-cmd', help='Server command; "{port}" is substituted')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the started server')
+    parser.add_argument('--seed', action='store_true', help='Run seed_data before the test')
+    parser.add_argument('--seed-args', default='', help='Arguments passed to seed_data')
+    args = parser.parse_args()
+
+    server = None
+    if args.seed:
+        seed(args.seed_args)
+    if args.start_server:
+        env = {**LOAD_THROTTLE_RATES, **dict(item.split('=', 1) for item in args.server_env)}
+        server = start_server(args.server_cmd, args.port, env)
+        args.base_url = f'http://127.0.0.1:{args.port}/api'
+    try:
+        wait_for_server(args.base_url)
+        report = run_load(args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+        print(f'\nResults written to {args.output}')
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()